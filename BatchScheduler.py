@@ -0,0 +1,138 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Bytes per token when no file of the run has a token count yet
+DEFAULT_BYTES_PER_TOKEN = 4.0
+# Largest chunk of small files sent to a worker at once, in tokens
+DEFAULT_CHUNK_COST = 20_000
+# Chunks per worker at least, so the last ones can still even out the load
+CHUNKS_PER_WORKER = 4
+
+
+class CostCache:
+    """
+    Token counts of files from earlier runs, kept in a JSON file, to order
+    the next run's work by. A count is used while the file keeps the size
+    it had, otherwise its cost is estimated from its size. Without a path
+    the counts only live as long as the instance.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        # Averaged over the entries once, until update changes them
+        self._bytes_per_token = None
+        if path is not None:
+            try:
+                with open(path, encoding="utf-8") as cache:
+                    self.entries = json.load(cache)
+            except (OSError, ValueError):
+                # First run, or a cache from an incompatible version
+                pass
+
+    def cost(self, file_path):
+        size = _size(file_path)
+        entry = self.entries.get(file_path)
+        if entry is not None and entry["size"] == size:
+            return entry["tokens"]
+        return size / self.bytes_per_token()
+
+    def bytes_per_token(self):
+        if self._bytes_per_token is None:
+            tokens = sum(entry["tokens"] for entry in self.entries.values())
+            if not tokens:
+                self._bytes_per_token = DEFAULT_BYTES_PER_TOKEN
+            else:
+                self._bytes_per_token = sum(entry["size"] for entry in self.entries.values()) / tokens
+        return self._bytes_per_token
+
+    def update(self, results):
+        """Record the token counts of results that have one ("tokens")."""
+        for result in results:
+            if result.get("tokens"):
+                self.entries[result["path"]] = {"size": _size(result["path"]), "tokens": result["tokens"]}
+        self._bytes_per_token = None
+
+    def save(self):
+        if self.path is None:
+            return
+        with open(self.path, "w", encoding="utf-8") as cache:
+            json.dump(self.entries, cache, indent=1, sort_keys=True)
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def plan_chunks(costs, jobs, chunk_cost=DEFAULT_CHUNK_COST):
+    """
+    Group the indexes of costs into chunks, costliest first (LPT). A file
+    costing chunk_cost or more is a chunk of its own; smaller ones are put
+    together up to chunk_cost, so small files cost one round trip per
+    chunk instead of one each. chunk_cost shrinks for small batches so
+    every worker still gets several chunks.
+    """
+    chunk_cost = min(chunk_cost, max(sum(costs) / (jobs * CHUNKS_PER_WORKER), 1))
+    order = sorted(range(len(costs)), key=lambda index: -costs[index])
+
+    chunks = []
+    current, current_cost = [], 0
+    for index in order:
+        if costs[index] >= chunk_cost:
+            chunks.append([index])
+            continue
+        if current and current_cost + costs[index] > chunk_cost:
+            chunks.append(current)
+            current, current_cost = [], 0
+        current.append(index)
+        current_cost += costs[index]
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _run_chunk(function, chunk):
+    """Worker side: run a chunk of (index, args), timing the work."""
+    start = time.perf_counter()
+    results = [(index, function(*args)) for index, args in chunk]
+    return os.getpid(), time.perf_counter() - start, results
+
+
+def run_scheduled(function, calls, costs, jobs, chunk_cost=DEFAULT_CHUNK_COST):
+    """
+    function(*args) for every args of calls over jobs processes, the costliest
+    first. Returns the results in the order of calls and the utilization:
+    the batch's wall time and, per worker, its files, busy seconds and
+    busy share of the wall time.
+    """
+    chunks = plan_chunks(costs, jobs, chunk_cost)
+    results = [None] * len(calls)
+    workers = {}
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(min(jobs, len(chunks))) as pool:
+        # Submitted in plan order, which is the order idle workers take them in
+        futures = [pool.submit(_run_chunk, function, [(index, calls[index]) for index in chunk]) for chunk in chunks]
+        for future in futures:
+            pid, busy, chunk_results = future.result()
+            worker = workers.setdefault(pid, {"files": 0, "busy_seconds": 0.0})
+            worker["files"] += len(chunk_results)
+            worker["busy_seconds"] += busy
+            for index, result in chunk_results:
+                results[index] = result
+    wall = time.perf_counter() - start
+
+    utilization = {
+        "wall_seconds": wall,
+        "chunks": len(chunks),
+        "workers": [
+            {"worker": pid, **worker, "utilization": worker["busy_seconds"] / wall if wall else 0.0}
+            for pid, worker in sorted(workers.items())
+        ],
+    }
+    return results, utilization
@@ -0,0 +1,68 @@
+from bisect import bisect_right
+from antlr4.Token import Token
+
+
+class ColumnIndex:
+    """
+    Column of every token in a token stream, precomputed in one pass.
+
+    Columns are counted from the start of the token's run. A run starts at
+    the first token of each line or, when boundary_types is given, right
+    after any token of those types. Breaks inserted by a rewriter are
+    recorded with insert_break so later lookups see the rewritten columns.
+    """
+
+    def __init__(self, token_stream, boundary_types=None):
+        self.tokens = token_stream.tokens
+        self.columns = []
+        self.runs = []
+        # run -> ([token indexes], [new columns]) of the breaks recorded in it
+        self.breaks = {}
+
+        run = -1
+        offset = 0
+        line = None
+        starts_run = True
+        for token in self.tokens:
+            if boundary_types is None:
+                starts_run = token.line != line
+                line = token.line
+
+            if starts_run:
+                run += 1
+                offset = 0
+
+            self.columns.append(offset)
+            self.runs.append(run)
+            if token.type != Token.EOF:
+                offset += len(token.text)
+
+            if boundary_types is not None:
+                starts_run = token.type in boundary_types
+
+    def column(self, token_index):
+        breaks = self.breaks.get(self.runs[token_index])
+        if breaks is None:
+            return self.columns[token_index]
+
+        indexes, new_columns = breaks
+        position = bisect_right(indexes, token_index) - 1
+        if position < 0:
+            return self.columns[token_index]
+
+        break_index = indexes[position]
+        return new_columns[position] + self.columns[token_index] - self.columns[break_index]
+
+    def end(self, token_index):
+        """Column right after the token."""
+        return self.column(token_index) + len(self.tokens[token_index].text)
+
+    def insert_break(self, token_index, column):
+        """Record that the token now starts a new line at the given column."""
+        indexes, new_columns = self.breaks.setdefault(self.runs[token_index], ([], []))
+        position = bisect_right(indexes, token_index)
+        if position > 0 and indexes[position - 1] == token_index:
+            new_columns[position - 1] = column
+            return
+        indexes.insert(position, token_index)
+        new_columns.insert(position, column)
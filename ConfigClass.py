@@ -1,8 +1,193 @@
 import json
+from dataclasses import dataclass
+from enum import Enum
+from types import MappingProxyType
+
+
+class ConfigError(Exception):
+    pass
+
+
+class BraceStyle(Enum):
+    ATTACH = 'attach'
+    BREAK = 'break'
+
+    @classmethod
+    def _missing_(cls, value):
+        # 'new_line' is accepted as an alias of 'break'
+        if value == 'new_line':
+            return cls.BREAK
+        return None
+
+
+class ImportOrder(Enum):
+    PRESERVE = 'preserve'
+    SORT = 'sort'
+
+    @classmethod
+    def _missing_(cls, value):
+        # 'none' is accepted as an alias of 'preserve'
+        if value == 'none':
+            return cls.PRESERVE
+        return None
+
+
+class IndentType(Enum):
+    SPACES = 'spaces'
+    TABS = 'tabs'
+
+
+class SwitchCaseLabels(Enum):
+    INDENT = 'indent'
+    NO_INDENT = 'no_indent'
+
+
+class BracketAlignment(Enum):
+    DISABLED = False
+    ALIGN = 'align'
+    DONT_ALIGN = 'dont_align'
+    ALWAYS_BREAK = 'always_break'
+    BLOCK_INDENT = 'block_indent'
+    ALL_PARAMETERS_ON_NEW_LINE = 'all_parameters_on_new_line'
+
+
+def _to_enum(enum_class, value, option):
+    try:
+        return enum_class(value)
+    except ValueError:
+        allowed = ", ".join(repr(member.value) for member in enum_class)
+        raise ConfigError(f"Invalid value {value!r} for '{option}', expected one of: {allowed}.") from None
+
+
+def _to_int(value, option, minimum):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ConfigError(f"Invalid value {value!r} for '{option}', expected an integer.")
+    if value < minimum:
+        raise ConfigError(f"Invalid value {value!r} for '{option}', expected at least {minimum}.")
+    return value
+
+
+def _to_bool(value, option):
+    if not isinstance(value, bool):
+        raise ConfigError(f"Invalid value {value!r} for '{option}', expected true or false.")
+    return value
+
+
+def _to_rank(order, option):
+    if not isinstance(order, list) or not all(isinstance(item, str) for item in order):
+        raise ConfigError(f"Invalid value {order!r} for '{option}', expected a list of modifiers.")
+    ranks = {}
+    for position, modifier in enumerate(order):
+        ranks.setdefault(modifier, position)
+    return MappingProxyType(ranks)
+
+
+@dataclass(frozen=True)
+class CompiledConfig:
+    """
+    Validated, read-only view of a ConfigClass.
+    Everything the visitors need per node is precomputed here so that
+    hot paths only do attribute and dict lookups.
+    """
+    brace_style: BraceStyle
+    attach_braces: bool
+    space_around_operator: bool
+    max_line_length: int
+    class_modifier_rank: MappingProxyType
+    method_modifier_rank: MappingProxyType
+    naming_conventions: MappingProxyType
+    import_order: ImportOrder
+    sort_imports: bool
+    merge_imports: bool
+    indent_type: IndentType
+    indent_size: int
+    indent_unit: str
+    indent_switch_case_labels: bool
+    bracket_alignment: BracketAlignment
+    parameters_before_align: int
+    indent_table: tuple
+
+    INDENT_TABLE_SIZE = 32
+
+    @classmethod
+    def from_config(cls, config):
+        if isinstance(config, cls):
+            return config
+        if isinstance(config, ConfigClass):
+            # Compiled once per ConfigClass, again only if its settings change
+            return config.compile()
+        return cls.compile_settings(config)
+
+    @classmethod
+    def compile_settings(cls, config):
+        brace_style = _to_enum(BraceStyle, config.brace_style, 'brace_style')
+        max_line_length = _to_int(config.max_line_length, 'max_line_length', -1)
+        if max_line_length == 0:
+            raise ConfigError("Invalid value 0 for 'max_line_length', use -1 to disable it.")
+
+        if not isinstance(config.naming_conventions, dict):
+            raise ConfigError(f"Invalid value {config.naming_conventions!r} for 'naming_conventions', expected an object.")
+
+        import_order = _to_enum(ImportOrder, config.imports.get('order'), 'imports.order')
+        indent_type = _to_enum(IndentType, config.indents.get('type'), 'indents.type')
+        indent_size = _to_int(config.indents.get('size'), 'indents.size', 0)
+        switch_case_labels = _to_enum(SwitchCaseLabels, config.indents.get('switch_case_labels'), 'indents.switch_case_labels')
+
+        # may it appear as 8 spaces but it is actually configurable
+        # in text editors so a tab is a single indent unit
+        indent_unit = "\t" if indent_type == IndentType.TABS else " " * indent_size
+
+        return cls(
+            brace_style=brace_style,
+            attach_braces=brace_style == BraceStyle.ATTACH,
+            space_around_operator=_to_bool(config.space_around_operator, 'space_around_operator'),
+            max_line_length=max_line_length,
+            class_modifier_rank=_to_rank(config.class_modifier_order, 'class_modifier_order'),
+            method_modifier_rank=_to_rank(config.method_modifier_order, 'method_modifier_order'),
+            naming_conventions=MappingProxyType(dict(config.naming_conventions)),
+            import_order=import_order,
+            sort_imports=import_order == ImportOrder.SORT,
+            merge_imports=_to_bool(config.imports.get('merge'), 'imports.merge'),
+            indent_type=indent_type,
+            indent_size=indent_size,
+            indent_unit=indent_unit,
+            indent_switch_case_labels=switch_case_labels == SwitchCaseLabels.INDENT,
+            bracket_alignment=_to_enum(BracketAlignment, config.aligns.get('after_open_bracket'), 'aligns.after_open_bracket'),
+            parameters_before_align=_to_int(config.aligns.get('parameters_before_align'), 'aligns.parameters_before_align', 1),
+            indent_table=tuple(indent_unit * level for level in range(cls.INDENT_TABLE_SIZE)),
+        )
+
+    def __reduce__(self):
+        # MappingProxyType does not pickle, which process pools need
+        fields = {
+            name: dict(value) if isinstance(value, MappingProxyType) else value
+            for name, value in vars(self).items()
+        }
+        return _unpickle_compiled_config, (fields,)
+
+    def indent(self, level):
+        if level < self.INDENT_TABLE_SIZE:
+            return self.indent_table[level]
+        return self.indent_unit * level
+
+    @staticmethod
+    def sort_modifiers(modifiers, rank):
+        fallback = len(rank)
+        return sorted(modifiers, key=lambda x: rank.get(x, fallback))
+
+
+def _unpickle_compiled_config(fields):
+    return CompiledConfig(**{
+        name: MappingProxyType(value) if isinstance(value, dict) else value
+        for name, value in fields.items()
+    })
+
 
 class ConfigClass:
     def __init__(self, config_path):
         self.config_path = config_path
+        # (settings key, CompiledConfig) of the last compile()
+        self._compiled = None
 
         self.default_config()
 
@@ -36,27 +221,55 @@ class ConfigClass:
         }
 
     def read_config(self):
+        # Without a path only the defaults apply
+        if self.config_path is None:
+            return
+
         config_json = {}
         try:
             with open(self.config_path) as f:
                 config_json = json.load(f)
-        except json.JSONDecodeError:
-            print(f"Error: Invalid JSON format in '{self.config_path}'.")
-            exit(1)
-        except Exception as e:
-            print(f"Error reading config file: {e}.")
-            exit(1)
-
-        
+        except json.JSONDecodeError as e:
+            raise ConfigError(f"Invalid JSON format in '{self.config_path}'.") from e
+        except OSError as e:
+            raise ConfigError(f"Error reading config file: {e}.") from e
+
+        if not isinstance(config_json, dict):
+            raise ConfigError(f"Invalid config in '{self.config_path}', expected a JSON object.")
+
         self.brace_style = config_json.get('brace_style', self.brace_style)
         self.space_around_operator = config_json.get('space_around_operator', self.space_around_operator)
         self.max_line_length = config_json.get('max_line_length', self.max_line_length)
         self.class_modifier_order = config_json.get('class_modifier_order', self.class_modifier_order)
         self.method_modifier_order = config_json.get('method_modifier_order', self.method_modifier_order)
         self.naming_conventions = config_json.get('naming_conventions', self.naming_conventions)
-        self.imports = config_json.get('imports', self.imports)
-        self.indents = config_json.get('indents', self.indents)
-        self.aligns = config_json.get('aligns', self.aligns)
+        for section in ('naming_conventions', 'imports', 'indents', 'aligns'):
+            if not isinstance(config_json.get(section, {}), dict):
+                raise ConfigError(f"Invalid config in '{self.config_path}', '{section}' must be an object.")
+
+        # Nested sections are merged over the defaults so a partial section stays valid
+        self.imports = {**self.imports, **config_json.get('imports', {})}
+        self.indents = {**self.indents, **config_json.get('indents', {})}
+        self.aligns = {**self.aligns, **config_json.get('aligns', {})}
+
+        # Validate once at load time instead of failing in the middle of a visit
+        try:
+            self.compile()
+        except ConfigError as e:
+            raise ConfigError(f"Error in config file '{self.config_path}': {e}") from e
+
+    def compile(self) -> CompiledConfig:
+        key = self._settings_key()
+        if self._compiled is None or self._compiled[0] != key:
+            self._compiled = (key, CompiledConfig.compile_settings(self))
+        return self._compiled[1]
+
+    def _settings_key(self):
+        # The settings are plain values, which tests and callers may change in place
+        return repr((
+            self.brace_style, self.space_around_operator, self.max_line_length, self.class_modifier_order,
+            self.method_modifier_order, self.naming_conventions, self.imports, self.indents, self.aligns,
+        ))
 
     # Kept for future use
     def save_config(self):
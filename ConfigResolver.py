@@ -0,0 +1,77 @@
+import os
+from ConfigClass import ConfigClass, ConfigError
+
+
+class ConfigResolver:
+    """
+    Resolves the nearest config file for each Java file by walking up its
+    parent directories. Results are memoized per directory, so every config
+    file is parsed at most once no matter how many files share it.
+    """
+
+    CONFIG_FILE_NAME = ".java-format.json"
+
+    def __init__(self, config_file_name=CONFIG_FILE_NAME):
+        self.config_file_name = config_file_name
+        # directory -> ConfigClass, or the ConfigError raised while loading it
+        self._directories = {}
+        # config path -> ConfigClass, or the ConfigError raised while loading it
+        self._configs = {}
+        self._default_config = None
+
+    def resolve(self, java_file_path) -> ConfigClass:
+        directory = os.path.dirname(os.path.abspath(java_file_path))
+        return self.resolve_directory(directory)
+
+    def resolve_directory(self, directory) -> ConfigClass:
+        directory = os.path.abspath(directory)
+        visited = []
+        result = None
+
+        current = directory
+        while True:
+            if current in self._directories:
+                result = self._directories[current]
+                break
+
+            visited.append(current)
+            config_path = os.path.join(current, self.config_file_name)
+            if os.path.isfile(config_path):
+                result = self._load(config_path)
+                break
+
+            parent = os.path.dirname(current)
+            if parent == current:
+                result = self._defaults()
+                break
+            current = parent
+
+        # Every directory on the way shares the same answer
+        for path in visited:
+            self._directories[path] = result
+
+        if isinstance(result, ConfigError):
+            raise result
+        return result
+
+    def config_path_for(self, java_file_path):
+        """Return the config file that applies to the given file, or None when only defaults apply."""
+        config = self.resolve(java_file_path)
+        return config.config_path
+
+    def clear(self):
+        self._directories.clear()
+        self._configs.clear()
+
+    def _load(self, config_path):
+        if config_path not in self._configs:
+            try:
+                self._configs[config_path] = ConfigClass(config_path)
+            except ConfigError as e:
+                self._configs[config_path] = e
+        return self._configs[config_path]
+
+    def _defaults(self):
+        if self._default_config is None:
+            self._default_config = ConfigClass(None)
+        return self._default_config
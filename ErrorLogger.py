@@ -1,37 +1,39 @@
 from JavaParser import JavaParser
-from JavaParserVisitor import JavaParserVisitor
+from VisitorContext import VisitorContext
+from TreeWalker import ContextTrackingListener
 from StandardNamingConventions import StandardNamingConventions
 from ConfigClass import ConfigClass
 import re
 
-class ErrorLogger(JavaParserVisitor):
+class ErrorLogger(ContextTrackingListener):
     def __init__(self, configs: ConfigClass):
+        super().__init__()
         self.configs = configs
         self.error_log = []
+        # The name node of every error, in error_log order
+        self.error_nodes = []
 
-    def visitClassDeclaration(self, ctx: JavaParser.ClassDeclarationContext):
+    def log(self, message, node):
+        self.error_log.append(message)
+        self.error_nodes.append(node)
+
+    def enterClassDeclaration(self, ctx: JavaParser.ClassDeclarationContext):
         class_name = ctx.identifier().getText()
         class_config = self.configs.naming_conventions["class"]
         error = self.check_convention(class_name, class_config)
         if error:
-            self.error_log.append("Class name " + error)
-
-
-        return self.visitChildren(ctx)
+            self.log("Class name " + error, ctx.identifier())
 
-    def visitMethodDeclaration(self, ctx: JavaParser.MethodDeclarationContext):
+    def enterMethodDeclaration(self, ctx: JavaParser.MethodDeclarationContext):
         method_name = ctx.identifier().getText()
 
         method_config = self.configs.naming_conventions["method"]
         error = self.check_convention(method_name, method_config)
 
         if error:
-            self.error_log.append("Method name " + error)
+            self.log("Method name " + error, ctx.identifier())
 
-
-        return self.visitChildren(ctx)
-
-    def visitFieldDeclaration(self, ctx: JavaParser.FieldDeclarationContext):
+    def enterFieldDeclaration(self, ctx: JavaParser.FieldDeclarationContext):
         declarators = ctx.variableDeclarators()
         modifiers = [mod.getText() for mod in ctx.parentCtx.parentCtx.modifier()]
         is_static = "static" in modifiers
@@ -51,12 +53,9 @@ class ErrorLogger(JavaParserVisitor):
                 error = self.check_convention(field_name, variable_config)
 
             if error:
-                self.error_log.append("Field name " + error)
-
+                self.log("Field name " + error, declarator.variableDeclaratorId())
 
-        return self.visitChildren(ctx)
-
-    def visitLocalVariableDeclaration(self, ctx: JavaParser.LocalVariableDeclarationContext):
+    def enterLocalVariableDeclaration(self, ctx: JavaParser.LocalVariableDeclarationContext):
         declarators = ctx.variableDeclarators()
 
         variable_config = self.configs.naming_conventions["variable"]
@@ -66,22 +65,16 @@ class ErrorLogger(JavaParserVisitor):
 
             error = self.check_convention(variable_name, variable_config)
             if error:
-                self.error_log.append("Local variable name " + error)
-
-
-        return self.visitChildren(ctx)
+                self.log("Local variable name " + error, declarator.variableDeclaratorId())
 
-    def visitFormalParameter(self, ctx: JavaParser.FormalParameterContext):
+    def enterFormalParameter(self, ctx: JavaParser.FormalParameterContext):
         parameter_name = ctx.variableDeclaratorId().getText()
 
         parameter_config = self.configs.naming_conventions["parameter"]
 
         error = self.check_convention(parameter_name, parameter_config)
         if error:
-            self.error_log.append("Parameter name " + error)
-
-
-        return self.visitChildren(ctx)
+            self.log("Parameter name " + error, ctx.variableDeclaratorId())
 
     @staticmethod
     def check_convention(name, convention) -> bool:
@@ -100,5 +93,7 @@ class ErrorLogger(JavaParserVisitor):
 
     def find_errors(self, tree) -> list:
         self.error_log = []
-        self.visit(tree)
+        self.error_nodes = []
+        self.context = VisitorContext()
+        self.walk(tree)
         return self.error_log
\ No newline at end of file
@@ -0,0 +1,85 @@
+import os
+import time
+
+
+class PollingWatcher:
+    """
+    Watches the .java files under a directory by polling os.stat. A snapshot
+    of (mtime, size) per file is kept in memory and compared on every poll.
+    A changed, new or removed file is reported once it has stayed unchanged
+    for debounce seconds, so a burst of saves gives one report. Files named
+    one of names (e.g. .java-format.json) are watched too. Hidden
+    directories (.git, .idea, ...) are not scanned.
+    """
+
+    def __init__(self, root, interval=0.5, debounce=0.3, suffix=".java", names=()):
+        self.root = root
+        self.interval = interval
+        self.debounce = debounce
+        self.suffix = suffix
+        self.names = set(names)
+        self.snapshot = self.scan()
+        # path -> time its last change was seen
+        self.pending = {}
+
+    def scan(self):
+        snapshot = {}
+        stack = [self.root]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except OSError:
+                # Removed or unreadable since it was listed
+                continue
+            for entry in entries:
+                watched = entry.name in self.names or (entry.name.endswith(self.suffix) and not entry.name.startswith("."))
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith("."):
+                            stack.append(entry.path)
+                    elif watched and entry.is_file():
+                        stat = entry.stat()
+                        snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+                except OSError:
+                    continue
+        return snapshot
+
+    def poll(self, now=None):
+        """Scan once and return the changed, new or removed files that have settled, sorted."""
+        now = time.monotonic() if now is None else now
+        snapshot = self.scan()
+        for path, stat in snapshot.items():
+            if self.snapshot.get(path) != stat:
+                self.pending[path] = now
+        for path in self.snapshot:
+            if path not in snapshot:
+                self.pending[path] = now
+        self.snapshot = snapshot
+
+        ready = sorted(path for path, seen in self.pending.items() if now - seen >= self.debounce)
+        for path in ready:
+            del self.pending[path]
+        return ready
+
+    def refresh(self, paths):
+        """Take the current state of paths into the snapshot, e.g. after rewriting them."""
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self.snapshot.pop(path, None)
+                continue
+            self.snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+
+    def run(self, on_change, should_stop=lambda: False):
+        """
+        Call on_change(paths) with every settled batch until should_stop()
+        returns true. The files are refreshed afterwards, so rewriting them
+        in on_change does not report them again.
+        """
+        while not should_stop():
+            time.sleep(self.interval)
+            ready = self.poll()
+            if ready:
+                on_change(ready)
+                self.refresh(ready)
@@ -0,0 +1,358 @@
+import time
+from antlr4 import Token
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field, replace
+from difflib import SequenceMatcher
+from typing import Optional
+from ConfigClass import ConfigClass, CompiledConfig
+from ErrorLogger import ErrorLogger
+from FormatBudget import BudgetExceeded
+from JavaLexer import JavaLexer
+from JavaParser import JavaParser
+from LineBreaker import LineBreaker
+from ParserContext import parser_pool
+import testmain
+
+
+@dataclass
+class FormatResult:
+    """Outcome of formatting one source text in memory."""
+    # Formatted source, or the input unchanged when it went over its budget
+    text: str
+    # Syntax errors, then naming convention violations
+    diagnostics: list = field(default_factory=list)
+    # Seconds spent per pipeline stage, plus "total"
+    timings: dict = field(default_factory=dict)
+    # Why the text was left alone: "syntax errors" or "budget exceeded: ..."
+    skipped: Optional[str] = None
+    # With edits=True, (start, end, replacement) edits turning the input into text
+    edits: Optional[list] = None
+
+
+class StageTimer:
+    """Profiler-compatible recorder of the wall time of every stage."""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def _compile(config):
+    if config is None:
+        config = ConfigClass(None)
+    elif isinstance(config, str):
+        config = ConfigClass(config)
+    return CompiledConfig.from_config(config)
+
+
+def _significant_tokens(text):
+    with parser_pool.context() as context:
+        tokens = context.tokenize(text).tokens
+    return [token for token in tokens if token.type not in (JavaLexer.WS, Token.EOF)]
+
+
+def minimal_edits(old, new):
+    """
+    Edits (start, end, replacement), in character offsets of old and in
+    order, turning old into new. The formatter's rewrites only change the
+    whitespace between tokens, but it works on text with the newlines
+    already stripped, so its operations cannot be mapped back to old.
+    Instead the tokens of both texts are lined up (difflib, after the
+    common prefix and suffix): where they match only the whitespace gaps
+    that differ become edits, and every run of tokens that changed
+    (renames, sorted imports, split strings) becomes one edit spanning it.
+    Changes far apart so give separate small edits.
+    """
+    old_tokens = _significant_tokens(old)
+    new_tokens = _significant_tokens(new)
+
+    limit = min(len(old_tokens), len(new_tokens))
+    prefix = 0
+    while prefix < limit and old_tokens[prefix].text == new_tokens[prefix].text:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old_tokens[-1 - suffix].text == new_tokens[-1 - suffix].text:
+        suffix += 1
+
+    # Matching (old index, new index) pairs, between the text's two ends
+    anchors = [(-1, -1)]
+    anchors += [(i, i) for i in range(prefix)]
+    matcher = SequenceMatcher(
+        None,
+        [token.text for token in old_tokens[prefix:len(old_tokens) - suffix]],
+        [token.text for token in new_tokens[prefix:len(new_tokens) - suffix]],
+    )
+    for old_index, new_index, size in matcher.get_matching_blocks():
+        anchors += [(prefix + old_index + k, prefix + new_index + k) for k in range(size)]
+    anchors += [(len(old_tokens) - k, len(new_tokens) - k) for k in range(suffix, 0, -1)]
+    anchors.append((len(old_tokens), len(new_tokens)))
+
+    def gap(text, tokens, before, after):
+        start = tokens[before].stop + 1 if before >= 0 else 0
+        end = tokens[after].start if after < len(tokens) else len(text)
+        return start, end
+
+    edits = []
+    for (old_before, new_before), (old_after, new_after) in zip(anchors, anchors[1:]):
+        old_start, old_end = gap(old, old_tokens, old_before, old_after)
+        new_start, new_end = gap(new, new_tokens, new_before, new_after)
+        replacement = new[new_start:new_end]
+        if old[old_start:old_end] != replacement:
+            edits.append((old_start, old_end, replacement))
+    return edits
+
+
+def apply_edits(text, edits):
+    """Apply ordered, non overlapping (start, end, replacement) edits."""
+    pieces = []
+    copied_until = 0
+    for start, end, replacement in edits:
+        pieces.append(text[copied_until:start])
+        pieces.append(replacement)
+        copied_until = end
+    pieces.append(text[copied_until:])
+    return "".join(pieces)
+
+
+def format_source(text, config=None, budget=None, edits=False) -> FormatResult:
+    """
+    Run the full pipeline over a string without touching the filesystem.
+    config may be a ConfigClass, a CompiledConfig, a config file path or
+    None for the defaults; budget is an optional FormatBudget. Text that
+    does not parse is returned unchanged with its syntax errors. With
+    edits, the result also lists the minimal_edits from text to its text.
+    """
+    config = _compile(config)
+    timer = StageTimer()
+    syntax_errors = []
+    output_errors = []
+    start = time.perf_counter()
+
+    try:
+        with budget.running() if budget is not None else nullcontext():
+            tree, tokens, _ = testmain.parse_java_source(text, timer, budget, syntax_errors)
+            if syntax_errors:
+                # Formatting a tree with error nodes in it can mangle or drop code
+                timer.timings["total"] = time.perf_counter() - start
+                return FormatResult(text, syntax_errors, timer.timings, skipped="syntax errors",
+                                    edits=[] if edits else None)
+
+            with timer.stage("lint"):
+                naming_errors = ErrorLogger(config).find_errors(tree)
+            formatted = testmain.format_code(tree, tokens, config, timer, budget, output_errors)
+    except BudgetExceeded as e:
+        timer.timings["total"] = time.perf_counter() - start
+        return FormatResult(text, syntax_errors, timer.timings, skipped=f"budget exceeded: {str(e)}",
+                            edits=[] if edits else None)
+
+    diagnostics = syntax_errors + naming_errors
+    # The formatter's own output should always parse, report it if it does not
+    diagnostics += [f"formatted output: {error}" for error in output_errors]
+    result = FormatResult(formatted, diagnostics, timer.timings)
+    if edits:
+        with timer.stage("edits"):
+            result.edits = minimal_edits(text, formatted)
+    timer.timings["total"] = time.perf_counter() - start
+    return result
+
+
+def format_many(texts, config=None, budget=None, edits=False):
+    """
+    Format every text of an iterable, yielding FormatResults in order. The
+    config is compiled once and the parses share the pool's warm parser.
+    """
+    config = _compile(config)
+    for text in texts:
+        yield format_source(text, config, budget, edits)
+
+
+# Nodes format_range may rewrite on their own: class members and statements
+RANGE_NODES = (JavaParser.ClassBodyDeclarationContext, JavaParser.BlockStatementContext)
+RANGE_START = "/*@range*/"
+RANGE_END = "/*@end*/"
+
+
+def _outer_range_nodes(container):
+    """The RANGE_NODES below container that are not inside another one, in order."""
+    found = []
+    stack = list(reversed(container.children or []))
+    while stack:
+        node = stack.pop()
+        if isinstance(node, RANGE_NODES):
+            found.append(node)
+        elif getattr(node, "children", None):
+            stack.extend(reversed(node.children))
+    return found
+
+
+def _widen_to_context(node):
+    """
+    node, or the outermost switch or try statement around it when node is in
+    a switch case or a finally block: FormattingVisitor places the braces of
+    blocks there differently, and the wrapper has no such context.
+    """
+    widened = node
+    parent = node.parentCtx
+    while parent is not None:
+        if isinstance(parent, (JavaParser.SwitchBlockStatementGroupContext, JavaParser.FinallyBlockContext)):
+            while parent is not None and not isinstance(parent, JavaParser.BlockStatementContext):
+                parent = parent.parentCtx
+            if parent is None:
+                break
+            widened = parent
+        parent = parent.parentCtx
+    return widened
+
+
+def _range_runs(tree, start_line, end_line):
+    """
+    Runs of sibling RANGE_NODES to reformat for the lines start_line to
+    end_line: the smallest node containing them all, or the siblings they
+    touch inside it when those cover the lines. Lines outside any member
+    (e.g. a class header alone) give no runs.
+    """
+    runs = []
+    for run in _touched_runs(tree, start_line, end_line):
+        widened = _widen_to_context(run[0])
+        if widened is not run[0]:
+            run = [widened]
+        if all(widened is not other[0] for other in runs):
+            runs.append(run)
+    return runs
+
+
+def _touched_runs(tree, start_line, end_line):
+    """The runs of _range_runs, before they are widened to their context."""
+    container = tree
+    while True:
+        touched = [
+            node for node in _outer_range_nodes(container)
+            if node.start.line <= end_line and node.stop.line >= start_line
+        ]
+        if not touched:
+            return [] if container is tree else [[container]]
+
+        if len(touched) == 1 and touched[0].start.line <= start_line and touched[0].stop.line >= end_line:
+            # Entirely inside one node, see if a smaller one inside it covers the lines
+            container = touched[0]
+            continue
+
+        runs = {}
+        for node in touched:
+            runs.setdefault(id(node.parentCtx), []).append(node)
+        if container is tree:
+            return list(runs.values())
+        if len(runs) > 1 or touched[0].start.line > start_line or touched[-1].stop.line < end_line:
+            # The lines cross blocks (the end of an if and what follows it) or
+            # take in the container's own lines, e.g. the header of an if
+            return [[container]]
+        return list(runs.values())
+
+
+def _indent_level(node, config):
+    """The indentation level FormattingVisitor gives node."""
+    level = 0
+    while node is not None:
+        if isinstance(node, (JavaParser.ClassDeclarationContext, JavaParser.BlockStatementContext)):
+            level += 1
+        elif isinstance(node, JavaParser.SwitchBlockStatementGroupContext) and config.indent_switch_case_labels:
+            level += 1
+        node = node.parentCtx
+    return level
+
+
+def _wrap_range(region, node, level):
+    """
+    Put region in a compilation unit that nests it as deep as it is in its
+    file, so it comes out with the same indentation.
+    """
+    if isinstance(node, JavaParser.BlockStatementContext):
+        # The class, the method body and the statement itself are three levels
+        depth = max(level - 2, 0)
+        head = "class __Range { void __range() { " + "{ " * depth
+        tail = " }" * depth + " } }"
+    else:
+        depth = max(level - 1, 0)
+        head = "class __Range { " + "".join(f"class __Range{i} {{ " for i in range(depth))
+        tail = " }" * depth + " }"
+    return f"{head}{RANGE_START} {region} {RANGE_END}{tail}"
+
+
+def _break_long_lines(text, config):
+    if config.max_line_length == -1:
+        return text
+    breaker = LineBreaker(config.max_line_length, 2 * max(config.indent_size, 1))
+    return "\n".join(
+        breaker.break_line(line) if len(line) > config.max_line_length else line
+        for line in text.split("\n")
+    )
+
+
+def format_range(text, start_line, end_line, config=None, budget=None) -> FormatResult:
+    """
+    Reformat only the members and statements covering lines start_line to
+    end_line (1-based, inclusive), leaving the rest of text byte for byte.
+    The smallest enclosing classBodyDeclaration or blockStatement is
+    formatted on its own, nested as deep as in the file, and spliced back
+    in. Diagnostics cover the syntax of the whole text and the naming of the
+    reformatted nodes only.
+    """
+    config = _compile(config)
+    timer = StageTimer()
+    syntax_errors = []
+    start = time.perf_counter()
+
+    with parser_pool.context() as context:
+        tree, _ = context.parse(text, timer, errors=syntax_errors)
+    if syntax_errors:
+        timer.timings["total"] = time.perf_counter() - start
+        return FormatResult(text, syntax_errors, timer.timings, skipped="syntax errors")
+
+    runs = _range_runs(tree, start_line, end_line)
+    if not runs:
+        timer.timings["total"] = time.perf_counter() - start
+        return FormatResult(text, [], timer.timings, skipped="no member or statement in range")
+
+    # Line breaking needs the final columns, so it runs after splicing
+    wrapper_config = replace(config, max_line_length=-1)
+    diagnostics = []
+    # Back to front so the offsets of the earlier runs stay valid
+    for run in reversed(runs):
+        with timer.stage("lint"):
+            logger = ErrorLogger(config)
+            diagnostics[:0] = [error for node in run for error in logger.find_errors(node)]
+
+        region_start, region_stop = run[0].start.start, run[-1].stop.stop + 1
+        line_start = text.rfind("\n", 0, region_start) + 1
+        wrapper = _wrap_range(text[region_start:region_stop], run[0], _indent_level(run[0], config))
+        result = format_source(wrapper, wrapper_config, budget)
+        for stage, seconds in result.timings.items():
+            if stage != "total":
+                timer.timings[stage] = timer.timings.get(stage, 0.0) + seconds
+        if result.skipped is not None or RANGE_END not in result.text:
+            # e.g. a // comment swallowing the rest of the line once newlines are gone
+            timer.timings["total"] = time.perf_counter() - start
+            return FormatResult(text, syntax_errors, timer.timings, skipped=result.skipped or "range did not format")
+
+        formatted = result.text
+        formatted = formatted[formatted.index(RANGE_START) + len(RANGE_START):formatted.index(RANGE_END)]
+        body = formatted.strip()
+        leading = formatted[:len(formatted) - len(formatted.lstrip())]
+        if text[line_start:region_start].strip() or "\n" not in leading:
+            # Whatever precedes the node on its first line stays as it is
+            line_start, indent = region_start, ""
+        else:
+            indent = leading[leading.rfind("\n") + 1:]
+        prefix = text[text.rfind("\n", 0, line_start) + 1:line_start]
+        spliced = _break_long_lines(prefix + indent + body, config)[len(prefix):]
+        text = text[:line_start] + spliced + text[region_stop:]
+
+    timer.timings["total"] = time.perf_counter() - start
+    return FormatResult(text, diagnostics, timer.timings)
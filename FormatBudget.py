@@ -0,0 +1,132 @@
+import signal
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from antlr4.tree.Tree import ParseTreeListener
+
+
+class BudgetExceeded(Exception):
+    """A file went over one of the limits of its FormatBudget."""
+
+    def __init__(self, limit, value, maximum):
+        super().__init__(f"{limit} budget exceeded ({value} > {maximum})")
+        self.limit = limit
+        self.value = value
+        self.maximum = maximum
+
+
+class _DeadlineListener(ParseTreeListener):
+    """Parse listener that checks the deadline while the parser works."""
+
+    # Reading the clock on every rule entry is measurable, every 64th is plenty
+    CLOCK_INTERVAL = 64
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.entered = 0
+
+    def enterEveryRule(self, ctx):
+        self.entered += 1
+        if self.entered % self.CLOCK_INTERVAL == 0:
+            self.budget.check_time()
+
+
+class FormatBudget:
+    """
+    Limits on how much work a single file may cost: wall time, parse-tree
+    depth and token count. None disables a limit.
+
+    Tokens are checked after lexing and depth right after parsing, before
+    any pass runs over the tree (left-recursive rules such as long '+'
+    chains parse in a loop but nest one level per operator, so the parser
+    alone never notices). Time is checked cooperatively during the
+    parse and between stages, and on the main thread of platforms with
+    SIGALRM a timer also interrupts stages that never reach a check (e.g. the
+    parser's adaptive prediction exploring an ambiguous expression).
+    """
+
+    DEFAULT_SECONDS = 30.0
+    DEFAULT_DEPTH = 1000
+    DEFAULT_TOKENS = 500_000
+
+    # Python frames the parser uses per tree level when it descends into nested
+    # constructs (about 2, plus headroom); the passes walk the tree iteratively
+    FRAMES_PER_LEVEL = 3
+
+    def __init__(self, max_seconds=DEFAULT_SECONDS, max_depth=DEFAULT_DEPTH, max_tokens=DEFAULT_TOKENS):
+        self.max_seconds = max_seconds
+        self.max_depth = max_depth
+        self.max_tokens = max_tokens
+        self.started = None
+        self.deadline = None
+
+    @classmethod
+    def unlimited(cls):
+        return cls(None, None, None)
+
+    def check_time(self):
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise BudgetExceeded("time", f"{time.monotonic() - self.started:.1f}s", f"{self.max_seconds}s")
+
+    def check_tokens(self, token_stream):
+        if self.max_tokens is not None and len(token_stream.tokens) > self.max_tokens:
+            raise BudgetExceeded("tokens", len(token_stream.tokens), self.max_tokens)
+
+    def check_depth(self, tree):
+        if self.max_depth is None:
+            return
+        stack = [(tree, 1)]
+        while stack:
+            node, depth = stack.pop()
+            if depth > self.max_depth:
+                raise BudgetExceeded("depth", f">={depth}", self.max_depth)
+            children = getattr(node, "children", None)
+            if children:
+                stack.extend((child, depth + 1) for child in children)
+
+    def watch_parser(self, parser):
+        """Add a deadline listener to the parser and return it, or None without a deadline."""
+        if self.deadline is None:
+            return None
+        listener = _DeadlineListener(self)
+        parser.addParseListener(listener)
+        return listener
+
+    @contextmanager
+    def running(self):
+        """
+        Start the clock for one file. Inside the block the recursion limit is
+        raised to fit max_depth, and a RecursionError still escaping the
+        parser is reported as a depth budget hit.
+        """
+        self.started = time.monotonic()
+        if self.max_seconds is not None:
+            self.deadline = self.started + self.max_seconds
+
+        recursion_limit = sys.getrecursionlimit()
+        if self.max_depth is not None:
+            sys.setrecursionlimit(max(recursion_limit, self.max_depth * self.FRAMES_PER_LEVEL + 200))
+
+        use_alarm = (
+            self.max_seconds is not None
+            and hasattr(signal, "setitimer")
+            and threading.current_thread() is threading.main_thread()
+        )
+        if use_alarm:
+            previous_handler = signal.signal(signal.SIGALRM, self._on_alarm)
+            signal.setitimer(signal.ITIMER_REAL, self.max_seconds)
+
+        try:
+            yield self
+        except RecursionError:
+            raise BudgetExceeded("depth", "recursion limit", self.max_depth) from None
+        finally:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, previous_handler)
+            sys.setrecursionlimit(recursion_limit)
+            self.deadline = None
+
+    def _on_alarm(self, signum, frame):
+        raise BudgetExceeded("time", f"{time.monotonic() - self.started:.1f}s", f"{self.max_seconds}s")
@@ -1,35 +1,38 @@
 from typing import Optional
 from JavaParser import JavaParser
-from JavaParserVisitor import JavaParserVisitor
+from VisitorContext import VisitorContext
+from TreeWalker import ContextTrackingListener
 from antlr4.TokenStreamRewriter import TokenStreamRewriter
-from functools import wraps
-from ConfigClass import ConfigClass
+from RewriteRenderer import TokenRewriter
+from ConfigClass import ConfigClass, CompiledConfig, BracketAlignment
+from ColumnIndex import ColumnIndex
+from MemoryProfiler import NULL_PROFILER
 
-class FormattingVisitor(JavaParserVisitor):
+class FormattingVisitor(ContextTrackingListener):
     def __init__(self, tokens, config: ConfigClass):
-        self.rewriter : TokenStreamRewriter = TokenStreamRewriter(tokens)
-        self.config:ConfigClass = config
+        super().__init__()
+        self.rewriter : TokenStreamRewriter = TokenRewriter(tokens)
+        self.config: CompiledConfig = CompiledConfig.from_config(config)
         self.indent_level: int = 0
+        self.column_index: Optional[ColumnIndex] = None
         self.imports = {
             'items': [],
             'start_index': -1,
             'end_index': -1
         }
 
-    def visitImportDeclaration(self, ctx: JavaParser.ImportDeclarationContext):
-        if self.config.imports["merge"] == True:
+    def enterImportDeclaration(self, ctx: JavaParser.ImportDeclarationContext):
+        if self.config.merge_imports:
             if self.rewriter.getTokenStream().get(ctx.stop.tokenIndex+1).type in [JavaParser.WS]:
                 self.rewriter.replaceIndex(ctx.stop.tokenIndex+1, "\n")
             else:
                 self.rewriter.insertBeforeIndex(ctx.stop.tokenIndex+1, "\n")
 
-        if self.config.imports['order'] == "sort":
+        if self.config.sort_imports:
             if self.imports['start_index'] == -1:
                 self.imports['start_index'] = ctx.start.tokenIndex
             self.imports['end_index'] = ctx.stop.tokenIndex
             self.imports['items'].append(self._get_import_text(ctx.start.tokenIndex, ctx.stop.tokenIndex))
-
-        return self.visitChildren(ctx)
     
     def _get_import_text(self, start, stop):
         text = []
@@ -42,10 +45,10 @@ class FormattingVisitor(JavaParserVisitor):
             self.rewriter.replaceRange(self.imports['start_index'], self.imports['end_index'], "\n".join(sorted(self.imports['items'])))
         
         # Used to help with the lack of a newline in the last import
-        if self.config.imports['merge'] == True:
+        if self.config.merge_imports:
             self.rewriter.insertBeforeIndex(self.imports['end_index']+1, "\n")
 
-    def visitClassDeclaration(self, ctx: JavaParser.ClassDeclarationContext):
+    def enterClassDeclaration(self, ctx: JavaParser.ClassDeclarationContext):
         class_name = ctx.identifier().getText()
         modifiers = []
         parent = ctx.parentCtx
@@ -53,7 +56,7 @@ class FormattingVisitor(JavaParserVisitor):
         if isinstance(parent, JavaParser.TypeDeclarationContext):
             if parent.classOrInterfaceModifier():
                 modifiers = [mod.getText() for mod in parent.classOrInterfaceModifier()]
-                modifiers = self._sort_modifiers(modifiers, self.config.class_modifier_order)
+                modifiers = self._sort_modifiers(modifiers, self.config.class_modifier_rank)
         
         class_signature = f"{' '.join(modifiers)} class {class_name}".strip()
         self.rewriter.replaceRangeTokens(parent.start, ctx.identifier().stop, class_signature)
@@ -70,7 +73,7 @@ class FormattingVisitor(JavaParserVisitor):
             self._remove_whitespace(close_brace.tokenIndex - 1)
             self._remove_whitespace(close_brace.tokenIndex + 1)
 
-            if self.config.brace_style == "attach":
+            if self.config.attach_braces:
                 self.rewriter.replaceSingleToken(open_brace, " {")
             else:
                 self.rewriter.replaceSingleToken(open_brace, f"\n{self._get_indent()}"+"{")
@@ -83,11 +86,8 @@ class FormattingVisitor(JavaParserVisitor):
             self.rewriter.replaceSingleToken(close_brace, f"{brace_break}{self._get_indent()}" + "}")
 
             self.indent_level += 1
-
-        
-        return self.visitChildren(ctx)
     
-    def visitMethodDeclaration(self, ctx: JavaParser.MethodDeclarationContext):
+    def enterMethodDeclaration(self, ctx: JavaParser.MethodDeclarationContext):
         return_type = ctx.typeTypeOrVoid().getText()
         method_name = ctx.identifier().getText()
         modifiers = []
@@ -98,75 +98,50 @@ class FormattingVisitor(JavaParserVisitor):
             if isinstance(grandparent, JavaParser.ClassBodyDeclarationContext):
                 if grandparent.modifier():
                     modifiers = [mod.getText() for mod in grandparent.modifier()]
-                    modifiers = self._sort_modifiers(modifiers, self.config.method_modifier_order)
+                    modifiers = self._sort_modifiers(modifiers, self.config.method_modifier_rank)
 
         method_signature = f"{' '.join(modifiers)} {return_type} {method_name}".strip()
 
         if grandparent: 
             self.rewriter.replaceRangeTokens(grandparent.start, ctx.identifier().stop, f"\n{self._get_indent()}{method_signature}")
-
-        return self.visitChildren(ctx)
     
-    def visitStatement(self, ctx: JavaParser.StatementContext):
+    def enterStatement(self, ctx: JavaParser.StatementContext):
         if ctx.SWITCH():
             close_paren = ctx.RBRACE().getSymbol()
             open_brace = ctx.LBRACE().getSymbol()
-            if self.config.brace_style == "attach":
+            if self.config.attach_braces:
                 self.rewriter.replaceSingleToken(open_brace, " {")
             else:
                 self.rewriter.replaceSingleToken(open_brace, f"\n{self._get_indent()}" + "{")
             self.rewriter.insertBeforeToken(close_paren, f"\n{self._get_indent()}")
-        return self.visitChildren(ctx)
-
-
-    @staticmethod
-    def handle_indentation(method):
-        """Decorator to automatically increase and decrease indentation."""
-        @wraps(method)
-        def wrapper(self, ctx):
-            ignore_switch_case = method.__name__ == "visitSwitchBlockStatementGroup" and self.config.indents['switch_case_labels'] != "indent"
-
-            if not ignore_switch_case:
-                self.indent_level += 1
-            try:
-                return method(self, ctx)
-            finally:
-                if not ignore_switch_case:
-                    self.indent_level -= 1 
-        return wrapper
 
 
-    @handle_indentation
-    def visitBlockStatement(self, ctx: JavaParser.BlockStatementContext):
+    def enterBlockStatement(self, ctx: JavaParser.BlockStatementContext):
+        self.indent_level += 1
         statement_start = ctx.start
         self.rewriter.insertBeforeToken(statement_start, f"\n{self._get_indent()}")
-        return self.visitChildren(ctx)
 
-    def visitSwitchLabel(self, ctx: JavaParser.SwitchLabelContext):
+    def exitBlockStatement(self, ctx: JavaParser.BlockStatementContext):
+        self.indent_level -= 1
+
+    def enterSwitchLabel(self, ctx: JavaParser.SwitchLabelContext):
         lable_start = ctx.start
         self.rewriter.insertBeforeToken(lable_start, f"\n{self._get_indent()}")
-        return super().visitSwitchLabel(ctx)
 
-    @handle_indentation
-    def visitSwitchBlockStatementGroup(self, ctx: JavaParser.SwitchBlockStatementGroupContext):
-        return self.visitChildren(ctx)
+    def enterSwitchBlockStatementGroup(self, ctx: JavaParser.SwitchBlockStatementGroupContext):
+        if self.config.indent_switch_case_labels:
+            self.indent_level += 1
+
+    def exitSwitchBlockStatementGroup(self, ctx: JavaParser.SwitchBlockStatementGroupContext):
+        if self.config.indent_switch_case_labels:
+            self.indent_level -= 1
 
-    def visitBlock(self, ctx: JavaParser.BlockContext):
+    def enterBlock(self, ctx: JavaParser.BlockContext):
         open_brace = ctx.LBRACE().getSymbol()
         close_brace = ctx.RBRACE().getSymbol()
-        parent = ctx.parentCtx 
-        in_switch = False
-        while parent:
-            if isinstance(parent, JavaParser.SwitchBlockStatementGroupContext):
-                in_switch = True
-                break
-            if isinstance(parent, JavaParser.FinallyBlockContext):
-                in_switch = True
-                break
-            parent = parent.parentCtx  # Move up the tree
-
-
-        if self.config.brace_style == "attach":
+        in_switch = self.context.in_switch or self.context.in_finally
+
+        if self.config.attach_braces:
             self._remove_whitespace(open_brace.tokenIndex - 1) 
             if in_switch:
                 self.rewriter.replaceSingleToken(open_brace, "{")
@@ -179,12 +154,11 @@ class FormattingVisitor(JavaParserVisitor):
             self.rewriter.replaceSingleToken(open_brace, f"\n{self._get_indent()}" + "{")
         
         self.rewriter.replaceSingleToken(close_brace, f"\n{self._get_indent()}" + "}")
-        return self.visitChildren(ctx)
 
     def _apply_bracket_alignment(self, open_paren, parameters, close_paren, parameter_size):
-        match self.config.aligns['after_open_bracket']:
-            case 'align':
-                max_parameter_size = self.config.aligns['parameters_before_align']
+        match self.config.bracket_alignment:
+            case BracketAlignment.ALIGN:
+                max_parameter_size = self.config.parameters_before_align
                 if not parameter_size > max_parameter_size:
                     return
                 
@@ -192,10 +166,10 @@ class FormattingVisitor(JavaParserVisitor):
                     capture_pos = i * 2
                     parameter = parameters.getChild(capture_pos)
                     align_spaces = self._get_align_spaces(open_paren)
-                    self.rewriter.insertBeforeToken(parameter.start, f"\n{align_spaces}")
+                    self._insert_line_break(parameter.start, align_spaces)
 
-            case 'dont_align':
-                max_parameter_size = self.config.aligns['parameters_before_align']
+            case BracketAlignment.DONT_ALIGN:
+                max_parameter_size = self.config.parameters_before_align
                 if not parameter_size > max_parameter_size:
                     return
 
@@ -203,58 +177,59 @@ class FormattingVisitor(JavaParserVisitor):
                     capture_pos = i * 2
                     parameter = parameters.getChild(capture_pos)
                     self.indent_level += 1
-                    self.rewriter.insertBeforeToken(parameter.start, f"\n{self._get_indent()}")
+                    indent = self._get_indent()
                     self.indent_level -= 1
+                    self._insert_line_break(parameter.start, indent)
 
-            case 'always_break':
+            case BracketAlignment.ALWAYS_BREAK:
                 self.indent_level += 1
-                self.rewriter.insertBeforeToken(parameters.start, f"\n{self._get_indent()}")
+                indent = self._get_indent()
                 self.indent_level -= 1
+                self._insert_line_break(parameters.start, indent)
 
-            case 'block_indent':
+            case BracketAlignment.BLOCK_INDENT:
                 self.indent_level += 1
-                self.rewriter.insertBeforeToken(parameters.start, f"\n{self._get_indent()}")
+                indent = self._get_indent()
                 self.indent_level -= 1
-                self.rewriter.insertBeforeIndex(close_paren.tokenIndex, f"\n{self._get_indent()}")
+                self._insert_line_break(parameters.start, indent)
+                self._insert_line_break(close_paren, self._get_indent())
             
-            case 'all_parameters_on_new_line':
+            case BracketAlignment.ALL_PARAMETERS_ON_NEW_LINE:
                 for i in range(1, parameter_size):
                     capture_pos = i * 2
                     parameter = parameters.getChild(capture_pos)
                     align_spaces = self._get_align_spaces(open_paren)
-                    self.rewriter.insertBeforeToken(parameter.start, f"\n{align_spaces}")
+                    self._insert_line_break(parameter.start, align_spaces)
 
     def _get_align_spaces(self, open_paren):
-        token_stream = self.rewriter.getTokenStream()
-        token_index = open_paren.tokenIndex
-        spacer_length = 0
-        while token_stream.get(token_index).type != JavaParser.WS:
-            spacer_length += len(token_stream.get(token_index).text)
-            token_index -= 1
+        spacer_length = self._get_column_index().end(open_paren.tokenIndex)
+        return " " * (spacer_length + (self.indent_level * self.config.indent_size))
 
-        return " " * (spacer_length + (self.indent_level * self.config.indents['size']))         
+    def _insert_line_break(self, token, indent):
+        self.rewriter.insertBeforeToken(token, f"\n{indent}")
+        self._get_column_index().insert_break(token.tokenIndex, len(indent) - self.indent_level * self.config.indent_size)
+
+    def _get_column_index(self):
+        # The input is a single line, so columns restart after every whitespace token
+        if self.column_index is None:
+            self.column_index = ColumnIndex(self.rewriter.getTokenStream(), boundary_types={JavaParser.WS})
+        return self.column_index
 
     def _remove_whitespace(self, pos):
         while self.rewriter.getTokenStream().get(pos).type in [JavaParser.WS] or self.rewriter.getTokenStream().get(pos).text == "\n":
             self.rewriter.deleteToken(pos)
             pos -=1
 
-    def _sort_modifiers(self, modifiers, order):
-        return sorted(modifiers, key=lambda x: order.index(x) if x in order else len(order))
+    def _sort_modifiers(self, modifiers, rank):
+        return CompiledConfig.sort_modifiers(modifiers, rank)
     
     def _get_indent(self):
-        match self.config.indents['type']:
-            case "spaces":
-                return " " * (self.indent_level * self.config.indents['size'])
-            # may it appear as 8 spaces but it is actually configurable
-            # in text editors so it should be as a size of indent_size
-            case "tabs":
-                return "\t" * self.indent_level
+        return self.config.indent(self.indent_level)
     
     
-    def visitVariableDeclarator(self, ctx: JavaParser.VariableDeclaratorContext):
+    def enterVariableDeclarator(self, ctx: JavaParser.VariableDeclaratorContext):
         if not ctx.ASSIGN():
-            return super().visitVariableDeclarator(ctx)
+            return
         assignment = ctx.ASSIGN().symbol
         if assignment:
             if self.config.space_around_operator:
@@ -270,8 +245,8 @@ class FormattingVisitor(JavaParserVisitor):
                 next_token = self.rewriter.getTokenStream().get(next_token_index)
                 if next_token.type != JavaParser.WS and next_token.text != " ":
                     self.rewriter.insertAfter(assignment.tokenIndex, " ")
-        return super().visitVariableDeclarator(ctx)
-    def visitBinaryOperatorExpression(self, ctx: JavaParser.BinaryOperatorExpressionContext):
+
+    def enterBinaryOperatorExpression(self, ctx: JavaParser.BinaryOperatorExpressionContext):
         if self.config.space_around_operator and ctx.bop:
 
             # get operator token
@@ -290,9 +265,7 @@ class FormattingVisitor(JavaParserVisitor):
             if next_token.type != JavaParser.WS and next_token.text != " ":
                 self.rewriter.insertAfter(operator.tokenIndex, " ")
 
-        return self.visitChildren(ctx)
-
-    def visitUnaryOperatorExpression(self, ctx: JavaParser.UnaryOperatorExpressionContext):
+    def enterUnaryOperatorExpression(self, ctx: JavaParser.UnaryOperatorExpressionContext):
         if self.config.space_around_operator:
             # fore prefix operator 
             if hasattr(ctx, 'prefix') and ctx.prefix:
@@ -303,9 +276,8 @@ class FormattingVisitor(JavaParserVisitor):
                 if ctx.prefix.type not in [JavaParser.INC, JavaParser.DEC]:
                     if next_token.type != JavaParser.WS and next_token.text != " ":
                         self.rewriter.insertAfter(ctx.prefix.tokenIndex, " ")
-        return self.visitChildren(ctx)
 
-    def visitLambdaExpression(self, ctx: JavaParser.LambdaExpressionContext):
+    def enterLambdaExpression(self, ctx: JavaParser.LambdaExpressionContext):
         if self.config.space_around_operator:
             arrow = ctx.ARROW().symbol
             prev_token_index = arrow.tokenIndex - 1
@@ -320,9 +292,8 @@ class FormattingVisitor(JavaParserVisitor):
             next_token = self.rewriter.getTokenStream().get(next_token_index)
             if next_token.type != JavaParser.WS and next_token.text != " ":
                 self.rewriter.insertAfter(arrow.tokenIndex, " ")
-        return self.visitChildren(ctx)
 
-    def visitMethodReferenceExpression(self, ctx: JavaParser.MethodReferenceExpressionContext):
+    def enterMethodReferenceExpression(self, ctx: JavaParser.MethodReferenceExpressionContext):
         if self.config.space_around_operator:
             double_colon = ctx.COLONCOLON().symbol
             prev_token_index = double_colon.tokenIndex - 1
@@ -337,21 +308,25 @@ class FormattingVisitor(JavaParserVisitor):
             next_token = self.rewriter.getTokenStream().get(next_token_index)
             if next_token.type != JavaParser.WS and next_token.text != " ":
                 self.rewriter.insertAfter(double_colon.tokenIndex, " ")
-        return self.visitChildren(ctx)
 
-    def get_formatted_code(self, tree):
+    def rewrite(self, tree, profiler=NULL_PROFILER):
+        """Record every rewrite for the tree without rendering the text."""
+        self.context = VisitorContext()
         self.imports = {
             'items': [],
             'start_index': -1,
             'end_index': -1
         }
 
-        self.visit(tree)
+        with profiler.stage("formatting_visitor"):
+            self.walk(tree)
 
+            if self.config.sort_imports:
+                self._order_imports()
 
-        if self.config.imports['order'] == "sort":
-            self._order_imports()
+    def get_formatted_code(self, tree, profiler=NULL_PROFILER):
+        self.rewrite(tree, profiler)
 
-            
-        formatted_text: str = self.rewriter.getDefaultText()
+        with profiler.stage("formatting_text"):
+            formatted_text: str = self.rewriter.getDefaultText()
         return formatted_text
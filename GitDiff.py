@@ -0,0 +1,97 @@
+import os
+import re
+import subprocess
+
+# "@@ -old_start,old_count +new_start,new_count @@", a missing count meaning 1
+HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+# Deleted files have nothing left to format
+DIFF_FILTER = "--diff-filter=ACMR"
+
+# One escape of a C-quoted path (an octal byte or an escaped character), or a run of plain text
+QUOTED_PART = re.compile(r'\\([0-7]{3}|.)|[^\\]+')
+C_ESCAPES = {"a": b"\a", "b": b"\b", "t": b"\t", "n": b"\n", "v": b"\v", "f": b"\f", "r": b"\r"}
+
+
+class GitError(Exception):
+    """git is missing, or a git command failed (e.g. an unknown base)."""
+
+
+def _git(args, repo):
+    try:
+        completed = subprocess.run(["git", "-C", repo, *args], capture_output=True, text=True, check=True)
+    except FileNotFoundError:
+        raise GitError("git is not installed") from None
+    except subprocess.CalledProcessError as e:
+        raise GitError(e.stderr.strip() or f"git {args[0]} failed") from None
+    return completed.stdout
+
+
+def repo_root(repo="."):
+    return _git(["rev-parse", "--show-toplevel"], repo).strip()
+
+
+def changed_files(base="HEAD", repo="."):
+    """
+    Paths of the .java files of the working tree that differ from base,
+    staged or not. Untracked files are not part of the diff.
+    """
+    root = repo_root(repo)
+    output = _git(["diff", "--name-only", "-z", DIFF_FILTER, base, "--", "*.java"], root)
+    return [os.path.join(root, path) for path in output.split("\0") if path]
+
+
+def _diff_path(name):
+    """
+    The path of a diff's "+++ " line. git C-quotes paths with non-ASCII,
+    control, quote or backslash characters, with octal escapes for the
+    bytes, and ends unquoted paths holding a space with a tab.
+    """
+    if not (name.startswith('"') and name.endswith('"')):
+        return name[:-1] if name.endswith("\t") else name
+    data = b""
+    for match in QUOTED_PART.finditer(name[1:-1]):
+        escape = match.group(1)
+        if escape is None:
+            data += os.fsencode(match.group(0))
+        elif len(escape) == 3:
+            data += bytes([int(escape, 8)])
+        else:
+            data += C_ESCAPES.get(escape, os.fsencode(escape))
+    return os.fsdecode(data)
+
+
+def changed_lines(base="HEAD", repo="."):
+    """
+    {path: [(start, end), ...]} with the 1-based, inclusive line ranges of the
+    working tree's .java files that were added or changed since base. Where
+    lines were only deleted, the two lines around the deletion are given.
+    """
+    root = repo_root(repo)
+    # No context lines, so every hunk is exactly a changed range
+    output = _git(
+        ["diff", "--no-color", "--no-ext-diff", "-U0", "--dst-prefix=b/", DIFF_FILTER, base, "--", "*.java"],
+        root,
+    )
+
+    ranges = {}
+    path = None
+    for line in output.splitlines():
+        if line.startswith("+++ "):
+            name = _diff_path(line[len("+++ "):])
+            path = os.path.join(root, name[len("b/"):]) if name.startswith("b/") else None
+            if path is not None:
+                ranges[path] = []
+            continue
+
+        match = HUNK_HEADER.match(line) if path is not None else None
+        if match is None:
+            continue
+        start = int(match.group(1))
+        count = int(match.group(2)) if match.group(2) is not None else 1
+        if count == 0:
+            # start is the line before the deletion
+            ranges[path].append((max(start, 1), start + 1))
+        else:
+            ranges[path].append((start, start + count - 1))
+    return ranges
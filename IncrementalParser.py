@@ -0,0 +1,159 @@
+from ErrorLogger import ErrorLogger
+from JavaParser import JavaParser
+from ParserContext import parser_pool
+from TreeWalker import SKIP_CHILDREN
+
+
+def _end_position(token):
+    """Line and column just past the token."""
+    newlines = token.text.count("\n")
+    if newlines:
+        return token.line + newlines, len(token.text) - token.text.rfind("\n") - 1
+    return token.line, token.column + len(token.text)
+
+
+class _MemberCachingLogger(ErrorLogger):
+    """ErrorLogger reusing the errors of members it already checked."""
+
+    def __init__(self, configs, cache):
+        super().__init__(configs)
+        self.cache = cache
+
+    def enterClassBodyDeclaration(self, ctx):
+        cached = self.cache.get(ctx)
+        if cached is None:
+            member_logger = ErrorLogger(self.configs)
+            member_logger.find_errors(ctx)
+            cached = self.cache[ctx] = (member_logger.error_log, member_logger.error_nodes)
+        self.error_log += cached[0]
+        self.error_nodes += cached[1]
+        return SKIP_CHILDREN
+
+
+class IncrementalDocument:
+    """
+    The parse tree and tokens of a text, kept up to date through edits.
+
+    An edit inside a single classBodyDeclaration re-lexes only that member's
+    text, parses it with the classBodyDeclaration rule and splices the new
+    subtree and tokens in place of the old ones. The tokens after it are
+    only shifted, and only the new member is checked for naming errors
+    again. Anything else is a full parse: an edit between members, a member
+    that no longer parses on its own or stops short of its text (e.g. a
+    deleted closing brace), text that would lex differently next to what
+    surrounds it, or a document that has syntax errors.
+
+    Tokens and positions are those of the text as given, not of the
+    whitespace-collapsed text the formatter parses. That is why this only
+    serves the language server's diagnostics: formatting parses the
+    collapsed text, lays each member out by columns and imports taken from
+    the whole file, then parses its own first pass again, so it has no
+    member it could redo alone and runs on the whole text.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.full_parses = 0
+        self.member_parses = 0
+        # ClassBodyDeclarationContext -> (error messages, error nodes)
+        self._lint_cache = {}
+        self._lint_config = None
+        self._full_parse()
+
+    def edit(self, start, end, replacement):
+        """
+        Replace text[start:end] with replacement. Returns the reparsed
+        classBodyDeclaration, or the new tree after a full parse.
+        """
+        self.text = self.text[:start] + replacement + self.text[end:]
+        member = None if self.syntax_errors else self._enclosing_member(start, end)
+        if member is not None:
+            reparsed = self._reparse_member(member, len(replacement) - (end - start))
+            if reparsed is not None:
+                return reparsed
+        return self._full_parse()
+
+    def naming_errors(self, config):
+        """ErrorLogger's messages and name nodes, checking only members changed since the last call."""
+        if config is not self._lint_config:
+            self._lint_cache.clear()
+            self._lint_config = config
+        logger = _MemberCachingLogger(config, self._lint_cache)
+        logger.find_errors(self.tree)
+        return logger.error_log, logger.error_nodes
+
+    def _full_parse(self):
+        errors = []
+        with parser_pool.context() as context:
+            self.tree, self.tokens = context.parse(self.text, errors=errors)
+        self.syntax_errors = errors
+        # Tokens read their text from the input lazily, keep it before offsets move
+        for token in self.tokens.tokens:
+            token.text = token.text
+        self._lint_cache.clear()
+        self.full_parses += 1
+        return self.tree
+
+    def _enclosing_member(self, start, end):
+        """The smallest classBodyDeclaration whose text holds text[start:end] (before the edit)."""
+        member = None
+        node = self.tree
+        while node is not None and node.children:
+            inside = None
+            for child in node.children:
+                first = getattr(child, "start", None) or getattr(child, "symbol", None)
+                last = getattr(child, "stop", None) or getattr(child, "symbol", None)
+                if first is not None and last is not None and first.start <= start and end <= last.stop + 1:
+                    inside = child
+                    break
+            if isinstance(inside, JavaParser.ClassBodyDeclarationContext):
+                member = inside
+            node = inside if hasattr(inside, "children") else None
+        return member
+
+    def _reparse_member(self, member, delta):
+        first, last = member.start, member.stop
+        errors = []
+        with parser_pool.context() as context:
+            new_member, tokens = context.parse(self.text[first.start:last.stop + 1 + delta], errors=errors,
+                                               rule="classBodyDeclaration")
+        new_tokens = tokens.tokens[:-1]
+        # Whitespace or comments at either end would lex differently next to the text around it
+        if errors or not new_tokens or new_member.start is not new_tokens[0] or new_member.stop is not new_tokens[-1]:
+            return None
+
+        # Move the member's tokens to where they are in the document
+        for index, token in enumerate(new_tokens):
+            token.text = token.text
+            if token.line == 1:
+                token.column += first.column
+            token.line += first.line - 1
+            token.start += first.start
+            token.stop += first.start
+            token.tokenIndex = first.tokenIndex + index
+
+        old_end_line, old_end_column = _end_position(last)
+        new_end_line, new_end_column = _end_position(new_tokens[-1])
+        index_delta = len(new_tokens) - (last.tokenIndex - first.tokenIndex + 1)
+        all_tokens = self.tokens.tokens
+        for token in all_tokens[last.tokenIndex + 1:]:
+            if token.line == old_end_line:
+                token.column += new_end_column - old_end_column
+            token.line += new_end_line - old_end_line
+            token.start += delta
+            token.stop += delta
+            token.tokenIndex += index_delta
+        all_tokens[first.tokenIndex:last.tokenIndex + 1] = new_tokens
+
+        parent = member.parentCtx
+        new_member.parentCtx = parent
+        new_member.invokingState = member.invokingState
+        parent.children[next(i for i, child in enumerate(parent.children) if child is member)] = new_member
+
+        # The cached errors of the members around it included the old member's
+        node = member
+        while node is not None:
+            self._lint_cache.pop(node, None)
+            node = node.parentCtx
+        self.member_parses += 1
+        return new_member
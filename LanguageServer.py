@@ -0,0 +1,457 @@
+import argparse
+import bisect
+import contextlib
+import json
+import re
+import sys
+import threading
+from urllib.parse import urlparse, unquote
+from urllib.request import url2pathname
+from ConfigClass import ConfigClass, ConfigError
+from ConfigResolver import ConfigResolver
+from FormatAPI import format_source, format_range, minimal_edits
+from FormatBudget import FormatBudget
+from IncrementalParser import IncrementalDocument
+import testmain
+
+# "line L:C message", as CollectingErrorListener records syntax errors
+SYNTAX_ERROR = re.compile(r"^line (\d+):(\d+) (.*)$", re.S)
+NEWLINE = re.compile(r"\n")
+
+# LSP constants
+SYNC_INCREMENTAL = 2
+SEVERITY_ERROR = 1
+SEVERITY_WARNING = 2
+METHOD_NOT_FOUND = -32601
+INTERNAL_ERROR = -32603
+REQUEST_FAILED = -32803
+
+
+class Rope:
+    """
+    Text kept as a list of chunks of at most CHUNK_SIZE characters and their
+    newline counts. An edit rebuilds only the chunks it touches instead of
+    copying the whole document, and a position is found by skipping whole
+    chunks by their newline counts.
+    """
+
+    CHUNK_SIZE = 1024
+
+    def __init__(self, text=""):
+        self.chunks = []
+        self.newlines = []
+        self._splice(0, 0, text)
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self.chunks)
+
+    def text(self):
+        return "".join(self.chunks)
+
+    def offset(self, line, character):
+        """
+        Character offset of an LSP position: a 0-based line and a column in
+        UTF-16 code units, clamped to the end of the line or of the text.
+        """
+        start = self._line_start(line)
+        if start is None:
+            return len(self)
+        offset = start
+        units = 0
+        for char in self.slice(start, start + character):
+            if char == "\n" or units >= character:
+                break
+            units += 2 if ord(char) > 0xFFFF else 1
+            offset += 1
+        return offset
+
+    def slice(self, start, end):
+        pieces = []
+        position = 0
+        for chunk in self.chunks:
+            chunk_end = position + len(chunk)
+            if chunk_end > start and position < end:
+                pieces.append(chunk[max(start - position, 0):end - position])
+            if chunk_end >= end:
+                break
+            position = chunk_end
+        return "".join(pieces)
+
+    def replace(self, start, end, text):
+        index, position = self._locate(start)
+        last, last_position = self._locate(end)
+        self._splice(index, last + 1, self.chunks[index][:start - position] + text
+                     + self.chunks[last][end - last_position:])
+
+    def _locate(self, offset):
+        """Index and start offset of the chunk holding offset (the last one for the end)."""
+        position = 0
+        for index, chunk in enumerate(self.chunks):
+            if offset < position + len(chunk) or index == len(self.chunks) - 1:
+                return index, position
+            position += len(chunk)
+        return 0, 0
+
+    def _line_start(self, line):
+        position = 0
+        for chunk, newlines in zip(self.chunks, self.newlines):
+            if line <= newlines:
+                at = -1
+                for _ in range(line):
+                    at = chunk.index("\n", at + 1)
+                return position + at + 1
+            line -= newlines
+            position += len(chunk)
+        return None
+
+    def _splice(self, index, last, text):
+        # Fold a short following chunk in, so edits do not leave crumbs behind
+        if last < len(self.chunks) and len(text) % self.CHUNK_SIZE + len(self.chunks[last]) <= self.CHUNK_SIZE:
+            text += self.chunks[last]
+            last += 1
+        chunks = [text[i:i + self.CHUNK_SIZE] for i in range(0, len(text), self.CHUNK_SIZE)] or [""]
+        self.chunks[index:last] = chunks
+        self.newlines[index:last] = [chunk.count("\n") for chunk in chunks]
+
+
+class Document:
+    def __init__(self, uri, text, version):
+        self.uri = uri
+        self.rope = Rope(text)
+        self.version = version
+        # Parse of the text as of the last diagnostics, and the edits made since
+        self.parsed = None
+        self.pending_edits = []
+        self.parse_lock = threading.Lock()
+
+
+def _utf16_length(text):
+    return len(text) + sum(1 for char in text if ord(char) > 0xFFFF)
+
+
+def _line_position(lines, line, column):
+    """LSP position of a 1-based line and a 0-based column in code points."""
+    text = lines[line - 1] if 0 < line <= len(lines) else ""
+    return {"line": max(line - 1, 0), "character": _utf16_length(text[:column])}
+
+
+def text_edits(old, new):
+    """LSP TextEdits turning old into new, from FormatAPI.minimal_edits."""
+    line_starts = [0] + [match.end() for match in NEWLINE.finditer(old)]
+
+    def position(offset):
+        line = bisect.bisect_right(line_starts, offset) - 1
+        return {"line": line, "character": _utf16_length(old[line_starts[line]:offset])}
+
+    return [
+        {"range": {"start": position(start), "end": position(end)}, "newText": replacement}
+        for start, end, replacement in minimal_edits(old, new)
+    ]
+
+
+def read_message(stream):
+    """Read one framed JSON-RPC message, or None at the end of the stream."""
+    length = None
+    while True:
+        header = stream.readline()
+        if not header:
+            return None
+        header = header.decode("ascii").strip()
+        if not header:
+            break
+        name, _, value = header.partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    if length is None:
+        return None
+    return json.loads(stream.read(length).decode("utf-8"))
+
+
+def write_message(stream, message):
+    body = json.dumps(message).encode("utf-8")
+    stream.write(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+    stream.flush()
+
+
+class JavaFormatServer:
+    """
+    Language server answering textDocument/formatting and rangeFormatting
+    and publishing syntax and naming diagnostics. Open documents are kept
+    in Ropes and changed incrementally. Diagnostics are computed
+    debounce seconds after the last change, on a worker thread, from an
+    IncrementalDocument that reparses only the members edited since. All
+    parses go through the shared parser pool, so the warm JavaParser is
+    reused.
+    """
+
+    def __init__(self, reader, writer, debounce=0.3, budget=None):
+        self.reader = reader
+        self.writer = writer
+        self.debounce = debounce
+        self.budget = budget or FormatBudget()
+        self.documents = {}
+        self.timers = {}
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.shutting_down = False
+        # One instance, so the naming errors cached per member stay valid
+        self.default_config = ConfigClass(None)
+        self.client_capabilities = {}
+        self.handlers = {
+            "initialize": self.initialize,
+            "initialized": self.initialized,
+            "shutdown": self.shutdown,
+            "textDocument/didOpen": self.did_open,
+            "textDocument/didChange": self.did_change,
+            "textDocument/didClose": self.did_close,
+            "textDocument/didSave": lambda params: None,
+            "textDocument/formatting": self.formatting,
+            "textDocument/rangeFormatting": self.range_formatting,
+            "workspace/didChangeWatchedFiles": self.did_change_watched_files,
+        }
+
+    def serve(self):
+        """Handle messages until exit or the end of input. Returns the exit code."""
+        # The pipeline prints, which must not end up in the protocol stream
+        with contextlib.redirect_stdout(sys.stderr):
+            while True:
+                message = read_message(self.reader)
+                if message is None:
+                    return 1
+                if message.get("method") == "exit":
+                    self._cancel_timers()
+                    return 0 if self.shutting_down else 1
+                self.handle(message)
+
+    def handle(self, message):
+        method = message.get("method")
+        if method is None:
+            # The client's response to a request of ours, such as registerCapability
+            return
+        handler = self.handlers.get(method)
+        is_request = "id" in message
+        if handler is None:
+            if is_request:
+                self.send({"id": message["id"], "error": {"code": METHOD_NOT_FOUND, "message": f"Unknown method {method}"}})
+            return
+        try:
+            result = handler(message.get("params") or {})
+        except ConfigError as e:
+            if is_request:
+                self.send({"id": message["id"], "error": {"code": REQUEST_FAILED, "message": f"Config error: {str(e)}"}})
+            return
+        except Exception as e:
+            if is_request:
+                self.send({"id": message["id"], "error": {"code": INTERNAL_ERROR, "message": f"{type(e).__name__}: {str(e)}"}})
+            return
+        if is_request:
+            self.send({"id": message["id"], "result": result})
+
+    def send(self, message):
+        with self.write_lock:
+            write_message(self.writer, {"jsonrpc": "2.0", **message})
+
+    def notify(self, method, params):
+        self.send({"method": method, "params": params})
+
+    # Lifecycle
+
+    def initialize(self, params):
+        self.client_capabilities = params.get("capabilities") or {}
+        return {
+            "capabilities": {
+                "textDocumentSync": {"openClose": True, "change": SYNC_INCREMENTAL},
+                "documentFormattingProvider": True,
+                "documentRangeFormattingProvider": True,
+            },
+            "serverInfo": {"name": "javalang-format"},
+        }
+
+    def initialized(self, params):
+        watched_files = self.client_capabilities.get("workspace", {}).get("didChangeWatchedFiles", {})
+        if watched_files.get("dynamicRegistration"):
+            # Config edits change formatting and diagnostics, ask to hear about them
+            self.send({"id": "watch-configs", "method": "client/registerCapability", "params": {"registrations": [{
+                "id": "watch-configs", "method": "workspace/didChangeWatchedFiles",
+                "registerOptions": {"watchers": [{"globPattern": f"**/{ConfigResolver.CONFIG_FILE_NAME}"}]},
+            }]}})
+
+    def shutdown(self, params):
+        self.shutting_down = True
+        self._cancel_timers()
+        return None
+
+    # Workspace
+
+    def did_change_watched_files(self, params):
+        changes = params.get("changes") or []
+        if not any(change["uri"].endswith("/" + ConfigResolver.CONFIG_FILE_NAME) for change in changes):
+            return
+        # The resolved configs are memoized for the whole process
+        testmain.config_resolver.clear()
+        with self.lock:
+            uris = list(self.documents)
+        for uri in uris:
+            self._schedule_diagnostics(uri)
+
+    # Document sync
+
+    def did_open(self, params):
+        item = params["textDocument"]
+        with self.lock:
+            self.documents[item["uri"]] = Document(item["uri"], item["text"], item.get("version"))
+        self._schedule_diagnostics(item["uri"])
+
+    def did_change(self, params):
+        uri = params["textDocument"]["uri"]
+        with self.lock:
+            document = self.documents.get(uri)
+            if document is None:
+                return
+            for change in params["contentChanges"]:
+                if "range" not in change:
+                    document.rope = Rope(change["text"])
+                    document.parsed = None
+                    document.pending_edits = []
+                    continue
+                start, end = change["range"]["start"], change["range"]["end"]
+                rope = document.rope
+                edit = (rope.offset(start["line"], start["character"]),
+                        rope.offset(end["line"], end["character"]), change["text"])
+                rope.replace(*edit)
+                document.pending_edits.append(edit)
+            document.version = params["textDocument"].get("version")
+        self._schedule_diagnostics(uri)
+
+    def did_close(self, params):
+        uri = params["textDocument"]["uri"]
+        with self.lock:
+            self.documents.pop(uri, None)
+            timer = self.timers.pop(uri, None)
+        if timer is not None:
+            timer.cancel()
+        self.notify("textDocument/publishDiagnostics", {"uri": uri, "diagnostics": []})
+
+    def _snapshot(self, uri):
+        with self.lock:
+            document = self.documents.get(uri)
+            if document is None:
+                return None, None
+            return document.rope.text(), document.version
+
+    # Formatting
+
+    def formatting(self, params):
+        text, _ = self._snapshot(params["textDocument"]["uri"])
+        if text is None:
+            return []
+        result = format_source(text, self._config(params["textDocument"]["uri"]), self.budget)
+        return [] if result.skipped else text_edits(text, result.text)
+
+    def range_formatting(self, params):
+        uri = params["textDocument"]["uri"]
+        text, _ = self._snapshot(uri)
+        if text is None:
+            return []
+        start, end = params["range"]["start"], params["range"]["end"]
+        # A range ending at the start of a line does not take that line in
+        end_line = end["line"] if end["character"] == 0 and end["line"] > start["line"] else end["line"] + 1
+        result = format_range(text, start["line"] + 1, end_line, self._config(uri), self.budget)
+        return [] if result.skipped else text_edits(text, result.text)
+
+    def _config(self, uri):
+        parsed = urlparse(uri)
+        if parsed.scheme != "file":
+            return self.default_config
+        # Nearest .java-format.json of the file, like the command line
+        return testmain.resolve_config(url2pathname(unquote(parsed.path)))
+
+    # Diagnostics
+
+    def _schedule_diagnostics(self, uri):
+        timer = threading.Timer(self.debounce, self.publish_diagnostics, (uri,))
+        timer.daemon = True
+        with self.lock:
+            previous = self.timers.get(uri)
+            self.timers[uri] = timer
+        if previous is not None:
+            previous.cancel()
+        timer.start()
+
+    def _cancel_timers(self):
+        with self.lock:
+            timers = list(self.timers.values())
+            self.timers.clear()
+        for timer in timers:
+            timer.cancel()
+
+    def publish_diagnostics(self, uri):
+        with self.lock:
+            document = self.documents.get(uri)
+        if document is None:
+            return
+        try:
+            config = self._config(uri)
+            # Held while the edits are taken and applied, so runs apply them in order
+            with document.parse_lock:
+                with self.lock:
+                    text, version = document.rope.text(), document.version
+                    edits, document.pending_edits = document.pending_edits, []
+                    parsed = document.parsed
+                if parsed is not None:
+                    for edit in edits:
+                        parsed.edit(*edit)
+                # A full replacement raced with this run
+                if parsed is None or parsed.text != text:
+                    parsed = IncrementalDocument(text)
+                document.parsed = parsed
+                diagnostics = self.diagnostics(parsed, config)
+        except ConfigError as e:
+            diagnostics = [{
+                "range": {"start": {"line": 0, "character": 0}, "end": {"line": 0, "character": 0}},
+                "severity": SEVERITY_ERROR, "source": "javalang-format", "message": f"Config error: {str(e)}",
+            }]
+
+        # Changed again while this ran: the newer run will publish
+        if self._snapshot(uri)[1] != version:
+            return
+        self.notify("textDocument/publishDiagnostics", {"uri": uri, "version": version, "diagnostics": diagnostics})
+
+    def diagnostics(self, parsed, config):
+        """
+        Syntax errors, or naming convention violations when the text parses,
+        of an IncrementalDocument. Members unchanged since the last run are
+        not checked again.
+        """
+        lines = parsed.text.split("\n")
+
+        diagnostics = []
+        for error in parsed.syntax_errors:
+            match = SYNTAX_ERROR.match(error)
+            line, column, message = (int(match.group(1)), int(match.group(2)), match.group(3)) if match else (1, 0, error)
+            position = _line_position(lines, line, column)
+            diagnostics.append({
+                "range": {"start": position, "end": position},
+                "severity": SEVERITY_ERROR, "source": "javalang-format", "message": message,
+            })
+        if diagnostics:
+            return diagnostics
+
+        for message, node in zip(*parsed.naming_errors(config)):
+            stop_column = node.stop.column + len(node.stop.text)
+            diagnostics.append({
+                "range": {
+                    "start": _line_position(lines, node.start.line, node.start.column),
+                    "end": _line_position(lines, node.stop.line, stop_column),
+                },
+                "severity": SEVERITY_WARNING, "source": "javalang-format", "message": message,
+            })
+        return diagnostics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Java formatting language server over stdio")
+    parser.add_argument("--debounce", type=float, default=0.3,
+                        help="Seconds without changes before a document's diagnostics are computed")
+    args = parser.parse_args()
+    sys.exit(JavaFormatServer(sys.stdin.buffer, sys.stdout.buffer, args.debounce).serve())
@@ -0,0 +1,366 @@
+import re
+from antlr4 import InputStream
+from JavaLexer import JavaLexer
+
+# Kinds of items in the layout stream
+TEXT = 0
+BREAK = 1
+BEGIN = 2
+END = 3
+# A string literal, cut into "a" + "b" pieces when it does not fit where it is printed
+LITERAL = 4
+# Opening text of the group around each statement of the line
+STATEMENT = ";"
+
+
+class LineBreaker:
+    """
+    Oppen-style pretty printer for a single rendered line of Java.
+
+    The line is re-lexed and turned into a stream of text, break and group
+    items: breaks sit after commas, statements and assignments, before binary
+    operators, declaration keywords and chained calls, and every bracketed
+    list and every statement is a group. Type arguments (<...>) are never
+    broken. A first pass computes the flat width of each group and of each
+    chunk between breaks, a second pass prints the stream and only breaks
+    where the next chunk does not fit, cutting string literals to the room
+    left at the column they are printed at. A trailing // comment stays at
+    the end of the last line. Both passes are linear in the number of tokens.
+    """
+
+    BINARY_OPERATORS = frozenset({
+        JavaLexer.ADD, JavaLexer.SUB, JavaLexer.MUL, JavaLexer.DIV, JavaLexer.MOD,
+        JavaLexer.AND, JavaLexer.OR, JavaLexer.EQUAL, JavaLexer.NOTEQUAL,
+        JavaLexer.LE, JavaLexer.GE, JavaLexer.LT, JavaLexer.GT,
+        JavaLexer.BITAND, JavaLexer.BITOR, JavaLexer.CARET, JavaLexer.QUESTION,
+    })
+
+    # Breaks are allowed after these when whitespace follows them (always after a comma or a '{')
+    BREAK_AFTER = frozenset({JavaLexer.COMMA, JavaLexer.SEMI, JavaLexer.ASSIGN, JavaLexer.LBRACE})
+    BREAK_AFTER_ALWAYS = frozenset({JavaLexer.COMMA, JavaLexer.LBRACE})
+
+    # Breaks are allowed before these declaration keywords
+    BREAK_BEFORE = frozenset({JavaLexer.EXTENDS, JavaLexer.IMPLEMENTS, JavaLexer.THROWS})
+
+    BRACKETS = {
+        JavaLexer.LPAREN: JavaLexer.RPAREN,
+        JavaLexer.LBRACK: JavaLexer.RBRACK,
+        JavaLexer.LBRACE: JavaLexer.RBRACE,
+    }
+
+    CLOSING_BRACKETS = frozenset(BRACKETS.values())
+
+    STRING_WORDS = re.compile(r'\S+\s*|\s+')
+    # Characters of a literal's content, an escape sequence being one
+    STRING_UNITS = re.compile(r'\\u+[0-9a-fA-F]{4}|\\[0-7]{1,3}|\\.|.', re.S)
+
+    # Tokens that can appear inside type arguments, e.g. Map<String, List<? extends Number[]>>
+    TYPE_ARGUMENT_TOKENS = frozenset({
+        JavaLexer.IDENTIFIER, JavaLexer.DOT, JavaLexer.COMMA, JavaLexer.WS, JavaLexer.QUESTION,
+        JavaLexer.EXTENDS, JavaLexer.SUPER, JavaLexer.LBRACK, JavaLexer.RBRACK, JavaLexer.AT,
+        JavaLexer.BOOLEAN, JavaLexer.BYTE, JavaLexer.CHAR, JavaLexer.SHORT, JavaLexer.INT,
+        JavaLexer.LONG, JavaLexer.FLOAT, JavaLexer.DOUBLE, JavaLexer.BITAND,
+    })
+
+    def __init__(self, max_line_length, continuation_width=8):
+        self.max_line_length = max_line_length
+        self.continuation_width = continuation_width
+        # Reset for every line rather than rebuilt, see ParserContext
+        self.lexer = JavaLexer(None)
+        self.lexer.removeErrorListeners()
+
+    def break_line(self, line: str) -> str:
+        if self.max_line_length == -1 or len(line) <= self.max_line_length:
+            return line
+
+        body = line.lstrip(" \t")
+        indent = line[:len(line) - len(body)]
+
+        tokens = self._tokenize(body)
+        if tokens is None:
+            return line
+
+        # A trailing // comment cannot be broken and belongs to the end of the line
+        comment = ""
+        if tokens and tokens[-1].type == JavaLexer.LINE_COMMENT:
+            comment = tokens.pop().text
+            while tokens and tokens[-1].type == JavaLexer.WS:
+                comment = tokens.pop().text + comment
+            if not tokens:
+                return line
+
+        items, inside_bracket = self._build(tokens)
+        # Longer literals are cut on any layout, so only their first word has to fit where they start
+        sizes = self._measure(items, self.max_line_length - len(indent) - self.continuation_width)
+
+        # A line that closes a bracket opened on an earlier line, or that ends in a comma,
+        # is part of a list, so its own breaks line up with it instead of indenting further
+        top_column = len(indent) if inside_bracket else len(indent) + self.continuation_width
+        broken = indent + self._print(items, sizes, indent, top_column)
+        if "\n" in broken:
+            broken = "\n".join(part.rstrip() for part in broken.split("\n"))
+        return broken + comment
+
+    def _tokenize(self, text):
+        self.lexer.inputStream = InputStream(text)
+        tokens = self.lexer.getAllTokens()
+
+        # Leave lines the lexer cannot reproduce exactly (e.g. a string cut by a comment) alone
+        if sum(len(token.text) for token in tokens) != len(text):
+            return None
+        return tokens
+
+    def _type_argument_ends(self, tokens):
+        """
+        Index of the matching '>' for every '<' that opens type arguments: one
+        right after a name with no space around it, up to a '>' closing it
+        through tokens that only appear in types. 'a < b' is a comparison.
+        One pass, with the '<' still open on a stack.
+        """
+        ends = {}
+        # (index, opens type arguments) of every '<' not closed yet
+        open_angles = []
+        for i, token in enumerate(tokens):
+            if token.type == JavaLexer.LT:
+                opens = (0 < i < len(tokens) - 1 and tokens[i - 1].type in (JavaLexer.IDENTIFIER, JavaLexer.DOT)
+                         and tokens[i + 1].type != JavaLexer.WS)
+                if opens or open_angles:
+                    open_angles.append((i, opens))
+            elif token.type == JavaLexer.GT:
+                if open_angles:
+                    start, opens = open_angles.pop()
+                    if opens:
+                        ends[start] = i
+            elif token.type not in self.TYPE_ARGUMENT_TOKENS:
+                # Not a type after all, for any '<' still open
+                open_angles.clear()
+        return ends
+
+    def _build(self, tokens):
+        items = [(BEGIN, None)]
+        closers = []
+        inside_bracket = False
+        pending_space = ""
+        previous_type = None
+        # len(closers) where each open statement group was opened, innermost last
+        statements = []
+        type_arguments = self._type_argument_ends(tokens)
+        # Index of the '>' closing the outermost type arguments being read
+        type_arguments_end = -1
+
+        for i, token in enumerate(tokens):
+            token_type = token.type
+            if token_type == JavaLexer.WS:
+                pending_space += token.text
+                continue
+
+            if i <= type_arguments_end:
+                # Type arguments stay on one line
+                if pending_space:
+                    items.append((TEXT, pending_space))
+            elif previous_type in self.BREAK_AFTER and (pending_space or previous_type in self.BREAK_AFTER_ALWAYS):
+                items.append((BREAK, pending_space))
+            elif (token_type in self.BINARY_OPERATORS and pending_space
+                    and i + 1 < len(tokens) and tokens[i + 1].type == JavaLexer.WS):
+                items.append((BREAK, pending_space))
+            elif token_type in self.BREAK_BEFORE and pending_space:
+                items.append((BREAK, pending_space))
+            elif token_type == JavaLexer.DOT and previous_type == JavaLexer.RPAREN:
+                # Chained call: a().b()
+                items.append((BREAK, pending_space))
+            elif pending_space:
+                items.append((TEXT, pending_space))
+            pending_space = ""
+
+            if closers and closers[-1] == token_type:
+                if statements and statements[-1] == len(closers):
+                    # A statement the closing brace ends without a ';'
+                    statements.pop()
+                    items.append((END, None))
+                closers.pop()
+                items.append((END, None))
+            elif token_type in self.CLOSING_BRACKETS:
+                inside_bracket = True
+
+            in_statements = not closers or closers[-1] == JavaLexer.RBRACE
+            if in_statements and not (statements and statements[-1] == len(closers)):
+                # Each statement (or member, in a class body) is a group, so one that does not
+                # fit moves to the next line whole rather than breaking after its '='
+                items.append((BEGIN, STATEMENT))
+                statements.append(len(closers))
+
+            if i in type_arguments and i > type_arguments_end:
+                type_arguments_end = type_arguments[i]
+
+            if token_type == JavaLexer.STRING_LITERAL:
+                items.append((LITERAL, token.text))
+            else:
+                items.append((TEXT, token.text))
+
+            if token_type in self.BRACKETS:
+                closers.append(self.BRACKETS[token_type])
+                items.append((BEGIN, token.text))
+            elif token_type == JavaLexer.SEMI and statements and statements[-1] == len(closers):
+                items.append((END, None))
+                statements.pop()
+
+            previous_type = token_type
+
+        if previous_type == JavaLexer.COMMA:
+            # A list that goes on past the end of the line
+            inside_bracket = True
+
+        if pending_space:
+            items.append((TEXT, pending_space))
+        for _ in closers + statements:
+            items.append((END, None))
+        items.append((END, None))
+        return items, inside_bracket
+
+    def _measure(self, items, literal_limit):
+        """
+        Compute the flat width of every group and every break chunk.
+        A size runs until the next break at the same or an enclosing level,
+        so it also covers whatever closes the group (e.g. '),'). String
+        literals longer than literal_limit count as their first word.
+        """
+        sizes = [0] * len(items)
+        # (item index, level) of items whose size is still open, innermost last
+        pending = []
+        level = 0
+        total = 0
+
+        for i, (kind, text) in enumerate(items):
+            if kind == TEXT:
+                total += len(text)
+            elif kind == LITERAL:
+                total += len(text) if len(text) <= literal_limit else len(self.STRING_WORDS.match(text, 1).group()) + 1
+            elif kind == BREAK:
+                while pending and pending[-1][1] >= level:
+                    j, _ = pending.pop()
+                    sizes[j] += total
+                pending.append((i, level))
+                sizes[i] = -total
+                total += len(text)
+            elif kind == BEGIN:
+                pending.append((i, level))
+                sizes[i] = -total
+                level += 1
+            else:
+                level -= 1
+
+        for j, _ in pending:
+            sizes[j] += total
+        return sizes
+
+    def _print(self, items, sizes, indent, top_column):
+        width = self.max_line_length
+        indent_width = len(indent)
+        column = indent_width
+        output = []
+        # (continuation column, broken) for each open group
+        blocks = []
+        trailing_widths = self._trailing_widths(items)
+
+        for i, (kind, text) in enumerate(items):
+            if kind == TEXT:
+                output.append(text)
+                column += len(text)
+            elif kind == BREAK:
+                block_column, broken = blocks[-1]
+                if broken and sizes[i] > width - column:
+                    output.append("\n" + indent + " " * (block_column - indent_width))
+                    column = block_column
+                else:
+                    output.append(text)
+                    column += len(text)
+            elif kind == LITERAL:
+                trailing = trailing_widths[i]
+                if column + len(text) + trailing <= width or len(text) <= 2:
+                    output.append(text)
+                    column += len(text)
+                else:
+                    column = self._print_literal(output, text, column, blocks[-1][0], indent, trailing)
+            elif kind == BEGIN:
+                if not blocks:
+                    block_column = top_column
+                elif text == STATEMENT and len(blocks) == 1:
+                    # A statement of the line itself continues where the line's breaks go
+                    block_column = blocks[-1][0]
+                elif text == STATEMENT:
+                    # One inside braces starts where their breaks go and continues deeper
+                    block_column = blocks[-1][0] + self.continuation_width
+                elif text != "{" and column <= width - width // 4:
+                    # Align with the open bracket while there is room for it
+                    block_column = column
+                else:
+                    block_column = blocks[-1][0] + self.continuation_width
+                blocks.append((block_column, sizes[i] > width - column))
+            else:
+                blocks.pop()
+
+        return "".join(output)
+
+    @staticmethod
+    def _trailing_widths(items):
+        """
+        For every item, the width of the text after it up to the next break,
+        which has to share its line. Summed once from the right.
+        """
+        widths = [0] * len(items)
+        width = 0
+        for index in range(len(items) - 1, -1, -1):
+            widths[index] = width
+            kind, text = items[index]
+            if kind == BREAK:
+                width = 0
+            elif kind in (TEXT, LITERAL):
+                width += len(text)
+        return widths
+
+    def _print_literal(self, output, literal, column, block_column, indent, trailing):
+        """
+        Print a string literal that does not fit as "a" + "b" pieces, the first
+        one filling the current line and the others on lines of their own at
+        block_column, or at the continuation indent when a word would not fit
+        there. Every piece leaves room for the trailing text. Returns the
+        column after the last piece.
+        """
+        width = self.max_line_length
+        words = self.STRING_WORDS.findall(literal[1:-1])
+        longest = max(len(word) for word in words)
+        # The quotes, and '+ ' before every piece but the first
+        if width - block_column - 4 - trailing < longest:
+            block_column = min(block_column, len(indent) + self.continuation_width)
+        new_line = "\n" + indent + " " * (block_column - len(indent))
+        first_width = width - column - 2 - trailing
+        # Start on a line of its own rather than cut the first word
+        if len(words[0]) > first_width and column > block_column:
+            output.append(new_line)
+            column = block_column
+            first_width = width - column - 2 - trailing
+        piece_width = max(width - block_column - 4 - trailing, 1)
+
+        pieces = [""]
+        limit = max(first_width, 1)
+        for match in self.STRING_WORDS.finditer(literal[1:-1]):
+            word = match.group()
+            if pieces[-1] and len(pieces[-1]) + len(word) > limit:
+                pieces.append("")
+                limit = piece_width
+            if len(pieces[-1]) + len(word) <= limit:
+                pieces[-1] += word
+                continue
+            # A word longer than a whole piece is cut between characters, never inside an escape
+            for unit in self.STRING_UNITS.findall(word):
+                if pieces[-1] and len(pieces[-1]) + len(unit) > limit:
+                    pieces.append("")
+                    limit = piece_width
+                pieces[-1] += unit
+
+        output.append(f'"{pieces[0]}"')
+        column += len(pieces[0]) + 2
+        for piece in pieces[1:]:
+            output.append(f'{new_line}+ "{piece}"')
+            column = block_column + len(piece) + 4
+        return column
@@ -0,0 +1,93 @@
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+
+class NullProfiler:
+    """Profiler that records nothing, used when profiling is off."""
+
+    def stage(self, name):
+        return nullcontext()
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class MemoryProfiler:
+    """
+    Opt-in per-stage memory accounting with tracemalloc.
+
+    For every stage it records the peak allocated while the stage ran and
+    what the stage left allocated afterwards, both relative to the start of
+    the stage, plus the overall traced peak. With top > 0 it also keeps the
+    allocation sites that grew the most, from snapshots taken around the
+    stage.
+    """
+
+    def __init__(self, top=0):
+        self.top = top
+        self.stages = []
+        self.token_count = 0
+        self.node_count = 0
+        self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+        before = self.top and tracemalloc.take_snapshot()
+        start_current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            record = {
+                "stage": name,
+                "peak_bytes": peak - start_current,
+                "retained_bytes": current - start_current,
+                "total_peak_bytes": peak,
+            }
+            if self.top:
+                after = tracemalloc.take_snapshot()
+                record["top_allocations"] = [
+                    {"site": str(stat.traceback), "size_diff": stat.size_diff, "count_diff": stat.count_diff}
+                    for stat in after.compare_to(before, "lineno")[:self.top]
+                ]
+            self.stages.append(record)
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def count_tokens(self, token_stream):
+        self.token_count = len(token_stream.tokens)
+
+    def count_nodes(self, tree):
+        count = 0
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            count += 1
+            children = getattr(node, "children", None)
+            if children:
+                stack.extend(children)
+        self.node_count = count
+
+    def _retained(self, name):
+        return sum(record["retained_bytes"] for record in self.stages if record["stage"] == name)
+
+    def report(self):
+        report = {
+            "stages": self.stages,
+            "peak_bytes": max((record["total_peak_bytes"] for record in self.stages), default=0),
+            "tokens": self.token_count,
+            "parse_tree_nodes": self.node_count,
+        }
+        if self.token_count:
+            report["bytes_per_token"] = round(self._retained("lex") / self.token_count, 1)
+        if self.node_count:
+            report["bytes_per_node"] = round(self._retained("parse") / self.node_count, 1)
+        return report
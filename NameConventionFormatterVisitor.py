@@ -1,14 +1,16 @@
-from antlr4.TokenStreamRewriter import TokenStreamRewriter
-from JavaParserVisitor import JavaParserVisitor
+from RewriteRenderer import TokenRewriter
+from VisitorContext import VisitorContext
+from TreeWalker import ContextTrackingListener, SKIP_CHILDREN
 from JavaParser import JavaParser
 from PatternTransformer import RegexAnalyzer, RegexRewriter
 import re
 from ConfigClass import ConfigClass
 from StandardNamingConventions import StandardNamingConventions
 
-class NameConventionFormatterVisitor(JavaParserVisitor):
+class NameConventionFormatterVisitor(ContextTrackingListener):
     def __init__(self, tokens, config : ConfigClass):
-        self.rewriter = TokenStreamRewriter(tokens)
+        super().__init__()
+        self.rewriter = TokenRewriter(tokens)
         self.config = config
         self.function_calls = []
         self.regex_analyzer = RegexAnalyzer()
@@ -19,11 +21,12 @@ class NameConventionFormatterVisitor(JavaParserVisitor):
             'end_index': -1
         }
         self.token_stream = tokens
+        self._tokens_by_text = None
 
-    def visitImportDeclaration(self, ctx: JavaParser.ImportDeclarationContext):
+    def enterImportDeclaration(self, ctx: JavaParser.ImportDeclarationContext):
             # Skip processing import statements
-            return None  
-    def visitClassDeclaration(self, ctx: JavaParser.ClassDeclarationContext):
+            return SKIP_CHILDREN
+    def enterClassDeclaration(self, ctx: JavaParser.ClassDeclarationContext):
         class_name = ctx.identifier().getText()
         class_config = self.config.naming_conventions['class']
         class_pattern = self.check_convention(class_config)
@@ -33,9 +36,7 @@ class NameConventionFormatterVisitor(JavaParserVisitor):
             self.rewriter.replaceSingleToken(ctx.identifier().start, new_class_name)
             self.replaceUsage(class_name, new_class_name)
 
-        return self.visitChildren(ctx)
-
-    def visitCreator(self, ctx: JavaParser.CreatorContext):
+    def enterCreator(self, ctx: JavaParser.CreatorContext):
         class_name = ctx.createdName().getText()
         class_config = self.config.naming_conventions['class']
         class_pattern = self.check_convention(class_config)
@@ -45,9 +46,7 @@ class NameConventionFormatterVisitor(JavaParserVisitor):
             self.rewriter.replaceSingleToken(ctx.createdName().start, new_class_name)
             self.replaceUsage(class_name, new_class_name)
 
-        return self.visitChildren(ctx)
-
-    def visitQualifiedName(self, ctx: JavaParser.QualifiedNameContext):
+    def enterQualifiedName(self, ctx: JavaParser.QualifiedNameContext):
         identifiers = ctx.identifier()
         class_config = self.config.naming_conventions['class']
         class_pattern = self.check_convention(class_config)
@@ -60,9 +59,7 @@ class NameConventionFormatterVisitor(JavaParserVisitor):
                 self.rewriter.replaceSingleToken(identifier.start, new_name)
                 self.replaceUsage(name, new_name)
 
-        return self.visitChildren(ctx)
-
-    def visitTypeType(self, ctx: JavaParser.TypeTypeContext):
+    def enterTypeType(self, ctx: JavaParser.TypeTypeContext):
         if ctx.classOrInterfaceType():
             type_name = ctx.classOrInterfaceType().getText()
             class_config = self.config.naming_conventions['class']
@@ -73,9 +70,7 @@ class NameConventionFormatterVisitor(JavaParserVisitor):
                 self.rewriter.replaceSingleToken(ctx.classOrInterfaceType().start, new_type_name)
                 self.replaceUsage(type_name, new_type_name)
 
-        return self.visitChildren(ctx)
-
-    def visitExpression(self, ctx: JavaParser.ExpressionContext):
+    def enterExpression(self, ctx: JavaParser.ExpressionContext):
         if ctx.primary() and ctx.primary().identifier():
             static_call = ctx.primary().identifier().getText()
             class_config = self.config.naming_conventions['class']
@@ -86,9 +81,7 @@ class NameConventionFormatterVisitor(JavaParserVisitor):
                 self.rewriter.replaceSingleToken(ctx.primary().identifier().start, new_static_call)
                 self.replaceUsage(static_call, new_static_call)
 
-        return self.visitChildren(ctx)
-
-    def visitAnnotation(self, ctx: JavaParser.AnnotationContext):
+    def enterAnnotation(self, ctx: JavaParser.AnnotationContext):
         annotation_name = ctx.qualifiedName().getText()
         class_config = self.config.naming_conventions['class']
         class_pattern = self.check_convention(class_config)
@@ -98,9 +91,7 @@ class NameConventionFormatterVisitor(JavaParserVisitor):
             self.rewriter.replaceSingleToken(ctx.qualifiedName().start, new_annotation_name)
             self.replaceUsage(annotation_name, new_annotation_name)
 
-        return self.visitChildren(ctx)
-
-    def visitMethodDeclaration(self, ctx: JavaParser.MethodDeclarationContext):
+    def enterMethodDeclaration(self, ctx: JavaParser.MethodDeclarationContext):
         method_name = ctx.identifier().getText()
         method_config = self.config.naming_conventions['method']
         method_pattern = self.check_convention(method_config)
@@ -112,9 +103,7 @@ class NameConventionFormatterVisitor(JavaParserVisitor):
             self.rewriter.replaceSingleToken(ctx.identifier().start, new_method_name)
             self.replaceUsage(method_name, new_method_name)
 
-        return self.visitChildren(ctx)
-
-    def visitFieldDeclaration(self, ctx: JavaParser.FieldDeclarationContext):
+    def enterFieldDeclaration(self, ctx: JavaParser.FieldDeclarationContext):
         declarators = ctx.variableDeclarators()
         modifiers = [mod.getText() for mod in ctx.parentCtx.parentCtx.modifier()]
         is_static = "static" in modifiers
@@ -139,9 +128,7 @@ class NameConventionFormatterVisitor(JavaParserVisitor):
                     self.rewriter.replaceSingleToken(declarator.variableDeclaratorId().start, new_field_name)
                     self.replaceUsage(field_name, new_field_name)
 
-        return self.visitChildren(ctx)
-
-    def visitLocalVariableDeclaration(self, ctx: JavaParser.LocalVariableDeclarationContext):
+    def enterLocalVariableDeclaration(self, ctx: JavaParser.LocalVariableDeclarationContext):
         declarators = ctx.variableDeclarators()
         variable_config = self.config.naming_conventions['variable']
         variable_pattern = self.check_convention(variable_config)
@@ -154,9 +141,7 @@ class NameConventionFormatterVisitor(JavaParserVisitor):
                 self.rewriter.replaceSingleToken(declarator.variableDeclaratorId().start, new_variable_name)
                 self.replaceUsage(variable_name, new_variable_name)
 
-        return self.visitChildren(ctx)
-
-    def visitVariableDeclarator(self, ctx: JavaParser.VariableDeclaratorContext):
+    def enterVariableDeclarator(self, ctx: JavaParser.VariableDeclaratorContext):
         variable_name = ctx.variableDeclaratorId().getText()
         variable_config = self.config.naming_conventions['variable']
         variable_pattern = self.check_convention(variable_config)
@@ -166,9 +151,7 @@ class NameConventionFormatterVisitor(JavaParserVisitor):
             self.rewriter.replaceSingleToken(ctx.variableDeclaratorId().start, new_variable_name)
             self.replaceUsage(variable_name, new_variable_name)
 
-        return self.visitChildren(ctx)
-
-    def visitFormalParameter(self, ctx: JavaParser.FormalParameterContext):
+    def enterFormalParameter(self, ctx: JavaParser.FormalParameterContext):
         parameter_name = ctx.variableDeclaratorId().getText()
         parameter_config = self.config.naming_conventions['parameter']
         parameter_pattern = self.check_convention(parameter_config)
@@ -178,9 +161,7 @@ class NameConventionFormatterVisitor(JavaParserVisitor):
             self.rewriter.replaceSingleToken(ctx.variableDeclaratorId().start, new_parameter_name)
             self.replaceParameterInMethodBody(ctx, parameter_name, new_parameter_name)
 
-        return self.visitChildren(ctx)
-
-    def visitMethodCall(self, ctx: JavaParser.MethodCallContext):
+    def enterMethodCall(self, ctx: JavaParser.MethodCallContext):
         method_name = ctx.identifier().getText()
         method_config = self.config.naming_conventions['method']
         method_pattern = self.check_convention(method_config)
@@ -191,7 +172,6 @@ class NameConventionFormatterVisitor(JavaParserVisitor):
             self.replaceUsage(method_name, new_method_name)
 
         self.function_calls.append(method_name)
-        return self.visitChildren(ctx)
 
     def _matches(self, input_string, pattern):
         try:
@@ -203,24 +183,28 @@ class NameConventionFormatterVisitor(JavaParserVisitor):
             return False
 
     def replaceUsage(self, old_name, new_name):
-        for token in self.token_stream.tokens:
-            if token.text == old_name:
-                self.rewriter.replaceSingleToken(token, new_name)
+        for token in self._tokens_named(old_name):
+            self.rewriter.replaceSingleToken(token, new_name)
     
     def replaceParameterInMethodBody(self, ctx, old_name, new_name):
         method_body = self.getMethodBody(ctx)
         if method_body:
-            for token in self.rewriter.getTokenStream().tokens:
-                if (token.text == old_name and
-                        method_body.start.tokenIndex <= token.tokenIndex <= method_body.stop.tokenIndex):
+            for token in self._tokens_named(old_name):
+                if method_body.start.tokenIndex <= token.tokenIndex <= method_body.stop.tokenIndex:
                     self.rewriter.replaceSingleToken(token, new_name)
 
+    def _tokens_named(self, name):
+        # Indexed once, so each rename walks its own occurrences rather than the whole stream
+        if self._tokens_by_text is None:
+            self._tokens_by_text = {}
+            for token in self.token_stream.tokens:
+                self._tokens_by_text.setdefault(token.text, []).append(token)
+        return self._tokens_by_text.get(name, ())
+
     def getMethodBody(self, ctx):
-        parent = ctx.parentCtx
-        while parent:
-            if isinstance(parent, JavaParser.MethodDeclarationContext):
-                return parent.methodBody()
-            parent = parent.parentCtx
+        method = self.context.method
+        if method is not None:
+            return method.methodBody()
         return None
     @staticmethod
     def check_convention(convention) -> bool:
@@ -244,8 +228,9 @@ class NameConventionFormatterVisitor(JavaParserVisitor):
             'start_index': -1,
             'end_index': -1
         }
+        self.context = VisitorContext()
 
-        self.visit(tree)
+        self.walk(tree)
 
         if self.config.imports['order'] == "sort":
             self._order_imports()
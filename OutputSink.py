@@ -0,0 +1,91 @@
+import io
+import sys
+
+
+class OutputSink:
+    """
+    Collects emitted text as a list of chunks instead of growing one string.
+    With a stream attached the chunks are written out whenever they add up
+    to chunk_size characters, so memory stays flat however large the output.
+    With strip, leading and trailing whitespace of the whole output is
+    dropped as str.strip() would, trailing whitespace being held back until
+    more text follows it.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, stream=None, chunk_size=CHUNK_SIZE, close_stream=False, strip=False):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.close_stream = close_stream
+        self.strip = strip
+        self.chunks = []
+        self.pending_size = 0
+        # While stripping: whether any text went out, and the whitespace written after it
+        self.started = False
+        self.held = ""
+
+    @classmethod
+    def to_buffer(cls):
+        return cls()
+
+    @classmethod
+    def to_string_io(cls, strip=False):
+        return cls(io.StringIO(), strip=strip)
+
+    @classmethod
+    def to_stdout(cls, strip=False):
+        return cls(sys.stdout, strip=strip)
+
+    @classmethod
+    def to_file(cls, path, strip=False):
+        return cls(open(path, 'w'), close_stream=True, strip=strip)
+
+    def write(self, text):
+        if self.strip:
+            if not self.started:
+                text = text.lstrip()
+            content = text.rstrip()
+            if not content:
+                if self.started:
+                    self.held += text
+                return
+            text, self.held = self.held + content, text[len(content):]
+            self.started = True
+        self.chunks.append(text)
+        self.pending_size += len(text)
+        if self.stream is not None and self.pending_size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.stream is None:
+            return
+        self.stream.write("".join(self.chunks))
+        self.chunks = []
+        self.pending_size = 0
+
+    def getvalue(self):
+        """Everything written so far, for sinks that keep their output in memory."""
+        if self.stream is None:
+            if len(self.chunks) > 1:
+                self.chunks = ["".join(self.chunks)]
+            return self.chunks[0] if self.chunks else ""
+
+        if isinstance(self.stream, io.StringIO):
+            self.flush()
+            return self.stream.getvalue()
+
+        raise ValueError("Output was streamed and is not kept in memory.")
+
+    def close(self):
+        self.flush()
+        if self.close_stream:
+            self.stream.close()
+        elif self.stream is not None:
+            self.stream.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
@@ -0,0 +1,101 @@
+import threading
+from contextlib import contextmanager
+from antlr4 import CommonTokenStream, InputStream
+from antlr4.error.ErrorListener import ErrorListener, ConsoleErrorListener
+from JavaLexer import JavaLexer
+from JavaParser import JavaParser
+from MemoryProfiler import NULL_PROFILER
+
+
+class CollectingErrorListener(ErrorListener):
+    """Keeps syntax errors as "line L:C message" strings instead of printing them."""
+
+    def __init__(self, errors):
+        self.errors = errors
+
+    def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e):
+        self.errors.append(f"line {line}:{column} {msg}")
+
+
+class ParserContext:
+    """
+    A JavaLexer and JavaParser that are reset for every input instead of
+    being rebuilt, so their ATN simulators and prediction caches are kept
+    warm between parses. A fresh token stream is made for every parse, so
+    the trees and tokens of earlier parses stay valid.
+
+    Not thread safe: use one context per thread, e.g. through a ParserPool.
+    """
+
+    def __init__(self):
+        self.lexer = JavaLexer(None)
+        self.parser = JavaParser(None)
+
+    def tokenize(self, code, profiler=NULL_PROFILER, stage_prefix=""):
+        with profiler.stage(stage_prefix + "lex"):
+            self.lexer.inputStream = InputStream(code)
+            tokens = CommonTokenStream(self.lexer)
+            tokens.fill()
+        return tokens
+
+    def parse(self, code, profiler=NULL_PROFILER, budget=None, stage_prefix="", errors=None, rule="compilationUnit"):
+        """
+        Lex and parse a compilation unit, or another rule of the grammar,
+        checking the budget if there is one. The profiler stages are named
+        lex and parse, after stage_prefix. Syntax errors are appended to
+        errors when given, else printed.
+        """
+        if errors is None:
+            return self._parse(code, profiler, budget, stage_prefix, rule)
+
+        collector = CollectingErrorListener(errors)
+        for recognizer in (self.lexer, self.parser):
+            recognizer.removeErrorListeners()
+            recognizer.addErrorListener(collector)
+        try:
+            return self._parse(code, profiler, budget, stage_prefix, rule)
+        finally:
+            for recognizer in (self.lexer, self.parser):
+                recognizer.removeErrorListeners()
+                recognizer.addErrorListener(ConsoleErrorListener.INSTANCE)
+
+    def _parse(self, code, profiler, budget, stage_prefix, rule):
+        tokens = self.tokenize(code, profiler, stage_prefix)
+        if budget is not None:
+            budget.check_tokens(tokens)
+
+        with profiler.stage(stage_prefix + "parse"):
+            self.parser.setTokenStream(tokens)
+            listener = budget.watch_parser(self.parser) if budget is not None else None
+            try:
+                tree = getattr(self.parser, rule)()
+            finally:
+                if listener is not None:
+                    self.parser.removeParseListener(listener)
+
+        if budget is not None:
+            budget.check_depth(tree)
+        return tree, tokens
+
+
+class ParserPool:
+    """Hands out idle ParserContexts, creating one only when none is free."""
+
+    def __init__(self):
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def context(self):
+        with self._lock:
+            context = self._idle.pop() if self._idle else None
+        if context is None:
+            context = ParserContext()
+        try:
+            yield context
+        finally:
+            with self._lock:
+                self._idle.append(context)
+
+
+parser_pool = ParserPool()
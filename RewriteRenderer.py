@@ -0,0 +1,165 @@
+from antlr4.Token import Token
+from antlr4.TokenStreamRewriter import TokenStreamRewriter
+
+
+class _Pieces(list):
+    """Buffer for RewriteOperation.execute, which writes to a stream."""
+    write = list.append
+
+
+def iter_text(rewriter: TokenStreamRewriter, program_name=TokenStreamRewriter.DEFAULT_PROGRAM_NAME):
+    """
+    Yield the rewritten text in pieces, in the order getDefaultText builds
+    it, so a caller that only needs a prefix can stop early.
+    """
+    tokens = rewriter.getTokenStream()
+    rewrites = rewriter.programs.get(program_name)
+    if not rewrites:
+        yield tokens.getText(0, len(tokens.tokens) - 1)
+        return
+
+    index_to_op = rewriter._reduceToSingleOperationPerIndex(rewrites)
+    pieces = _Pieces()
+    i = 0
+    last = len(tokens.tokens)
+    while i < last:
+        op = index_to_op.pop(i, None)
+        if op is None:
+            token = tokens.get(i)
+            if token.type != Token.EOF:
+                yield token.text
+            i += 1
+        else:
+            i = op.execute(pieces)
+            yield from pieces
+            pieces.clear()
+
+    # Inserts after the last token
+    for op in index_to_op.values():
+        if op.index >= last - 1:
+            yield op.text
+
+
+class _LiveCounts:
+    """Fenwick tree over instruction positions, counting the live inserts before a position."""
+
+    def __init__(self, size):
+        self.tree = [0] * (size + 1)
+
+    def add(self, position, delta):
+        position += 1
+        while position < len(self.tree):
+            self.tree[position] += delta
+            position += position & -position
+
+    def before(self, position):
+        total = 0
+        while position > 0:
+            total += self.tree[position]
+            position -= position & -position
+        return total
+
+
+def _keys_between(mapping, first, last):
+    """Keys of mapping in first..last, walking whichever of the two is smaller."""
+    if last - first + 1 <= len(mapping):
+        return [key for key in range(first, last + 1) if key in mapping]
+    return sorted(key for key in mapping if first <= key <= last)
+
+
+def reduce_operations(rewrites):
+    """
+    TokenStreamRewriter._reduceToSingleOperationPerIndex without comparing
+    every operation with all the earlier ones: earlier inserts are found by
+    token index, earlier replaces through the tokens they cover, so the cost
+    follows the operations and their spans instead of their square. It
+    gives the same operations and leaves rewrites in the same state, down
+    to the runtime's insert walk clearing rewrites[k] for the k-th earlier
+    insert rather than that insert itself, which formatted output relies on.
+    Replaces without text are not handled (see TokenRewriter).
+    """
+    InsertBeforeOp = TokenStreamRewriter.InsertBeforeOp
+    InsertAfterOp = TokenStreamRewriter.InsertAfterOp
+
+    # Replaces: fold earlier inserts at their first token into them, drop
+    # earlier inserts inside them and earlier replaces they contain
+    inserts_at = {}
+    # token index -> position of the live replace covering it; live replaces never overlap
+    covered = {}
+    for position, op in enumerate(rewrites):
+        if op is None:
+            continue
+        if isinstance(op, InsertBeforeOp):
+            inserts_at.setdefault(op.index, []).append(position)
+            continue
+
+        for insert_position in inserts_at.pop(op.index, ()):
+            op.text = '{}{}'.format(rewrites[insert_position].text, op.text)
+            rewrites[insert_position] = None
+        if op.last_index > op.index:
+            for index in _keys_between(inserts_at, op.index + 1, op.last_index):
+                for insert_position in inserts_at.pop(index):
+                    rewrites[insert_position] = None
+
+        earlier = sorted({covered[index] for index in _keys_between(covered, op.index, op.last_index)})
+        for replace_position in earlier:
+            previous = rewrites[replace_position]
+            if previous.index < op.index or previous.last_index > op.last_index:
+                raise ValueError("replace op boundaries of {} overlap with previous {}".format(op, previous))
+            rewrites[replace_position] = None
+            for index in range(previous.index, previous.last_index + 1):
+                del covered[index]
+        for index in range(op.index, op.last_index + 1):
+            covered[index] = position
+
+    # Inserts: fold earlier inserts at the same token into them, and them into
+    # an earlier replace starting at their token
+    live_inserts = _LiveCounts(len(rewrites))
+    inserts_at = {}
+    for position, op in enumerate(rewrites):
+        if op is None or not isinstance(op, InsertBeforeOp):
+            continue
+
+        same = [p for p in inserts_at.get(op.index, ()) if rewrites[p] is not None]
+        # Positions among the live earlier inserts, taken before any is cleared
+        ranks = [live_inserts.before(p) for p in same]
+        for previous, rank in zip([rewrites[p] for p in same], ranks):
+            if type(previous) is InsertBeforeOp:
+                op.text += previous.text
+            elif type(previous) is InsertAfterOp:
+                op.text = previous.text + op.text
+            cleared = rewrites[rank]
+            rewrites[rank] = None
+            if cleared is not None and isinstance(cleared, InsertBeforeOp):
+                live_inserts.add(rank, -1)
+
+        replace_position = covered.get(op.index)
+        if replace_position is not None and replace_position < position and rewrites[replace_position] is not None:
+            replace = rewrites[replace_position]
+            if op.index != replace.index:
+                raise ValueError("insert op {} within boundaries of previous {}".format(op, replace))
+            replace.text = op.text + replace.text
+            rewrites[position] = None
+            continue
+
+        live_inserts.add(position, 1)
+        inserts_at.setdefault(op.index, []).append(position)
+
+    reduced = {}
+    for op in rewrites:
+        if op is None:
+            continue
+        if reduced.get(op.index):
+            raise ValueError('should be only one op per index')
+        reduced[op.index] = op
+    return reduced
+
+
+class TokenRewriter(TokenStreamRewriter):
+    """TokenStreamRewriter whose rendering is linear in the number of rewrites, see reduce_operations."""
+
+    def _reduceToSingleOperationPerIndex(self, rewrites):
+        if any(isinstance(op, TokenStreamRewriter.ReplaceOp) and op.text is None for op in rewrites):
+            # Deletes of overlapping ranges merge in ways only the runtime's own walk gives
+            return super()._reduceToSingleOperationPerIndex(rewrites)
+        return reduce_operations(rewrites)
@@ -0,0 +1,88 @@
+import hashlib
+import heapq
+import os
+from GitDiff import GitError, repo_root
+
+
+class ShardError(ValueError):
+    """A --shard value that is not i/n with 1 <= i <= n."""
+
+
+def parse_shard(text):
+    """ "2/4" -> (2, 4), shards being numbered from 1."""
+    index, _, count = text.partition("/")
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise ShardError(f"Invalid shard '{text}', expected i/n such as 1/4") from None
+    if not 1 <= index <= count:
+        raise ShardError(f"Invalid shard '{text}', i must be between 1 and n")
+    return index, count
+
+
+def default_root():
+    """The root of the git repository around the current directory, or the directory itself outside one."""
+    try:
+        return repo_root(".")
+    except GitError:
+        return os.getcwd()
+
+
+def path_key(path, root=None):
+    """
+    Hash of path relative to root (default_root()) in POSIX form, the same
+    on every checkout, machine and Python run whether path is absolute or
+    relative to the current directory.
+    """
+    root = os.path.realpath(root or default_root())
+    relative = os.path.relpath(os.path.realpath(path), root).replace(os.sep, "/")
+    return hashlib.sha1(relative.encode("utf-8")).hexdigest()
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        # Still gets a shard, which reports it as failed
+        return 0
+
+
+def assign_shards(paths, count, size=_size, root=None):
+    """
+    Split paths into count lists with close byte totals: largest files first,
+    each to the shard with the fewest bytes so far, ties going to the lower
+    shard. Files of the same size are taken in path_key order, so every
+    machine given the same files and sizes computes the same split without
+    talking to the others, wherever its checkout (root) is.
+    """
+    root = root or default_root()
+    files = sorted({path: size(path) for path in paths}.items(),
+                   key=lambda item: (-item[1], path_key(item[0], root)))
+    shards = [[] for _ in range(count)]
+    loads = [(0, shard) for shard in range(count)]
+    for path, file_size in files:
+        load, shard = heapq.heappop(loads)
+        shards[shard].append(path)
+        heapq.heappush(loads, (load + file_size, shard))
+    return shards
+
+
+def plan_key(paths, size=_size, root=None):
+    """Fingerprint of the files and sizes a split is made from, equal on every shard of one run."""
+    root = root or default_root()
+    digest = hashlib.sha1()
+    for key, path in sorted((path_key(path, root), path) for path in set(paths)):
+        digest.update(f"{key}:{size(path)}\n".encode("ascii"))
+    return digest.hexdigest()
+
+
+def shard_files(paths, index, count, size=_size, root=None):
+    """The paths of shard index (1-based) of count, in their given order."""
+    mine = set(assign_shards(paths, count, size, root)[index - 1])
+    seen = set()
+    selected = []
+    for path in paths:
+        if path in mine and path not in seen:
+            seen.add(path)
+            selected.append(path)
+    return selected
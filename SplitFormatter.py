@@ -0,0 +1,286 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from antlr4 import Token
+from BatchScheduler import CHUNKS_PER_WORKER
+from ErrorLogger import ErrorLogger
+from FormatAPI import FormatResult, StageTimer, _compile, format_source
+from FormatBudget import BudgetExceeded, FormatBudget
+from JavaLexer import JavaLexer
+from ParserContext import parser_pool
+import testmain
+
+# Below this many tokens a file formats faster in one piece than through a pool
+SPLIT_MIN_TOKENS = 50_000
+
+MODIFIERS = {
+    JavaLexer.PUBLIC, JavaLexer.PROTECTED, JavaLexer.PRIVATE, JavaLexer.STATIC, JavaLexer.ABSTRACT,
+    JavaLexer.FINAL, JavaLexer.NATIVE, JavaLexer.SYNCHRONIZED, JavaLexer.TRANSIENT, JavaLexer.VOLATILE,
+    JavaLexer.STRICTFP, JavaLexer.DEFAULT, JavaLexer.SEALED, JavaLexer.NON_SEALED,
+}
+# Tokens a type can end with, right before a method's name
+TYPE_ENDS = {
+    JavaLexer.IDENTIFIER, JavaLexer.VOID, JavaLexer.BOOLEAN, JavaLexer.BYTE, JavaLexer.CHAR, JavaLexer.SHORT,
+    JavaLexer.INT, JavaLexer.LONG, JavaLexer.FLOAT, JavaLexer.DOUBLE, JavaLexer.GT, JavaLexer.RBRACK,
+}
+
+
+@dataclass
+class Member:
+    """A classBodyDeclaration of the top-level class, found by brace matching."""
+    # Offsets of its first character and just past its last one
+    start: int
+    stop: int
+    tokens: int
+    # Class declarations in it; the visitors indent everything after one a level deeper
+    classes: int
+    # A plain method, which FormattingVisitor always starts on a new line
+    method: bool
+
+
+def _looks_like_method(tokens):
+    """Annotations and modifiers, a type, a name and '(' (not a constructor or generic method)."""
+    index = 0
+    while index < len(tokens):
+        if tokens[index].type == JavaLexer.AT and index + 1 < len(tokens) and tokens[index + 1].type != JavaLexer.INTERFACE:
+            index += 2
+            while index + 1 < len(tokens) and tokens[index].type == JavaLexer.DOT:
+                index += 2
+            if index < len(tokens) and tokens[index].type == JavaLexer.LPAREN:
+                depth = 0
+                while index < len(tokens):
+                    depth += {JavaLexer.LPAREN: 1, JavaLexer.RPAREN: -1}.get(tokens[index].type, 0)
+                    index += 1
+                    if depth == 0:
+                        break
+        elif tokens[index].type in MODIFIERS:
+            index += 1
+        else:
+            break
+
+    if index >= len(tokens) or tokens[index].type == JavaLexer.LT:
+        return False
+    for position in range(index, len(tokens)):
+        if tokens[position].type in (JavaLexer.ASSIGN, JavaLexer.LBRACE, JavaLexer.SEMI):
+            return False
+        if tokens[position].type == JavaLexer.LPAREN:
+            return (position - index >= 2 and tokens[position - 1].type == JavaLexer.IDENTIFIER
+                    and tokens[position - 2].type in TYPE_ENDS)
+    return False
+
+
+def split_members(code):
+    """
+    The members of the only top-level class of code by matching braces over
+    its tokens, without parsing: (offset just past the class's '{', members,
+    offset of its '}'). A member ends at a ';' or a '}' back at the class
+    body's level, unless it is a field whose initializer holds the braces.
+    None when code is not one class whose body ends it (an interface, an
+    enum, several types, unbalanced braces).
+    """
+    with parser_pool.context() as context:
+        tokens = [
+            token for token in context.tokenize(code).tokens
+            if token.channel == Token.DEFAULT_CHANNEL and token.type != Token.EOF
+        ]
+
+    index = 0
+    parens = 0
+    seen_class = False
+    while index < len(tokens) and not (tokens[index].type == JavaLexer.LBRACE and parens == 0):
+        token_type = tokens[index].type
+        parens += {JavaLexer.LPAREN: 1, JavaLexer.RPAREN: -1}.get(token_type, 0)
+        if token_type in (JavaLexer.INTERFACE, JavaLexer.ENUM, JavaLexer.RECORD):
+            return None
+        seen_class = seen_class or (token_type == JavaLexer.CLASS and parens == 0)
+        index += 1
+    if not seen_class or index == len(tokens):
+        return None
+    body_open = tokens[index].stop + 1
+
+    members = []
+    member_start = None
+    depth = parens = 0
+    assigned = False
+    for index in range(index + 1, len(tokens)):
+        token = tokens[index]
+        if member_start is None:
+            if token.type == JavaLexer.RBRACE:
+                # The class's closing brace, which must end the text
+                if index != len(tokens) - 1:
+                    return None
+                return body_open, members, token.start
+            member_start, assigned = index, False
+
+        ends = False
+        if token.type == JavaLexer.LPAREN:
+            parens += 1
+        elif token.type == JavaLexer.RPAREN:
+            parens -= 1
+        elif token.type == JavaLexer.LBRACE:
+            depth += 1
+        elif token.type == JavaLexer.RBRACE:
+            depth -= 1
+            ends = depth == 0 and parens == 0 and not assigned
+        elif token.type == JavaLexer.ASSIGN and depth == 0 and parens == 0:
+            assigned = True
+        elif token.type == JavaLexer.SEMI:
+            ends = depth == 0 and parens == 0
+        if depth < 0 or parens < 0:
+            return None
+
+        if ends:
+            member_tokens = tokens[member_start:index + 1]
+            classes = sum(
+                1 for position, member_token in enumerate(member_tokens)
+                if member_token.type == JavaLexer.CLASS and (position == 0 or member_tokens[position - 1].type != JavaLexer.DOT)
+            )
+            members.append(Member(tokens[member_start].start, token.stop + 1, len(member_tokens), classes,
+                                  _looks_like_method(member_tokens)))
+            member_start = None
+    return None
+
+
+def plan_groups(members, count):
+    """
+    Split members into about count runs of similar token totals, as
+    (first, last) index pairs. A run only starts at a method, so that every
+    cut falls where the formatter starts a new line and long lines never
+    span two runs.
+    """
+    target = sum(member.tokens for member in members) / count
+    groups = []
+    first, size = 0, 0
+    for index, member in enumerate(members):
+        if size >= target and member.method:
+            groups.append((first, index - 1))
+            first, size = index, 0
+        size += member.tokens
+    groups.append((first, len(members) - 1))
+    return groups
+
+
+def _wrap_group(code, body_open, members, body_close, first, last):
+    """
+    The class with only members first to last and a member of context on each
+    side, after an empty class per class declaration before them to give the
+    visitors the indentation they would have reached. Returns the text, the
+    index of members[first] in its body and the number of members there.
+    """
+    head = code[:body_open]
+    offset = 0
+    body_start = body_open
+    if first > 0:
+        padding = sum(member.classes for member in members[:first - 1])
+        head += "".join(f" class __Indent{index} {{ }}" for index in range(padding)) + " "
+        offset = padding + 1
+        body_start = members[first - 1].start
+    if last + 1 < len(members):
+        return head + code[body_start:members[last + 1].stop] + code[body_close:], offset, offset + last - first + 2
+    return head + code[body_start:], offset, offset + last - first + 1
+
+
+def _format_group(wrapper, offset, count, group_size, is_first, is_last, config, budget):
+    """
+    Worker side: format a wrapper and cut its group's text out of the
+    result. Returns (text, diagnostics, timings, problem), problem being why
+    the group could not be formatted on its own.
+    """
+    timer = StageTimer()
+    syntax_errors = []
+    output_errors = []
+    try:
+        with budget.running():
+            tree, tokens, _ = testmain.parse_java_source(wrapper, timer, budget, syntax_errors)
+            if syntax_errors:
+                return None, [], timer.timings, "syntax errors"
+            with timer.stage("lint"):
+                declarations = tree.typeDeclaration(0).classDeclaration().classBody().classBodyDeclaration()
+                logger = ErrorLogger(config)
+                if is_first:
+                    # The class itself and its header, without the member of context after the group
+                    stop = declarations[offset + group_size].start.tokenIndex if not is_last else None
+                    logger.find_errors(tree)
+                    diagnostics = [
+                        error for error, node in zip(logger.error_log, logger.error_nodes)
+                        if stop is None or node.start.tokenIndex < stop
+                    ]
+                else:
+                    diagnostics = [
+                        error for declaration in declarations[offset:offset + group_size]
+                        for error in logger.find_errors(declaration)
+                    ]
+            formatted = testmain.format_code(tree, tokens, config, timer, budget, output_errors)
+    except BudgetExceeded as e:
+        return None, [], timer.timings, f"budget exceeded: {str(e)}"
+
+    split = split_members(formatted)
+    if split is None or len(split[1]) != count:
+        return None, [], timer.timings, "members changed"
+    out = split[1]
+    last = offset + group_size - 1
+    # Cuts must fall on line breaks, or a line of the file would be formatted in two pieces
+    if not is_first and "\n" not in formatted[out[offset - 1].stop:out[offset].start]:
+        return None, [], timer.timings, "no line break before the group"
+    if not is_last and "\n" not in formatted[out[last].stop:out[last + 1].start]:
+        return None, [], timer.timings, "no line break after the group"
+
+    start = 0 if is_first else out[offset - 1].stop
+    stop = len(formatted) if is_last else out[last].stop
+    diagnostics += [f"formatted output: {error}" for error in output_errors]
+    return formatted[start:stop], diagnostics, timer.timings, None
+
+
+def format_split(text, config=None, budget=None, jobs=None, min_tokens=SPLIT_MIN_TOKENS) -> FormatResult:
+    """
+    Format one large class over jobs processes (default: one per CPU). The
+    text is lexed once and cut between top-level members by brace matching;
+    each run of members is formatted in a worker, wrapped in the class's
+    own header with a member of context on each side, and the pieces are
+    joined back. The result is what format_source would give.
+
+    budget applies to every run of members rather than to the whole file.
+    Texts under min_tokens, that are not a single class or whose runs cannot
+    be cut cleanly go through format_source instead.
+    """
+    config = _compile(config)
+    budget = budget or FormatBudget()
+    jobs = jobs or os.cpu_count() or 1
+    start = time.perf_counter()
+
+    timer = StageTimer()
+    with timer.stage("split"):
+        code = testmain.clean_java_source(text)
+        split = split_members(code)
+    if split is None or sum(member.tokens for member in split[1]) < min_tokens:
+        return format_source(text, config, budget)
+    body_open, members, body_close = split
+    groups = plan_groups(members, jobs * CHUNKS_PER_WORKER)
+    if len(groups) < 2:
+        return format_source(text, config, budget)
+
+    calls = []
+    for index, (first, last) in enumerate(groups):
+        wrapper, offset, count = _wrap_group(code, body_open, members, body_close, first, last)
+        calls.append((wrapper, offset, count, last - first + 1, index == 0, index == len(groups) - 1, config, budget))
+
+    with ProcessPoolExecutor(min(jobs, len(calls))) as pool:
+        outcomes = list(pool.map(_format_group, *zip(*calls)))
+
+    pieces = []
+    diagnostics = []
+    for piece, group_diagnostics, timings, problem in outcomes:
+        for stage, seconds in timings.items():
+            timer.timings[stage] = timer.timings.get(stage, 0.0) + seconds
+        if problem is not None and problem.startswith("budget exceeded"):
+            timer.timings["total"] = time.perf_counter() - start
+            return FormatResult(text, [], timer.timings, skipped=problem)
+        if problem is not None:
+            # A syntax error, or a cut the formatter did not put on a line break
+            return format_source(text, config, budget)
+        pieces.append(piece)
+        diagnostics += group_diagnostics
+
+    timer.timings["total"] = time.perf_counter() - start
+    return FormatResult("".join(pieces), diagnostics, timer.timings)
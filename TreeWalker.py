@@ -0,0 +1,74 @@
+from antlr4.tree.Tree import TerminalNodeImpl, ErrorNodeImpl
+from VisitorContext import VisitorContext
+
+# Returned by an enter callback to leave the node's children out of the walk
+SKIP_CHILDREN = object()
+
+TERMINALS = (TerminalNodeImpl, ErrorNodeImpl)
+
+
+class TreeWalker:
+    """
+    Walks a parse tree with an explicit stack, calling enterX(ctx) before a
+    node's children and exitX(ctx) after them, X being the rule or label
+    name like the visitor's visitX. The Python stack stays flat however deep
+    the tree, and a node costs at most its two callbacks: the callbacks of a
+    listener class are looked up once per context type and cached.
+
+    The listener's VisitorContext is entered after enterX and left before
+    exitX, the same points at which a visitor's visitChildren moves it.
+    """
+
+    # listener class -> {context class: (enter, exit)}
+    _dispatch = {}
+
+    def walk(self, listener, tree):
+        handlers = self._dispatch.setdefault(type(listener), {})
+        context = listener.context
+        tracked = context.KINDS
+        stack = [tree]
+
+        while stack:
+            node = stack.pop()
+            node_type = type(node)
+
+            if node_type is tuple:
+                exit, node, kind = node
+                if kind is not None:
+                    context.exit(kind)
+                if exit is not None:
+                    exit(listener, node)
+                continue
+
+            if node_type in TERMINALS:
+                continue
+
+            callbacks = handlers.get(node_type)
+            if callbacks is None:
+                callbacks = handlers[node_type] = self._callbacks(type(listener), node_type)
+            enter, exit = callbacks
+
+            if enter is not None and enter(listener, node) is SKIP_CHILDREN:
+                continue
+
+            kind = context.enter(node) if node_type in tracked else None
+            if exit is not None or kind is not None:
+                stack.append((exit, node, kind))
+
+            if node.children:
+                stack.extend(reversed(node.children))
+
+    @staticmethod
+    def _callbacks(listener_type, node_type):
+        rule = node_type.__name__.removesuffix("Context")
+        return getattr(listener_type, "enter" + rule, None), getattr(listener_type, "exit" + rule, None)
+
+
+class ContextTrackingListener:
+    """Base for passes run by TreeWalker, with the VisitorContext it maintains."""
+
+    def __init__(self):
+        self.context = VisitorContext()
+
+    def walk(self, tree):
+        TreeWalker().walk(self, tree)
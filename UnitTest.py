@@ -3,7 +3,33 @@ from antlr4 import CommonTokenStream, InputStream
 from JavaLexer import JavaLexer
 from JavaParser import JavaParser
 from FormattingVisitor import FormattingVisitor
-from ConfigClass import ConfigClass
+from AlignmentVisitor import AlignmentVisitor
+from ConfigClass import ConfigClass, ConfigError, CompiledConfig, BraceStyle, ImportOrder
+from ConfigResolver import ConfigResolver
+from LineBreaker import LineBreaker
+from ColumnIndex import ColumnIndex
+from VisitorContext import ContextTrackingVisitor
+from TreeWalker import ContextTrackingListener, SKIP_CHILDREN
+from OutputSink import OutputSink
+from MemoryProfiler import MemoryProfiler
+from FormatBudget import FormatBudget
+from ParserContext import ParserContext, ParserPool
+from FormatAPI import format_source, format_many, format_range, minimal_edits, apply_edits
+from LanguageServer import JavaFormatServer, Rope, read_message, write_message
+from IncrementalParser import IncrementalDocument
+from FileWatcher import PollingWatcher
+from Sharding import ShardError, assign_shards, parse_shard, plan_key, shard_files
+from BatchScheduler import CostCache, plan_chunks, run_scheduled
+from WorkQueue import WorkQueue
+from SplitFormatter import format_split, plan_groups, split_members
+import testmain
+import GitDiff
+import main
+import io
+import os
+import shutil
+import subprocess
+import sys
 import textwrap
 import logging
 import re
@@ -846,4 +872,818 @@ def test_align_open_brackets(config):
         assert "int e, int f)" in formatted
     except AssertionError:
         logger.warning("Align open brackets test failed, but continuing...")
-        raise
\ No newline at end of file
+        raise
+
+def test_compiled_config_tables(config):
+    config.indents["type"] = "spaces"
+    config.indents["size"] = 2
+    compiled = config.compile()
+
+    assert compiled.indent(3) == "      "
+    assert compiled.indent(100) == "  " * 100
+    assert compiled.sort_modifiers(["final", "static", "public"], compiled.class_modifier_rank) == ["public", "static", "final"]
+
+def test_config_compiles_once_until_changed(config):
+    compiled = config.compile()
+    assert CompiledConfig.from_config(config) is compiled
+    assert FormattingVisitor(None, config).config is compiled
+    assert AlignmentVisitor(None, config).config is compiled
+
+    config.indents["size"] = 2
+    assert config.compile() is not compiled
+    assert config.compile().indent(1) == "  "
+
+def test_compiled_config_rejects_invalid_values(config):
+    config.indents["type"] = "dots"
+
+    with pytest.raises(ConfigError):
+        config.compile()
+
+def test_compiled_config_accepts_only_the_legacy_aliases(config):
+    config.brace_style = "new_line"
+    config.imports["order"] = "none"
+    compiled = config.compile()
+    assert compiled.brace_style is BraceStyle.BREAK
+    assert compiled.import_order is ImportOrder.PRESERVE
+
+    for value in (None, False, "off", "None"):
+        config.imports["order"] = value
+        with pytest.raises(ConfigError):
+            config.compile()
+    config.imports["order"] = "none"
+    config.brace_style = None
+    with pytest.raises(ConfigError):
+        config.compile()
+
+def test_config_resolver_uses_nearest_config(tmp_path):
+    (tmp_path / ".java-format.json").write_text('{"brace_style": "attach"}')
+    nested = tmp_path / "module" / "src"
+    nested.mkdir(parents=True)
+    (tmp_path / "module" / ".java-format.json").write_text('{"indents": {"size": 2}}')
+
+    resolver = ConfigResolver()
+    nested_config = resolver.resolve(str(nested / "A.java"))
+    root_config = resolver.resolve(str(tmp_path / "B.java"))
+
+    assert nested_config.indents["size"] == 2
+    assert nested_config.brace_style == "break"
+    assert root_config.brace_style == "attach"
+    assert resolver.resolve(str(nested / "C.java")) is nested_config
+
+def test_config_resolver_raises_config_error(tmp_path):
+    (tmp_path / ".java-format.json").write_text('{"brace_style": ')
+
+    with pytest.raises(ConfigError):
+        ConfigResolver().resolve(str(tmp_path / "A.java"))
+
+def test_line_breaker_breaks_after_commas():
+    breaker = LineBreaker(40)
+    line = "    compute(firstValue, secondValue, thirdValue);"
+
+    broken = breaker.break_line(line)
+
+    assert broken == "    compute(firstValue, secondValue,\n            thirdValue);"
+    assert all(len(part) <= 40 for part in broken.split("\n"))
+
+def test_line_breaker_keeps_string_content():
+    breaker = LineBreaker(40)
+    line = '    s = "This is a very long string that should be split";'
+
+    broken = breaker.break_line(line)
+    pieces = re.findall(r'"([^"]*)"', broken)
+
+    assert "".join(pieces) == "This is a very long string that should be split"
+    assert "\n" in broken
+
+def test_line_breaker_fits_split_literals_to_their_column():
+    breaker = LineBreaker(80)
+    line = ('        System.out.println("This is a really long line that definitely exceeds 100 characters'
+            ' for testing purposes in your Java formatter tool.");')
+
+    broken = breaker.break_line(line)
+    pieces = re.findall(r'"([^"]*)"', broken)
+
+    assert all(len(part) <= 80 for part in broken.split("\n"))
+    assert "".join(pieces).startswith("This is a really long line that definitely exceeds 100 characters")
+    assert broken.endswith('tool.");')
+
+def test_line_breaker_keeps_generics_statements_and_comments_whole():
+    breaker = LineBreaker(40)
+
+    generic = breaker.break_line("    private Map<String, List<Integer>> valuesByName;")
+    assert "Map<String, List<Integer>>" in generic
+
+    fields = breaker.break_line("    double field1 = 3.0; double field2 = 4.0; double field3 = 5.0;")
+    assert all(not part.rstrip().endswith("=") for part in fields.split("\n"))
+    assert all(len(part) <= 40 for part in fields.split("\n"))
+
+    commented = breaker.break_line("    compute(firstValue, secondValue, thirdValue); // why")
+    assert commented.endswith("thirdValue); // why")
+
+    # Members in a class body move whole too, and broken lines keep no trailing spaces
+    members = LineBreaker(80).break_line(
+        "public class Fields {private double field1 = 3.0; private double field2 = 4.0; private double field3 = 5.0; "
+    )
+    assert all(not part.endswith(("=", " ")) for part in members.split("\n"))
+    assert "private double field3 = 5.0;" in members
+
+def test_column_index_follows_inserted_breaks():
+    token_stream = CommonTokenStream(JavaLexer(InputStream("foo(a, bar(b, c));")))
+    token_stream.fill()
+    index = ColumnIndex(token_stream)
+    tokens = token_stream.tokens
+    bar = next(token for token in tokens if token.text == "bar")
+    bar_paren = tokens[bar.tokenIndex + 1]
+
+    assert index.end(bar_paren.tokenIndex) == 11
+
+    index.insert_break(bar.tokenIndex, 4)
+
+    assert index.column(bar.tokenIndex) == 4
+    assert index.end(bar_paren.tokenIndex) == 8
+    assert index.column(0) == 0
+
+def test_max_line_length_pass_only_touches_long_lines(config):
+    config.max_line_length = 40
+    aligner = AlignmentVisitor(CommonTokenStream(JavaLexer(InputStream(""))), config)
+    short = "    int x = 1; \n\n    int y = 2;"
+
+    assert aligner._apply_max_line_length(short) is short
+
+    text = short + "\n    compute(firstValue, secondValue, thirdValue);\n" + short
+    result = aligner._apply_max_line_length(text)
+
+    assert result.startswith(short + "\n    compute(firstValue, secondValue,\n")
+    assert result.endswith("thirdValue);\n" + short)
+
+def test_visitor_context_tracks_enclosing_constructs():
+    java_code = "class A { void m() { switch (x) { case 1: { foo(); } } try { } finally { bar(() -> { baz(); }); } } }"
+    token_stream = CommonTokenStream(JavaLexer(InputStream(java_code)))
+    tree = JavaParser(token_stream).compilationUnit()
+    seen = {}
+
+    class Recorder(ContextTrackingVisitor):
+        def visitMethodCall(self, ctx):
+            seen[ctx.identifier().getText()] = (self.context.in_switch, self.context.in_finally,
+                                                self.context.in_lambda, self.context.depth)
+            return self.visitChildren(ctx)
+
+    Recorder().visit(tree)
+
+    assert seen["foo"] == (True, False, False, 3)
+    assert seen["bar"] == (False, True, False, 3)
+    assert seen["baz"] == (False, True, True, 4)
+
+def test_tree_walker_matches_visitor_order_without_recursion():
+    java_code = "class A { void m() { switch (x) { case 1: { foo(); } } try { } finally { bar(() -> { baz(); }); } } }"
+    token_stream = CommonTokenStream(JavaLexer(InputStream(java_code)))
+    tree = JavaParser(token_stream).compilationUnit()
+    events = []
+    seen = {}
+
+    class Recorder(ContextTrackingListener):
+        def enterMethodCall(self, ctx):
+            name = ctx.identifier().getText()
+            events.append("enter " + name)
+            seen[name] = (self.context.in_switch, self.context.in_finally,
+                          self.context.in_lambda, self.context.depth)
+            if name == "bar":
+                return SKIP_CHILDREN
+
+        def exitMethodCall(self, ctx):
+            events.append("exit " + ctx.identifier().getText())
+
+    Recorder().walk(tree)
+
+    assert events == ["enter foo", "exit foo", "enter bar"]
+    assert seen["foo"] == (True, False, False, 3)
+    assert seen["bar"] == (False, True, False, 3)
+
+    # A chain this long nests one tree level per operator, far past the recursion limit
+    java_code = "class B { String s = " + " + ".join(f'"a{i}"' for i in range(3000)) + "; }"
+    token_stream = CommonTokenStream(JavaLexer(InputStream(java_code)))
+    tree = JavaParser(token_stream).compilationUnit()
+    formatter = FormattingVisitor(token_stream, ConfigClass(None))
+    formatter.walk(tree)
+    assert formatter.indent_level == 1
+
+def test_output_sink_flushes_in_chunks():
+    stream = io.StringIO()
+    sink = OutputSink(stream, chunk_size=8)
+
+    sink.write("abc")
+    assert stream.getvalue() == ""
+
+    sink.write("defghi")
+    assert stream.getvalue() == "abcdefghi"
+
+    sink.write("j")
+    sink.close()
+    assert stream.getvalue() == "abcdefghij"
+    assert OutputSink.to_string_io().getvalue() == ""
+
+def test_streamed_format_is_stripped_like_the_buffered_one():
+    code = "public class A { void f() { int x = 1; } }"
+    buffered = main.format_java_code(code, {})
+
+    stream = io.StringIO()
+    assert main.format_java_code(code, {}, OutputSink(stream, chunk_size=4, strip=True)) is None
+    assert stream.getvalue() == buffered
+
+    sink = OutputSink.to_string_io(strip=True)
+    assert main.format_java_code(code, {}, sink) is None
+    assert sink.getvalue() == buffered
+
+    # The caller's sink is written as it was set up
+    sink = OutputSink.to_string_io()
+    main.format_java_code(code, {}, sink)
+    assert not sink.strip
+    assert sink.getvalue() != buffered and sink.getvalue().strip() == buffered
+
+def test_memory_profiler_reports_stages():
+    code = "public class A { void f() { int x = 1; } }"
+    profiler = MemoryProfiler(top=1)
+    try:
+        with profiler.stage("lex"):
+            tokens = CommonTokenStream(JavaLexer(InputStream(code)))
+            tokens.fill()
+        with profiler.stage("parse"):
+            tree = JavaParser(tokens).compilationUnit()
+        profiler.count_tokens(tokens)
+        profiler.count_nodes(tree)
+        FormattingVisitor(tokens, ConfigClass(None)).get_formatted_code(tree, profiler)
+    finally:
+        profiler.stop()
+
+    report = profiler.report()
+    assert [record["stage"] for record in report["stages"]] == ["lex", "parse", "formatting_visitor", "formatting_text"]
+    assert report["tokens"] == len(tokens.tokens)
+    assert report["parse_tree_nodes"] > report["tokens"] // 2
+    assert report["peak_bytes"] > 0
+    assert "bytes_per_token" in report and "bytes_per_node" in report
+    assert len(report["stages"][0]["top_allocations"]) == 1
+
+def test_budget_skips_pathological_files(tmp_path, capsys):
+    concatenation = tmp_path / "Concat.java"
+    concatenation.write_text("public class Concat { String s = " + " + ".join(f'"a{i}"' for i in range(200)) + "; }")
+    small = tmp_path / "Small.java"
+    small.write_text("public class Small { int x = 1; }")
+
+    budget = FormatBudget(max_seconds=None, max_depth=100, max_tokens=None)
+    results, summary = testmain.run_files([str(concatenation), str(small)], budget=budget)
+
+    assert [result["status"] for result in results] == ["skipped", "formatted"]
+    assert results[0]["limit"] == "depth"
+    assert concatenation.read_text().count("\n") == 0  # left untouched
+    assert summary["skipped"] == 1 and summary["budget_exceeded"] == {"depth": 1}
+
+    results, summary = testmain.run_files([str(small)], budget=FormatBudget(max_tokens=5))
+    assert summary["budget_exceeded"] == {"tokens": 1}
+
+def test_parser_context_reuses_lexer_and_parser():
+    context = ParserContext()
+    lexer, parser = context.lexer, context.parser
+
+    first_tree, first_tokens = context.parse("class A { int x = 1; }")
+    budget = FormatBudget()
+    with budget.running():
+        second_tree, second_tokens = context.parse("class B { void f() { g(); } }", budget=budget)
+
+    assert (context.lexer, context.parser) == (lexer, parser)
+    assert not context.parser.getParseListeners()
+    # Earlier results are not disturbed by the next parse
+    assert first_tree.getText() == "classA{intx=1;}<EOF>"
+    assert [token.text for token in first_tokens.tokens[:3]] == ["class", " ", "A"]
+    assert second_tree.getText() == "classB{voidf(){g();}}<EOF>"
+    assert second_tokens.tokens[2].line == 1
+
+    pool = ParserPool()
+    with pool.context() as pooled:
+        pass
+    with pool.context() as again:
+        assert again is pooled
+
+def test_format_source_in_memory(tmp_path):
+    code = "class a { void f() { int x=1; } }"
+    result = format_source(code)
+
+    # Same output as the file based pipeline
+    path = tmp_path / "A.java"
+    path.write_text(code)
+    tree, tokens, _ = testmain.parse_java_code(str(path))
+    assert result.text == testmain.format_code(tree, tokens, ConfigClass(None))
+
+    assert result.skipped is None
+    assert result.diagnostics == ["Class name 'a' does not match the naming convention 'pascalcase'"]
+    assert {"parse", "lint", "reparse", "total"} <= result.timings.keys()
+
+    broken = format_source("class A { void f( { } }")
+    assert broken.skipped == "syntax errors"
+    assert broken.text == "class A { void f( { } }"
+    assert broken.diagnostics[0].startswith("line 1:18")
+
+    results = list(format_many(["class A {}", code], config=ConfigClass(None)))
+    assert [result.text for result in results] == ["class A\n{}", result.text]
+
+def test_format_range_leaves_other_lines_alone():
+    code = (
+        "public class Foo {\n"
+        "  public void bar( int x ){\n"
+        "      int y=x+1;\n"
+        "         if(y>2){ y=3; }\n"
+        "    int Bad_name=0;\n"
+        "  }\n"
+        "}\n"
+    )
+    result = format_range(code, 3, 3)
+    lines = result.text.split("\n")
+    assert lines[2] == "        int y = x + 1;"
+    assert lines[:2] + lines[3:] == code.split("\n")[:2] + code.split("\n")[3:]
+    assert result.diagnostics == []
+
+    # Only the naming of the reformatted statements is reported
+    assert format_range(code, 5, 5).diagnostics == [
+        "Local variable name 'Bad_name' does not match the naming convention 'camelcase'"
+    ]
+
+    # Neighbouring statements are reformatted together
+    siblings = format_range(code, 4, 5).text
+    assert siblings.startswith("public class Foo {\n  public void bar( int x ){\n      int y=x+1;\n        if(y > 2)")
+    assert "        int Bad_name = 0;" in siblings
+    assert siblings.endswith("\n  }\n}\n")
+
+    # Reformatting any part of formatted code changes nothing
+    formatted = format_source(code).text
+    assert format_range(formatted, 2, 4).text == formatted
+
+    assert format_range(code, 1, 1).skipped == "no member or statement in range"
+
+def test_format_range_matches_the_full_format_of_its_lines():
+    code = (
+        "public class A {\n"
+        "    void f(int x) {\n"
+        "        if (x>1){\n"
+        "            foo();\n"
+        "        }\n"
+        "        switch (x) {\n"
+        "            case 1:\n"
+        "                if (x > 0) { foo(); }\n"
+        "                break;\n"
+        "        }\n"
+        "        try {\n"
+        "            foo();\n"
+        "        } finally {\n"
+        "            if (x > 0) { bar(); }\n"
+        "        }\n"
+        "    }\n"
+        "}\n"
+    )
+    full = format_source(code).text
+
+    def lines_of(text, first, count):
+        lines = [line.rstrip() for line in text.split("\n")]
+        start = next(index for index, line in enumerate(lines) if line.strip().startswith(first))
+        return lines[start:start + count]
+
+    # Lines holding the header of an if take in the whole if, not just its body
+    for start, end in [(3, 5), (3, 4), (3, 3)]:
+        assert lines_of(format_range(code, start, end).text, "if (x", 4) == lines_of(full, "if (x", 4)
+    # Inside a switch case or a finally block the whole switch or try is formatted
+    assert lines_of(format_range(code, 8, 8).text, "switch", 8) == lines_of(full, "switch", 8)
+    assert lines_of(format_range(code, 14, 14).text, "try", 10) == lines_of(full, "try", 10)
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+def test_git_changed_lines_only_formats_the_change(tmp_path):
+    def git(*args):
+        subprocess.run(["git", "-C", str(tmp_path), "-c", "user.name=t", "-c", "user.email=t@t", *args],
+                       check=True, capture_output=True)
+
+    git("init", "-q")
+    changed = tmp_path / "A.java"
+    changed.write_text("public class A {\n    void f() {\n        int x=1;\n    }\n}\n")
+    untouched = tmp_path / "B.java"
+    untouched.write_text("public class B { void g(){ int y=2; } }\n")
+    git("add", ".")
+    git("commit", "-q", "-m", "base")
+
+    changed.write_text("public class A {\n    void f() {\n        int x=1;\n        int z=x+2;\n    }\n}\n")
+    assert GitDiff.changed_files("HEAD", str(tmp_path)) == [str(changed)]
+    assert GitDiff.changed_lines("HEAD", str(tmp_path)) == {str(changed): [(4, 4)]}
+
+    results, summary = testmain.run_changed("HEAD", str(tmp_path), lines_only=True)
+    assert summary["formatted"] == 1
+    # The new statement is formatted, the old one and the other file are not
+    assert changed.read_text() == "public class A {\n    void f() {\n        int x=1;\n        int z = x + 2;\n    }\n}\n"
+    assert untouched.read_text() == "public class B { void g(){ int y=2; } }\n"
+
+    with pytest.raises(GitDiff.GitError):
+        GitDiff.changed_files("no-such-base", str(tmp_path))
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+def test_git_changed_lines_of_quoted_paths(tmp_path):
+    def git(*args):
+        subprocess.run(["git", "-C", str(tmp_path), "-c", "user.name=t", "-c", "user.email=t@t", *args],
+                       check=True, capture_output=True)
+
+    git("init", "-q")
+    # A space, a non-ASCII letter and a double quote, which git writes unquoted with a tab, or C-quoted
+    files = [tmp_path / name for name in ("My File.java", "Caf\u00e9.java", 'Say"Hi.java')]
+    for path in files:
+        path.write_text("public class A {\n}\n")
+    git("add", ".")
+    git("commit", "-q", "-m", "base")
+
+    for path in files:
+        path.write_text("public class A {\n    int x;\n}\n")
+    assert GitDiff.changed_lines("HEAD", str(tmp_path)) == {str(path): [(2, 2)] for path in files}
+
+def test_rope_edits_and_positions():
+    rope = Rope("class A {\n    int x;\n}\n")
+    rope.replace(rope.offset(1, 8), rope.offset(1, 9), "count")
+    assert rope.text() == "class A {\n    int count;\n}\n"
+    # Positions count UTF-16 code units, so an emoji takes two
+    rope = Rope("// \U0001F600 x\nint y;")
+    assert rope.offset(0, 5) == 4
+    assert rope.offset(0, 99) == rope.offset(1, 0) - 1
+    assert rope.offset(9, 0) == len(rope)
+
+def test_language_server_over_stdio():
+    server = subprocess.Popen([sys.executable, "LanguageServer.py", "--debounce", "0.01"],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    def send(message):
+        write_message(server.stdin, {"jsonrpc": "2.0", **message})
+
+    def receive(matches):
+        while not matches(message := read_message(server.stdout)):
+            pass
+        return message
+
+    try:
+        uri = "untitled:A.java"
+        send({"id": 1, "method": "initialize", "params": {}})
+        assert receive(lambda m: m.get("id") == 1)["result"]["capabilities"]["documentRangeFormattingProvider"]
+        send({"method": "textDocument/didOpen", "params": {"textDocument": {
+            "uri": uri, "languageId": "java", "version": 1, "text": "class A {\n  void f() { int x=1; }\n}\n"}}})
+        send({"method": "textDocument/didChange", "params": {
+            "textDocument": {"uri": uri, "version": 2},
+            "contentChanges": [{"range": {"start": {"line": 1, "character": 17}, "end": {"line": 1, "character": 18}},
+                                "text": "Bad_x"}]}})
+
+        published = receive(lambda m: m.get("method") == "textDocument/publishDiagnostics")["params"]
+        assert published["version"] == 2
+        [diagnostic] = published["diagnostics"]
+        assert diagnostic["range"] == {"start": {"line": 1, "character": 17}, "end": {"line": 1, "character": 22}}
+        assert diagnostic["message"].startswith("Local variable name 'Bad_x'")
+
+        send({"id": 2, "method": "textDocument/rangeFormatting", "params": {
+            "textDocument": {"uri": uri}, "options": {},
+            "range": {"start": {"line": 1, "character": 0}, "end": {"line": 1, "character": 5}}}})
+        assert receive(lambda m: m.get("id") == 2)["result"] == [
+            {"range": {"start": {"line": 1, "character": 22}, "end": {"line": 1, "character": 22}}, "newText": " "},
+            {"range": {"start": {"line": 1, "character": 23}, "end": {"line": 1, "character": 23}}, "newText": " "},
+        ]
+
+        send({"id": 3, "method": "textDocument/formatting", "params": {"textDocument": {"uri": uri}, "options": {}}})
+        edits = receive(lambda m: m.get("id") == 3)["result"]
+        assert edits and all(not edit["newText"].strip() for edit in edits)
+
+        send({"id": 4, "method": "shutdown"})
+        receive(lambda m: m.get("id") == 4)
+        send({"method": "exit"})
+        assert server.wait(10) == 0
+    finally:
+        server.kill()
+        server.stdin.close()
+        server.stdout.close()
+
+def test_format_edits_only_touch_what_changed():
+    code = "class A { void f() { int x=1; } }"
+    result = format_source(code, edits=True)
+    assert apply_edits(code, result.edits) == result.text
+    # Formatting only moves whitespace, so no edit replaces code
+    assert all(not replacement.strip() for _, _, replacement in result.edits)
+
+    formatted = result.text
+    assert format_source(formatted, edits=True).edits == []
+    one_space_off = formatted.replace("x = 1", "x  = 1")
+    start = one_space_off.index("x  =") + 1
+    assert minimal_edits(one_space_off, formatted) == [(start, start + 2, " ")]
+
+    # Every run of changed tokens gets one edit spanning it
+    assert minimal_edits("int a = 1;", "int b = 2;") == [(3, 6, " b "), (7, 9, " 2")]
+    assert format_source("class A {", edits=True).edits == []
+
+    # Changes far apart give one small edit each, not one spanning the file between them
+    body = "".join(f"    void m{index}() {{ int x = {index}; }}\n" for index in range(300))
+    code = "class A {\n    int first;\n" + body + "    int last;\n}\n"
+    changed = code.replace("int first", "long first").replace("int last", "long last")
+    edits = minimal_edits(code, changed)
+    assert len(edits) == 2 and all(end - start <= 10 for start, end, _ in edits)
+    assert apply_edits(code, edits) == changed
+
+def test_incremental_document_reparses_only_the_edited_member():
+    code = "class A {\n    void f() { int x = 1; }\n    int y; int z;\n}\n"
+    document = IncrementalDocument(code)
+    config = CompiledConfig.from_config(ConfigClass(None))
+    assert document.naming_errors(config)[0] == []
+
+    start = code.index("x = 1")
+    member = document.edit(start, start + 1, "Bad_x")
+    assert isinstance(member, JavaParser.ClassBodyDeclarationContext)
+    assert (document.full_parses, document.member_parses) == (1, 1)
+
+    # Same tokens, positions and tree as parsing the edited text from scratch
+    fresh = IncrementalDocument(document.text)
+    def tokens(doc):
+        return [(t.type, t.text, t.line, t.column, t.start, t.stop, t.tokenIndex) for t in doc.tokens.tokens[:-1]]
+    assert tokens(document) == tokens(fresh)
+    assert document.tree.toStringTree() == fresh.tree.toStringTree()
+    messages, nodes = document.naming_errors(config)
+    assert messages == ["Local variable name 'Bad_x' does not match the naming convention 'camelcase'"]
+    assert (nodes[0].start.line, nodes[0].start.column) == (2, 19)
+
+    # Removing a member's closing brace cannot be reparsed on its own
+    brace = document.text.index("}")
+    assert document.edit(brace, brace + 1, "") is document.tree
+    assert document.full_parses == 2 and document.syntax_errors
+
+def test_polling_watcher_debounces_and_ignores_its_own_writes(tmp_path):
+    (tmp_path / "src").mkdir()
+    (tmp_path / ".git").mkdir()
+    source = tmp_path / "src" / "A.java"
+    source.write_text("class A {}")
+    (tmp_path / ".git" / "B.java").write_text("class B {}")
+    (tmp_path / "notes.txt").write_text("not java")
+
+    watcher = PollingWatcher(str(tmp_path), interval=0, debounce=1.0)
+    assert list(watcher.snapshot) == [str(source)]
+    assert watcher.poll(now=0.0) == []
+
+    source.write_text("class A { int x; }")
+    assert watcher.poll(now=10.0) == []
+    # Another save in the burst restarts the wait
+    source.write_text("class A { int x;  }")
+    assert watcher.poll(now=10.5) == []
+    assert watcher.poll(now=11.0) == []
+    assert watcher.poll(now=11.5) == [str(source)]
+
+    new = tmp_path / "src" / "C.java"
+    new.write_text("class C {}")
+    assert watcher.poll(now=20.0) == []
+    assert watcher.poll(now=21.0) == [str(new)]
+
+    # Formatting the file rewrites it, which must not start another round
+    seen = []
+    def on_change(paths):
+        seen.append(paths)
+        for path in paths:
+            with open(path, "w") as file:
+                file.write("class C\n{}")
+    new.write_text("class C { }")
+    watcher.debounce = 0
+    rounds = iter(range(3))
+    watcher.run(on_change, should_stop=lambda: next(rounds, None) is None)
+    assert seen == [[str(new)]]
+
+def test_config_edits_reach_the_watcher_and_the_language_server(tmp_path):
+    config_path = tmp_path / ".java-format.json"
+    config_path.write_text('{"brace_style": "break"}')
+    source = tmp_path / "A.java"
+    source.write_text("class A {}")
+
+    watcher = PollingWatcher(str(tmp_path), interval=0, debounce=0, names=[".java-format.json"])
+    assert sorted(watcher.snapshot) == [str(config_path), str(source)]
+    config_path.write_text('{"brace_style": "attach"}')
+    assert watcher.poll(now=1.0) == [str(config_path)]
+    source.unlink()
+    # Removals are reported too, e.g. a config that no longer applies
+    assert watcher.poll(now=2.0) == [str(source)]
+
+    testmain.config_resolver.clear()
+    server = JavaFormatServer(io.BytesIO(), io.BytesIO())
+    uri = source.as_uri()
+    assert server._config(uri).brace_style == "attach"
+    config_path.write_text('{"brace_style": "break"}')
+    assert server._config(uri).brace_style == "attach"
+    server.handle({"jsonrpc": "2.0", "method": "workspace/didChangeWatchedFiles",
+                   "params": {"changes": [{"uri": config_path.as_uri(), "type": 2}]}})
+    assert server._config(uri).brace_style == "break"
+    testmain.config_resolver.clear()
+
+def test_shards_split_files_by_size_and_merge_back(tmp_path, capsys):
+    sizes = {f"src/F{i}.java": size for i, size in enumerate([900, 500, 400, 300, 300, 200, 100, 100])}
+    shards = assign_shards(list(sizes), 3, size=sizes.get)
+    # Every file in exactly one shard, with close byte totals
+    assert sorted(path for shard in shards for path in shard) == sorted(sizes)
+    totals = [sum(sizes[path] for path in shard) for shard in shards]
+    assert max(totals) - min(totals) <= 100
+    # Same split whatever order the files are listed in
+    assert assign_shards(list(reversed(list(sizes))), 3, size=sizes.get) == shards
+    assert shard_files(list(sizes), 2, 3, size=sizes.get) == [path for path in sizes if path in shards[1]]
+
+    # Checkouts at different places split their files the same way, absolute paths or not
+    equal = [f"src/F{i}.java" for i in range(8)]
+    splits, plans = [], []
+    for root in (tmp_path / "runner1" / "repo", tmp_path / "runner2" / "repo"):
+        absolute = [str(root / path) for path in equal]
+        for path in absolute:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as java_file:
+                java_file.write("class F { }")
+        split = assign_shards(absolute, 2, root=str(root))
+        splits.append([[os.path.relpath(path, root) for path in shard] for shard in split])
+        plans.append(plan_key(absolute, root=str(root)))
+    assert splits[0] == splits[1] and plans[0] == plans[1]
+
+    assert parse_shard("2/3") == (2, 3)
+    for invalid in ("0/3", "4/3", "two/3"):
+        with pytest.raises(ShardError):
+            parse_shard(invalid)
+
+    reports = []
+    for index, paths in enumerate([["b.java", "a.java"], ["c.java"]], start=1):
+        results = [{"path": path, "status": "formatted", "changed": path != "c.java", "diagnostics": ["x"]}
+                   for path in paths]
+        report = tmp_path / f"shard{index}.json"
+        testmain.write_report(str(report), results, testmain.summarize(results), (index, 3), plan="same")
+        reports.append(str(report))
+
+    results, summary = testmain.merge_reports(reports)
+    assert [result["path"] for result in results] == ["a.java", "b.java", "c.java"]
+    assert (summary["files"], summary["formatted"], summary["diagnostics"]) == (3, 3, 3)
+    assert testmain.changed_paths(results) == ["a.java", "b.java"]
+    assert "no report for shard(s) 3/3" in capsys.readouterr().out
+
+def test_batch_scheduler_runs_largest_first_in_chunks(tmp_path):
+    costs = [5, 100, 1, 40, 2, 2, 3]
+    chunks = plan_chunks(costs, jobs=2, chunk_cost=10)
+    # Big files alone and first, small ones together
+    assert chunks == [[1], [3], [0, 6, 4], [5, 2]]
+
+    paths = []
+    for index, size in enumerate([10, 3000, 200]):
+        path = tmp_path / f"F{index}.java"
+        path.write_text("x" * size)
+        paths.append(str(path))
+    results, utilization = run_scheduled(os.path.getsize, [(path,) for path in paths], [10, 3000, 200], jobs=2)
+    assert results == [10, 3000, 200]
+    assert sum(worker["files"] for worker in utilization["workers"]) == 3
+    assert all(0 <= worker["utilization"] <= 1 for worker in utilization["workers"])
+
+    cache_path = tmp_path / "costs.json"
+    cache = CostCache(str(cache_path))
+    assert cache.cost(paths[1]) == 3000 / 4.0
+    cache.update([{"path": paths[1], "tokens": 100}, {"path": paths[0], "status": "failed"}])
+    cache.save()
+    cache = CostCache(str(cache_path))
+    assert cache.cost(paths[1]) == 100
+    # Without a count of its own a file is estimated at the cached bytes per token
+    assert cache.cost(paths[2]) == 200 / 30.0
+
+    # --check records counts too, which changes the estimate
+    source = tmp_path / "Checked.java"
+    source.write_text("public class Checked { int x = 1; }")
+    results, _ = testmain.check_files([str(source)], cost_cache=cache)
+    assert cache.entries[str(source)]["tokens"] == results[0]["tokens"] > 0
+    assert cache.cost(paths[2]) == 200 / ((3000 + source.stat().st_size) / (100 + results[0]["tokens"]))
+
+def test_work_queue_leases_expire_and_retry(tmp_path, monkeypatch):
+    now = [1000.0]
+    queue = WorkQueue(str(tmp_path / "queue.db"), lease_seconds=10, max_attempts=2, clock=lambda: now[0])
+    small, large = tmp_path / "Small.java", tmp_path / "Large.java"
+    small.write_text("class Small { }")
+    large.write_text("class Large { int x = 1; }")
+    assert queue.add([str(small), str(large)]) == 2
+    assert queue.add([str(small)]) == 0
+
+    # Largest first, and a leased file is not handed out again while the lease holds
+    assert queue.lease("a") == str(large)
+    assert queue.lease("b") == str(small)
+    assert queue.lease("c") is None
+    now[0] += 8
+    assert queue.heartbeat("a", str(large))
+    now[0] += 8
+    # b stopped renewing: its file goes to c, and b's late result is dropped
+    assert queue.lease("c") == str(small)
+    assert not queue.complete("b", str(small), {"path": str(small), "status": "formatted"})
+    assert queue.complete("a", str(large), {"path": str(large), "status": "formatted"})
+    now[0] += 20
+    # c died too, which was the last attempt
+    assert queue.lease("d") is None
+    assert queue.counts() == {"pending": 0, "leased": 0, "done": 1, "failed": 1}
+    assert [result["status"] for result in queue.results()] == ["formatted", "failed"]
+
+    # Paths are queued relative to the enqueuer's directory and found from any other
+    queue = WorkQueue(str(tmp_path / "work.db"))
+    monkeypatch.chdir(tmp_path)
+    queue.add(["Small.java", "Missing.java"])
+    monkeypatch.undo()
+    results, summary = testmain.work_queue(queue.db_path, worker="w")
+    assert len(results) == 2 and summary["formatted"] == 1 and summary["failed"] == 1
+    assert queue.counts()["done"] == 2
+    assert small.read_text() != "class Small { }"
+
+    # A worker with failed files exits with an error, as --check does
+    large.write_text("class Large { int x = 1; }")
+    queue = WorkQueue(str(tmp_path / "failing.db"))
+    queue.add([str(large), str(tmp_path / "Missing.java")])
+    worker = subprocess.run([sys.executable, "testmain.py", "--worker", queue.db_path], capture_output=True, text=True)
+    assert worker.returncode == 1
+
+def test_split_format_matches_formatting_in_one_piece():
+    members = [
+        "int[] a = {1, 2};",
+        "Runnable r = () -> { run(); };",
+        "class Inner { int q; }",
+        "void first(int a) { if (a > 1) { call(a); } }",
+        "static { init(); }",
+        "<T> T generic(T t) { return t; }",
+        "int Bad_name() { return 1; }",
+        "void last() { other(); }",
+    ]
+    code = "package p; public class A { " + " ".join(members) + " }"
+    body_open, found, body_close = split_members(code)
+    assert [code[member.start:member.stop] for member in found] == members
+    assert code[body_close] == "}" and [member.classes for member in found] == [0, 0, 1, 0, 0, 0, 0, 0]
+    # Runs only start at plain methods, where the formatter starts a new line
+    assert [member.method for member in found] == [False, False, False, True, False, False, True, True]
+    assert plan_groups(found, 4) == [(0, 2), (3, 5), (6, 7)]
+    assert split_members("interface I { void f(); }") is None
+
+    text = code.replace("; ", ";\n  ")
+    expected = format_source(text)
+    result = format_split(text, jobs=2, min_tokens=0)
+    assert result.text == expected.text
+    assert result.diagnostics == expected.diagnostics
+
+def test_check_mode_reports_without_writing(tmp_path, monkeypatch):
+    code = "class A { void f() { int x=1; } }"
+    formatted = format_source(code).text
+    assert testmain.check_code(formatted, ConfigClass(None))
+    assert not testmain.check_code(code, ConfigClass(None))
+
+    unformatted = tmp_path / "A.java"
+    unformatted.write_text(code)
+    clean = tmp_path / "B.java"
+    clean.write_text(formatted)
+
+    writes = []
+    monkeypatch.setattr(testmain.FileHandler, "write", lambda self, content: writes.append(content))
+    results, summary = testmain.check_files([str(unformatted), str(clean)])
+
+    assert [result["status"] for result in results] == ["changed", "unchanged"]
+    assert summary["changed"] == 1 and summary["unchanged"] == 1
+    assert writes == []
+    assert unformatted.read_text() == code
+
+def test_token_rewriter_matches_the_runtime_reduction():
+    import random
+    from antlr4.TokenStreamRewriter import TokenStreamRewriter
+    from RewriteRenderer import TokenRewriter
+
+    tokens = CommonTokenStream(JavaLexer(InputStream("class A { void f ( int x ) { g ( x , y ) ; } }")))
+    tokens.fill()
+    last = len(tokens.tokens) - 2
+
+    def render(rewriter_class, program):
+        rewriter = rewriter_class(tokens)
+        for kind, start, stop, text in program:
+            if kind == "before":
+                rewriter.insertBeforeIndex(start, text)
+            elif kind == "after":
+                rewriter.insertAfter(start, text)
+            else:
+                rewriter.replaceRange(start, stop, text)
+        try:
+            text = rewriter.getDefaultText()
+        except ValueError as error:
+            return str(error)
+        return text, [op and (type(op), op.index, op.text) for op in rewriter.programs[rewriter.DEFAULT_PROGRAM_NAME]]
+
+    rng = random.Random(0)
+    for _ in range(2000):
+        program = []
+        for position in range(rng.randint(1, 10)):
+            start = rng.randint(0, last)
+            stop = min(last, start + rng.choice([0, 0, 1, 3]))
+            program.append((rng.choice(["before", "after", "replace"]), start, stop, f"<{position}>"))
+        assert render(TokenRewriter, program) == render(TokenStreamRewriter, program), program
+
+def test_growth_exponent_fit():
+    from bench.scaling import growth_exponent
+
+    assert growth_exponent([1, 2, 4], [3.0, 6.0, 12.0]) == pytest.approx(1.0)
+    assert growth_exponent([1, 2, 4], [1.0, 4.0, 16.0]) == pytest.approx(2.0)
+
+def test_pipeline_scaling():
+    from bench import scaling
+
+    # Quarter sizes by default; JAVA_FORMAT_SCALING=1 runs the full ones
+    scale = 1 if os.environ.get("JAVA_FORMAT_SCALING") else 0.25
+    max_exponent = float(os.environ.get("JAVA_FORMAT_MAX_EXPONENT", scaling.DEFAULT_MAX_EXPONENT))
+    results = scaling.check(max_exponent=max_exponent, scale=scale)
+    failed = {result["stage"]: result["exponent"] for result in results if not result["passed"]}
+
+    assert not failed, f"Stages scaling worse than their bound: {failed}"
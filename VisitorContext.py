@@ -0,0 +1,90 @@
+from JavaParser import JavaParser
+from JavaParserVisitor import JavaParserVisitor
+
+
+class VisitorContext:
+    """
+    Where a visitor currently is in the tree, kept up to date as it descends
+    so passes can ask about their ancestors without walking parentCtx.
+    """
+
+    SWITCH = 0
+    FINALLY = 1
+    LAMBDA = 2
+    ANONYMOUS_CLASS = 3
+    NESTING = 4
+    METHOD = 5
+
+    KINDS = {
+        JavaParser.SwitchBlockStatementGroupContext: SWITCH,
+        JavaParser.FinallyBlockContext: FINALLY,
+        JavaParser.LambdaExpressionContext: LAMBDA,
+        JavaParser.BlockContext: NESTING,
+        JavaParser.ClassBodyContext: NESTING,
+        JavaParser.MethodDeclarationContext: METHOD,
+    }
+
+    def __init__(self):
+        self.counts = [0] * 5
+        self.methods = []
+
+    def enter(self, node):
+        """Track the node if it matters, return the kind to pass to exit."""
+        kind = self.KINDS.get(type(node))
+        if kind is None:
+            return None
+
+        if kind == self.METHOD:
+            self.methods.append(node)
+            return kind
+
+        if kind == self.NESTING and isinstance(node.parentCtx, JavaParser.ClassCreatorRestContext):
+            kind = self.ANONYMOUS_CLASS
+        self.counts[kind] += 1
+        return kind
+
+    def exit(self, kind):
+        if kind == self.METHOD:
+            self.methods.pop()
+        else:
+            self.counts[kind] -= 1
+
+    @property
+    def in_switch(self):
+        return self.counts[self.SWITCH] > 0
+
+    @property
+    def in_finally(self):
+        return self.counts[self.FINALLY] > 0
+
+    @property
+    def in_lambda(self):
+        return self.counts[self.LAMBDA] > 0
+
+    @property
+    def in_anonymous_class(self):
+        return self.counts[self.ANONYMOUS_CLASS] > 0
+
+    @property
+    def depth(self):
+        """Number of enclosing blocks and class bodies."""
+        return self.counts[self.NESTING] + self.counts[self.ANONYMOUS_CLASS]
+
+    @property
+    def method(self):
+        """Innermost enclosing method declaration, or None."""
+        return self.methods[-1] if self.methods else None
+
+
+class ContextTrackingVisitor(JavaParserVisitor):
+    """Visitor that maintains a VisitorContext while it visits children."""
+
+    def __init__(self):
+        self.context = VisitorContext()
+
+    def visitChildren(self, node):
+        kind = self.context.enter(node)
+        result = super().visitChildren(node)
+        if kind is not None:
+            self.context.exit(kind)
+        return result
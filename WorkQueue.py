@@ -0,0 +1,208 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    result TEXT
+)
+"""
+
+# The directory the paths of jobs are relative to, recorded by the first add
+META_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+)
+"""
+
+# pending -> leased -> done, or back to leased by another worker once the
+# lease expired, or failed after max_attempts leases that all expired
+STATUSES = ("pending", "leased", "done", "failed")
+
+
+class WorkQueue:
+    """
+    A queue of files to format kept in a SQLite database, which several
+    workers, on one machine or several sharing the file, pull from.
+
+    A worker leases one file at a time for lease_seconds and must renew the
+    lease with heartbeat while it works. If it dies the lease runs out and
+    the file goes to the next worker that asks, up to max_attempts times,
+    after which the file is failed. Files are handed out largest first.
+
+    Paths are kept relative to a root directory stored in the database, so
+    workers started in any directory find the files through resolve.
+
+    Every call uses its own short connection, so a queue can be shared by
+    threads. The database needs a filesystem whose locks work (local disks
+    do, some network filesystems do not).
+    """
+
+    def __init__(self, db_path, lease_seconds=60.0, max_attempts=3, clock=time.time):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Wall time, as it is compared across machines
+        self.clock = clock
+        with self._transaction() as db:
+            db.execute(SCHEMA)
+            db.execute(META_SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        with closing(sqlite3.connect(self.db_path, timeout=30, isolation_level=None)) as db:
+            # Take the write lock up front, so two workers never lease the same file
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def add(self, paths, root=None):
+        """
+        Queue files not queued yet, returning how many were added. Relative
+        paths are stored relative to the queue's root, which the first add
+        records: root, or else the current directory.
+        """
+        with self._transaction() as db:
+            db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('root', ?)",
+                       (os.path.abspath(root or os.getcwd()),))
+            queue_root = self._root(db)
+            rows = []
+            for path in paths:
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    # Queued anyway, its worker reports it as failed
+                    size = 0
+                if not os.path.isabs(path):
+                    path = os.path.relpath(os.path.abspath(path), queue_root)
+                rows.append((path, size))
+            before = db.total_changes
+            db.executemany("INSERT OR IGNORE INTO jobs (path, size) VALUES (?, ?)", rows)
+            return db.total_changes - before
+
+    @staticmethod
+    def _root(db):
+        row = db.execute("SELECT value FROM meta WHERE key = 'root'").fetchone()
+        return row[0] if row is not None else None
+
+    def resolve(self, path):
+        """Where the file of a queued path is, from this process."""
+        with self._transaction() as db:
+            root = self._root(db)
+        return os.path.join(root, path) if root is not None else path
+
+    def lease(self, worker):
+        """The queued path of the next file for worker, or None when none is free now."""
+        now = self.clock()
+        with self._transaction() as db:
+            while True:
+                row = db.execute(
+                    "SELECT path, attempts FROM jobs"
+                    " WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?)"
+                    " ORDER BY size DESC, path LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    return None
+                path, attempts = row
+                if attempts < self.max_attempts:
+                    db.execute(
+                        "UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1"
+                        " WHERE path = ?",
+                        (worker, now + self.lease_seconds, path),
+                    )
+                    return path
+
+                root = self._root(db)
+                result = {"path": os.path.join(root, path) if root is not None else path, "status": "failed",
+                          "reason": f"lease expired {attempts} times, the workers may have died"}
+                db.execute("UPDATE jobs SET status = 'failed', worker = NULL, result = ? WHERE path = ?",
+                           (json.dumps(result), path))
+
+    def heartbeat(self, worker, path):
+        """Renew worker's lease on path. False when the lease was lost to another worker."""
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE path = ? AND worker = ? AND status = 'leased'",
+                (self.clock() + self.lease_seconds, path, worker),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, worker, path, result):
+        """Store worker's result for path. False (and nothing stored) when the lease was lost."""
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET status = 'done', result = ?, lease_expires = NULL"
+                " WHERE path = ? AND worker = ? AND status = 'leased'",
+                (json.dumps(result), path, worker),
+            )
+            return cursor.rowcount == 1
+
+    def counts(self):
+        with self._transaction() as db:
+            counts = dict(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+        return {status: counts.get(status, 0) for status in STATUSES}
+
+    def results(self):
+        """The results of the finished files, by path."""
+        with self._transaction() as db:
+            rows = db.execute("SELECT result FROM jobs WHERE result IS NOT NULL ORDER BY path").fetchall()
+        return [json.loads(result) for result, in rows]
+
+
+class _Heartbeat:
+    """Renews a lease every interval seconds on a thread while a file is worked on."""
+
+    def __init__(self, queue, worker, path, interval):
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(queue, worker, path, interval), daemon=True)
+
+    def _run(self, queue, worker, path, interval):
+        while not self.stopped.wait(interval):
+            if not queue.heartbeat(worker, path):
+                return
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+
+def run_worker(queue, worker, process, idle_seconds=1.0):
+    """
+    Lease files from queue and store process(file)'s result for each, file
+    being the leased path resolved against the queue's root, until no file
+    is pending or leased by anyone. While files are only leased by others
+    the worker waits, in case their leases run out. Returns this worker's
+    results.
+    """
+    results = []
+    while True:
+        path = queue.lease(worker)
+        if path is None:
+            if not queue.counts()["leased"]:
+                return results
+            time.sleep(idle_seconds)
+            continue
+
+        with _Heartbeat(queue, worker, path, queue.lease_seconds / 3):
+            result = process(queue.resolve(path))
+        if queue.complete(worker, path, result):
+            results.append(result)
@@ -0,0 +1,138 @@
+"""
+Deterministic synthetic Java sources for benchmarking.
+
+Every generator takes a size and a seed and always returns the same text
+for the same arguments, so runs on different machines or commits can be
+compared. Line comments are avoided on purpose: the pipeline joins the
+file into one line before parsing.
+"""
+import random
+
+TYPES = ["int", "long", "String", "double", "boolean"]
+VALUES = {"int": "1", "long": "2L", "String": '"text"', "double": "3.0", "boolean": "true"}
+BAD_NAME_PARTS = ["my", "Data", "value", "HTTP", "count", "Item", "tmp", "Result"]
+
+
+def _method(rng, name, statements, indent="    "):
+    lines = [f"{indent}public int {name}(int a, int b) {{"]
+    for i in range(statements):
+        kind = rng.randrange(4)
+        if kind == 0:
+            lines.append(f"{indent}    int v{i} = a * {i} + b - {rng.randrange(100)};")
+        elif kind == 1:
+            lines.append(f"{indent}    if (a > {i}) {{ b = b + a; }} else {{ b = b - 1; }}")
+        elif kind == 2:
+            lines.append(f"{indent}    for (int i{i} = 0; i{i} < b; i{i}++) {{ a += i{i}; }}")
+        else:
+            lines.append(f'{indent}    System.out.println("step {i}" + a + b);')
+    lines.append(f"{indent}    return a + b;")
+    lines.append(f"{indent}}}")
+    return lines
+
+
+def many_small_classes(size, seed=0):
+    """size small classes with a couple of fields and methods each."""
+    rng = random.Random(seed)
+    lines = []
+    for c in range(size):
+        lines.append(f"class Small{c} {{")
+        for f in range(3):
+            field_type = rng.choice(TYPES)
+            lines.append(f"    private {field_type} field{f} = {VALUES[field_type]};")
+        for m in range(2):
+            lines.extend(_method(rng, f"method{m}", 3))
+        lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def large_class(size, seed=0):
+    """One class of roughly size lines."""
+    rng = random.Random(seed)
+    lines = ["public class Large {"]
+    method = 0
+    while len(lines) < size - 1:
+        lines.extend(_method(rng, f"method{method}", 8))
+        method += 1
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def deep_nesting(size, seed=0):
+    """A method with size nested if blocks."""
+    lines = ["public class Deep {", "    public void run(int x) {"]
+    for level in range(size):
+        lines.append("    " * (level + 2) + f"if (x > {level}) {{")
+    lines.append("    " * (size + 2) + "x = x + 1;")
+    for level in reversed(range(size)):
+        lines.append("    " * (level + 2) + "}")
+    lines.extend(["    }", "}"])
+    return "\n".join(lines) + "\n"
+
+
+def long_argument_lists(size, seed=0):
+    """size calls and declarations with long argument lists."""
+    rng = random.Random(seed)
+    parameters = ", ".join(f"int p{i}" for i in range(12))
+    lines = ["public class Calls {", f"    public void target({parameters}) {{ }}", "    public void run() {"]
+    for call in range(size):
+        arguments = ", ".join(str(rng.randrange(1000)) for _ in range(12))
+        lines.append(f"        target({arguments});")
+    lines.extend(["    }", "}"])
+    return "\n".join(lines) + "\n"
+
+
+def huge_imports(size, seed=0):
+    """size shuffled import declarations in front of a small class."""
+    rng = random.Random(seed)
+    imports = [f"import com.example.package{i % 50}.Type{i};" for i in range(size)]
+    rng.shuffle(imports)
+    return "\n".join(imports) + "\npublic class Imports {\n    private int value = 0;\n}\n"
+
+
+def bad_identifiers(size, seed=0):
+    """size members whose names break every naming convention."""
+    rng = random.Random(seed)
+
+    def bad_name():
+        return "_".join(rng.choice(BAD_NAME_PARTS) for _ in range(3))
+
+    lines = ["public class bad_names_class {"]
+    for i in range(size):
+        lines.append(f"    private static final int {bad_name().lower()}{i} = {i};")
+        lines.append(f"    public void {bad_name()}{i}(int {bad_name()}{i}) {{ int {bad_name()}_{i} = {i}; }}")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+CASES = {
+    "many_small_classes": many_small_classes,
+    "large_class": large_class,
+    "deep_nesting": deep_nesting,
+    "long_argument_lists": long_argument_lists,
+    "huge_imports": huge_imports,
+    "bad_identifiers": bad_identifiers,
+}
+
+# Sizes per case for each preset, the 'full' preset includes the 50k-line class
+PRESETS = {
+    "quick": {
+        "many_small_classes": [10, 40],
+        "large_class": [500, 2000],
+        "deep_nesting": [5, 10],
+        "long_argument_lists": [20, 80],
+        "huge_imports": [100, 400],
+        "bad_identifiers": [10, 40],
+    },
+    "full": {
+        "many_small_classes": [100, 400, 1600],
+        "large_class": [5000, 20000, 50000],
+        "deep_nesting": [10, 20, 40],
+        "long_argument_lists": [200, 800, 3200],
+        "huge_imports": [1000, 4000, 16000],
+        "bad_identifiers": [100, 400, 1600],
+    },
+}
+
+
+def generate(case, size, seed=0):
+    return CASES[case](size, seed)
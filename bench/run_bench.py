@@ -0,0 +1,131 @@
+"""
+Throughput benchmark for the formatting pipeline.
+
+Generates the synthetic corpora from bench.corpus, runs parsing,
+formatting, error logging and name fixing over each of them and prints
+one JSON document with lines/sec, tokens/sec and peak RSS per case.
+
+    python -m bench.run_bench --preset quick --output bench_output.txt
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+import testmain
+from ErrorLogger import ErrorLogger
+from NameConventionFormatterVisitor import NameConventionFormatterVisitor
+from bench import corpus
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".java-format.json")
+
+
+def _peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _timed(stages, name, function, *args):
+    start = time.perf_counter()
+    # The naming pass prints every identifier it checks
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args)
+    stages[name] = time.perf_counter() - start
+    return result
+
+
+def run_case(case, size, config_path, seed=0, memory=False):
+    """Run every stage over one generated file and return its measurements."""
+    source = corpus.generate(case, size, seed)
+    configs = testmain.load_config(config_path)
+    stages = {}
+    result = {
+        "case": case,
+        "size": size,
+        "lines": source.count("\n"),
+        "bytes": len(source.encode()),
+    }
+
+    fd, path = tempfile.mkstemp(suffix=".java")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(source)
+
+        tree, tokens, _ = _timed(stages, "parse", testmain.parse_java_code, path)
+        result["tokens"] = len(tokens.tokens)
+        _timed(stages, "format", testmain.format_code, tree, tokens, configs)
+        _timed(stages, "error_logger", ErrorLogger(configs).find_errors, tree)
+        _timed(stages, "naming", NameConventionFormatterVisitor(tokens, configs).get_formatted_code, tree)
+        if memory:
+            # Separate run, tracemalloc slows everything down too much to time alongside
+            result["memory"] = testmain.profile_memory(path, configs)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        os.remove(path)
+
+    result["stages"] = {
+        name: {
+            "seconds": round(seconds, 6),
+            "lines_per_sec": round(result["lines"] / seconds, 1) if seconds else None,
+            "tokens_per_sec": round(result.get("tokens", 0) / seconds, 1) if seconds else None,
+        }
+        for name, seconds in stages.items()
+    }
+    result["peak_rss_kb"] = _peak_rss_kb()
+    return result
+
+
+def run_isolated(case, size, config_path, seed=0, memory=False):
+    """Run one case in a fresh process so its peak RSS is its own."""
+    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(run_case, (case, size, config_path, seed, memory))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Java formatting pipeline")
+    parser.add_argument("--preset", choices=sorted(corpus.PRESETS), default="quick")
+    parser.add_argument("--case", action="append", choices=sorted(corpus.CASES), help="Only run these cases")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="Config file path")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--in-process", action="store_true", help="Do not isolate cases in child processes")
+    parser.add_argument("--output", default=None, help="Write the JSON report here instead of stdout")
+    parser.add_argument("--memory", action="store_true", help="Add a per-stage tracemalloc report to every case")
+    args = parser.parse_args(argv)
+
+    runner = run_case if args.in_process else run_isolated
+    results = []
+    for case, sizes in corpus.PRESETS[args.preset].items():
+        if args.case and case not in args.case:
+            continue
+        for size in sizes:
+            results.append(runner(case, size, args.config, args.seed, args.memory))
+            print(f"{case} size={size} done", file=sys.stderr)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "preset": args.preset,
+        "seed": args.seed,
+        "results": results,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
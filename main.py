@@ -2,13 +2,19 @@ from antlr4 import *
 from JavaLexer import JavaLexer
 from JavaParser import JavaParser 
 from JavaParserVisitor import JavaParserVisitor
+from OutputSink import OutputSink
+from ParserContext import parser_pool
 import json
 
 class JavaFormatter(JavaParserVisitor):
-    def __init__(self, config):
+    def __init__(self, config, output=None):
         self.config = config
         self.indent_level = 0
-        self.formatted_code = ""
+        self.output = output if output is not None else OutputSink()
+
+    @property
+    def formatted_code(self):
+        return self.output.getvalue()
 
     def get_indent(self):
         return " " * (self.indent_level * self.config.get("indent_size", 4))
@@ -27,18 +33,18 @@ class JavaFormatter(JavaParserVisitor):
                 modifiers = self.sort_modifiers(modifiers, self.config.get("class_modifier_order", []))
 
         class_signature = f"{' '.join(modifiers)} class {class_name}".strip()
-        self.formatted_code += self.get_indent() + class_signature 
+        self.output.write(self.get_indent() + class_signature)
         
         # Brace placement based on config
         if self.config.get("brace_style", "attach") == "attach":
-            self.formatted_code += " {\n"
+            self.output.write(" {\n")
         else:
-            self.formatted_code += "\n" + self.get_indent() + "{\n"
+            self.output.write("\n" + self.get_indent() + "{\n")
         
         self.indent_level += 1
         self.visitChildren(ctx)
         self.indent_level -= 1
-        self.formatted_code += self.get_indent() + "}\n"
+        self.output.write(self.get_indent() + "}\n")
 
     def visitMethodDeclaration(self, ctx):
         return_type = ctx.typeTypeOrVoid().getText()
@@ -54,16 +60,16 @@ class JavaFormatter(JavaParserVisitor):
 
         param_list = ctx.formalParameters().getText()
         method_signature = f"{' '.join(modifiers)} {return_type} {method_name}{param_list}".strip()
-        self.formatted_code += self.get_indent() + method_signature
+        self.output.write(self.get_indent() + method_signature)
         if self.config.get("brace_style", "attach") == "attach":
-            self.formatted_code += " {\n"
+            self.output.write(" {\n")
         else:
-            self.formatted_code += "\n" + self.get_indent() + "{\n"
+            self.output.write("\n" + self.get_indent() + "{\n")
         
         self.indent_level += 1
         self.visitChildren(ctx)
         self.indent_level -= 1
-        self.formatted_code += self.get_indent() + "}\n"
+        self.output.write(self.get_indent() + "}\n")
 
     def sort_modifiers(self, modifiers, order):
         if not order:
@@ -71,25 +77,25 @@ class JavaFormatter(JavaParserVisitor):
         return sorted(modifiers, key=lambda x: order.index(x) if x in order else len(order))
 
     def getFormattedCode(self):
-        return self.formatted_code.strip()
+        return self.output.getvalue().strip()
 
 
     def visitBlock(self, ctx):
         if len(ctx.blockStatement()) > 1:
-            self.formatted_code += self.get_indent() + "{\n"
+            self.output.write(self.get_indent() + "{\n")
             self.indent_level += 1
         
         self.visitChildren(ctx)
         
         if len(ctx.blockStatement()) > 1:
             self.indent_level -= 1
-            self.formatted_code += self.get_indent() + "}\n"
+            self.output.write(self.get_indent() + "}\n")
 
     def visitStatement(self, ctx):
         statement = ctx.getText()
         if not statement.endswith(";"):
             statement += ";"
-        self.formatted_code += self.get_indent() + statement + "\n"
+        self.output.write(self.get_indent() + statement + "\n")
 
 
 def load_config(config_path):
@@ -99,14 +105,22 @@ def load_config(config_path):
     except Exception:
         return {}  # Default empty config
 
-def format_java_code(java_code, config):
-    lexer = JavaLexer(InputStream(java_code))
-    tokens = CommonTokenStream(lexer)
-    parser = JavaParser(tokens)
-    tree = parser.compilationUnit()
-
-    formatter = JavaFormatter(config)
+def format_java_code(java_code, config, output=None):
+    """
+    Format java_code. Returns the stripped text, or None when output is
+    given: the text is then written to output as the nodes are visited,
+    and output is closed. Give output strip=True for the same text the
+    return value would have.
+    """
+    with parser_pool.context() as context:
+        tree, _ = context.parse(java_code)
+
+    formatter = JavaFormatter(config, output)
     formatter.visit(tree)
+
+    if output is not None:
+        output.close()
+        return None
     return formatter.getFormattedCode()
 
 
@@ -116,6 +130,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Java Code Formatter")
     parser.add_argument("input_file", type=str, help="Java file to format")
     parser.add_argument("--config", type=str, default="java-format.json", help="Config file path")
+    parser.add_argument("--output", type=str, default=None, help="Stream the result to this file ('-' for stdout)")
     
     args = parser.parse_args()
 
@@ -124,6 +139,13 @@ if __name__ == "__main__":
     with open(args.input_file, "r") as f:
         java_code = f.read()
 
-    formatted_code = format_java_code(java_code, config)
-    print(formatted_code)
+    if args.output is None:
+        formatted_code = format_java_code(java_code, config)
+        print(formatted_code)
+    elif args.output == "-":
+        format_java_code(java_code, config, OutputSink.to_stdout(strip=True))
+        # The newline print() ends the buffered output with
+        print()
+    else:
+        format_java_code(java_code, config, OutputSink.to_file(args.output, strip=True))
 
@@ -4,50 +4,126 @@ from JavaParser import JavaParser
 from FormattingVisitor import FormattingVisitor
 from AlignmentVisitor import AlignmentVisitor
 from ErrorLogger import ErrorLogger
-from ConfigClass import ConfigClass
+from ConfigClass import ConfigClass, ConfigError
+from ConfigResolver import ConfigResolver
+from MemoryProfiler import MemoryProfiler, NULL_PROFILER
+from FormatBudget import FormatBudget, BudgetExceeded
+from ParserContext import parser_pool
+from RewriteRenderer import iter_text
+from GitDiff import GitError, changed_files, changed_lines, repo_root
+from FileWatcher import PollingWatcher
+from Sharding import ShardError, parse_shard, plan_key, shard_files
+from BatchScheduler import CostCache, run_scheduled
+from WorkQueue import WorkQueue, run_worker
+import argparse
+import json
+import os
+import socket
 import re
+import sys
 
 from FileHandler import FileHandler 
 
+config_resolver = ConfigResolver()
+
+WHITESPACE = re.compile(r'\s+')
+
 def load_config(config_path):
     config = ConfigClass(config_path)
     return config
 
-def parse_java_code(file_path):
+def resolve_config(java_file_path):
+    # Nearest .java-format.json walking up from the file, memoized per directory
+    return config_resolver.resolve(java_file_path)
+
+def read_java_code(file_path):
     # Use FileHandler to safely read the Java file
     file_handler = FileHandler(file_path)
     code = file_handler.read()
     
     if code is None:
         raise FileNotFoundError(f"Could not read Java file: {file_path}")
-    
+    return code
+
+def parse_java_code(file_path, profiler=NULL_PROFILER, budget=None):
+    return parse_java_source(read_java_code(file_path), profiler, budget)
+
+def clean_java_source(code):
+    """The single-line text the formatter parses: no tabs or newlines, no runs of spaces."""
     cleaned_code = re.sub(r'[\t\n]+', '', code)  # Remove tabs and newlines
     cleaned_code = re.sub(r' {2,}', ' ', cleaned_code)
     cleaned_code = re.sub(r'^ +', '', cleaned_code, flags=re.M)
+    return cleaned_code
 
-    code = cleaned_code
+def parse_java_source(code, profiler=NULL_PROFILER, budget=None, errors=None):
+    code = clean_java_source(code)
 
-    lexer = JavaLexer(InputStream(code))
-    tokens = CommonTokenStream(lexer)
-    parser = JavaParser(tokens)
-    tree = parser.compilationUnit()
+    with parser_pool.context() as context:
+        tree, tokens = context.parse(code, profiler, budget, errors=errors)
 
     return tree, tokens, code  # Return original code as well
 
-def format_code(tree, tokens, configs):
+def format_code(tree, tokens, configs, profiler=NULL_PROFILER, budget=None, errors=None):
     formatter = FormattingVisitor(tokens, configs)
-    first_code_pass = formatter.get_formatted_code(tree)
+    first_code_pass = formatter.get_formatted_code(tree, profiler)
     
-    lexer = JavaLexer(InputStream(first_code_pass))
-    tokens = CommonTokenStream(lexer)
-    parser = JavaParser(tokens)
-    tree = parser.compilationUnit()
+    if budget is not None:
+        budget.check_time()
+    with parser_pool.context() as context:
+        tree, tokens = context.parse(first_code_pass, profiler, budget, stage_prefix="re", errors=errors)
 
     aligner = AlignmentVisitor(tokens, configs)
-    second_code_pass = aligner.get_formatted_code(tree)
+    second_code_pass = aligner.get_formatted_code(tree, profiler)
 
     return second_code_pass
 
+def check_code(code, configs, budget=None, result=None):
+    """
+    True if formatting code would give it back unchanged. The first pass is
+    rendered piece by piece and compared up to whitespace, stopping at the
+    first difference; the alignment pass only adds whitespace (or splits
+    string literals, which cannot match then), so it only runs when the
+    first pass still matches. The token count goes to result's "tokens"
+    when a result is given.
+    """
+    tree, tokens, _ = parse_java_source(code, budget=budget)
+    if result is not None:
+        result["tokens"] = len(tokens.tokens)
+    formatter = FormattingVisitor(tokens, configs)
+    formatter.rewrite(tree)
+
+    visible = WHITESPACE.sub("", code)
+    position = 0
+    pieces = []
+    for piece in iter_text(formatter.rewriter):
+        visible_piece = WHITESPACE.sub("", piece)
+        if not visible.startswith(visible_piece, position):
+            return False
+        position += len(visible_piece)
+        pieces.append(piece)
+    if position != len(visible):
+        return False
+
+    if budget is not None:
+        budget.check_time()
+    with parser_pool.context() as context:
+        tree, tokens = context.parse("".join(pieces), budget=budget, stage_prefix="re")
+
+    aligner = AlignmentVisitor(tokens, configs)
+    return aligner.get_formatted_code(tree) == code
+
+def profile_memory(java_file_path, configs, top=0):
+    """Format a file with tracemalloc on and return the per-stage memory report."""
+    profiler = MemoryProfiler(top)
+    try:
+        tree, tokens, _ = parse_java_code(java_file_path, profiler)
+        profiler.count_tokens(tokens)
+        profiler.count_nodes(tree)
+        format_code(tree, tokens, configs, profiler)
+        return profiler.report()
+    finally:
+        profiler.stop()
+
 def save_formatted_code(file_path, formatted_code):
     file_handler = FileHandler(file_path)
     
@@ -60,33 +136,442 @@ def save_formatted_code(file_path, formatted_code):
     
     return True
 
-def main(java_file_path, config_path=".java-format.json"):
+def _run_guarded(java_file_path, config_path, budget, action):
+    """
+    Resolve the config and run action(java_file_path, configs, budget, result)
+    under the file's budget. Returns a result dict whose status is set by the
+    action, or "failed"/"skipped" (the file went over its budget).
+    """
+    budget = budget or FormatBudget()
+    result = {"path": java_file_path, "status": "failed"}
     try:
-        configs = load_config(config_path)
+        if config_path is None:
+            configs = resolve_config(java_file_path)
+        else:
+            configs = load_config(config_path)
         if configs is None:
-            return False
+            return result
         
-        tree, tokens, _ = parse_java_code(java_file_path)
+        action(java_file_path, configs, budget, result)
+        return result
+    
+    except BudgetExceeded as e:
+        print(f"Skipped {java_file_path}: budget exceeded, {str(e)}")
+        result.update(status="skipped", reason=f"budget exceeded: {str(e)}", limit=e.limit)
+        return result
+
+    except ConfigError as e:
+        print(f"Config error: {str(e)}")
+        result["reason"] = f"config error: {str(e)}"
+        return result
+
+    except Exception as e:
+        print(f"An error occurred during formatting: {str(e)}")
+        result["reason"] = f"{type(e).__name__}: {str(e)}"
+        return result
+
+def _format_file(java_file_path, configs, budget, result):
+    with budget.running():
+        code = read_java_code(java_file_path)
+        tree, tokens, _ = parse_java_source(code, budget=budget)
         
         errorvisitor = ErrorLogger(configs)
         errors = errorvisitor.find_errors(tree)
+        result.update(diagnostics=errors, tokens=len(tokens.tokens))
         if errors:
             for error in errors:
                 print(error)
         
-        formatted_code = format_code(tree, tokens, configs)
-        
-        success = save_formatted_code(java_file_path, formatted_code)
-        
-        if success:
-            print(f"Successfully formatted {java_file_path}")
-            print(formatted_code)
-        
-        return success
+        budget.check_time()
+        formatted_code = format_code(tree, tokens, configs, budget=budget)
     
-    except Exception as e:
-        print(f"An error occurred during formatting: {str(e)}")
-        return False
+    success = save_formatted_code(java_file_path, formatted_code)
+    
+    if success:
+        result.update(status="formatted", changed=formatted_code != code)
+        print(f"Successfully formatted {java_file_path}")
+        print(formatted_code)
+
+def _check_file(java_file_path, configs, budget, result):
+    with budget.running():
+        unchanged = check_code(read_java_code(java_file_path), configs, budget, result)
+
+    if unchanged:
+        result["status"] = "unchanged"
+    else:
+        result.update(status="changed", reason="would reformat")
+        print(f"Would reformat {java_file_path}")
+
+def _format_lines(line_ranges):
+    """Action reformatting only the members and statements covering line_ranges."""
+    def action(java_file_path, configs, budget, result):
+        # FormatAPI builds on this module
+        from FormatAPI import format_range
+
+        code = read_java_code(java_file_path)
+        formatted_code = code
+        # Bottom up, so reformatting a range keeps the line numbers of those above it
+        for start, end in sorted(line_ranges, reverse=True):
+            outcome = format_range(formatted_code, start, end, configs, budget)
+            for error in outcome.diagnostics:
+                print(error)
+            if outcome.skipped == "syntax errors":
+                result["reason"] = "syntax errors"
+                return
+            if outcome.skipped and outcome.skipped.startswith("budget exceeded"):
+                limit = outcome.skipped.removeprefix("budget exceeded: ").split()[0]
+                result.update(status="skipped", reason=outcome.skipped, limit=limit)
+                return
+            formatted_code = outcome.text
+
+        if formatted_code == code:
+            result["status"] = "unchanged"
+        elif save_formatted_code(java_file_path, formatted_code):
+            result["status"] = "formatted"
+            print(f"Successfully formatted lines of {java_file_path}")
+
+    return action
+
+def _format_split(jobs):
+    """Action formatting a single large class split by member over jobs processes."""
+    def action(java_file_path, configs, budget, result):
+        # SplitFormatter builds on this module
+        from SplitFormatter import format_split
+
+        code = read_java_code(java_file_path)
+        outcome = format_split(code, configs, budget, jobs)
+        result["diagnostics"] = outcome.diagnostics
+        for error in outcome.diagnostics:
+            print(error)
+        if outcome.skipped == "syntax errors":
+            result["reason"] = "syntax errors"
+            return
+        if outcome.skipped is not None:
+            limit = outcome.skipped.removeprefix("budget exceeded: ").split()[0]
+            result.update(status="skipped", reason=outcome.skipped, limit=limit)
+            return
+
+        if save_formatted_code(java_file_path, outcome.text):
+            result.update(status="formatted", changed=outcome.text != code)
+            print(f"Successfully formatted {java_file_path}")
+
+    return action
+
+def run_file(java_file_path, config_path=None, budget=None):
+    """Check and format one file in place, see _run_guarded for the result."""
+    return _run_guarded(java_file_path, config_path, budget, _format_file)
+
+def check_file(java_file_path, config_path=None, budget=None):
+    """Tell whether formatting would change a file ("unchanged"/"changed"), never writing it."""
+    return _run_guarded(java_file_path, config_path, budget, _check_file)
+
+def run_file_lines(java_file_path, line_ranges, config_path=None, budget=None):
+    """
+    Format in place only the members and statements covering line_ranges,
+    [(start, end), ...] 1-based and inclusive, leaving the other lines as
+    they are. The status is "unchanged" when nothing needed formatting.
+    """
+    return _run_guarded(java_file_path, config_path, budget, _format_lines(line_ranges))
+
+def run_file_split(java_file_path, jobs, config_path=None, budget=None):
+    """
+    Format one file in place with its class's members split over jobs
+    processes, for files too large for one core. budget applies to each
+    run of members.
+    """
+    return _run_guarded(java_file_path, config_path, budget, _format_split(jobs))
+
+def main(java_file_path, config_path=None, budget=None):
+    return run_file(java_file_path, config_path, budget)["status"] == "formatted"
+
+def _run_all(function, calls, jobs=1, cost_cache=None):
+    """
+    function(*args) for every args of calls, whose first item is the file's
+    path, and the summary of the results. With several jobs the files run
+    over a process pool, largest first by the cost_cache's token counts or
+    else by size, and the summary gets the per-worker utilization.
+    """
+    if jobs <= 1 or len(calls) <= 1:
+        results = [function(*args) for args in calls]
+        utilization = None
+    else:
+        cost_cache = cost_cache or CostCache()
+        results, utilization = run_scheduled(function, calls, [cost_cache.cost(args[0]) for args in calls], jobs)
+
+    summary = summarize(results)
+    if utilization is not None:
+        summary["utilization"] = utilization
+    return results, summary
+
+def run_files(java_file_paths, config_path=None, budget=None, jobs=1, cost_cache=None, split_jobs=1):
+    if split_jobs > 1:
+        # One file at a time, each over the split_jobs processes
+        calls = [(path, split_jobs, config_path, budget) for path in java_file_paths]
+        results, summary = _run_all(run_file_split, calls)
+    else:
+        results, summary = _run_all(run_file, [(path, config_path, budget) for path in java_file_paths], jobs, cost_cache)
+    if cost_cache is not None:
+        cost_cache.update(results)
+    return results, summary
+
+def check_files(java_file_paths, config_path=None, budget=None, jobs=1, cost_cache=None):
+    results, summary = _run_all(check_file, [(path, config_path, budget) for path in java_file_paths], jobs, cost_cache)
+    if cost_cache is not None:
+        cost_cache.update(results)
+    return results, summary
+
+def run_changed(base="HEAD", repo=".", config_path=None, budget=None, jobs=1, lines_only=False, shard=None):
+    """
+    Format the .java files of a git working tree that differ from base, or
+    with lines_only only their changed lines, so the cost follows the size
+    of the change rather than of the repository. shard is an optional
+    (index, count) to handle only part of the files.
+    """
+    if not lines_only:
+        files = changed_files(base, repo)
+        if shard is not None:
+            files = shard_files(files, *shard, root=repo_root(repo))
+        return run_files(files, config_path, budget, jobs)
+
+    line_ranges = {path: ranges for path, ranges in changed_lines(base, repo).items() if ranges}
+    if shard is not None:
+        mine = shard_files(list(line_ranges), *shard, root=repo_root(repo))
+        line_ranges = {path: line_ranges[path] for path in mine}
+    calls = [(path, ranges, config_path, budget) for path, ranges in line_ranges.items()]
+    return _run_all(run_file_lines, calls, jobs)
+
+def watch(directory, config_path=None, budget=None, interval=0.5, debounce=0.3, should_stop=lambda: False):
+    """
+    Format the .java files under directory in place whenever they change,
+    until should_stop() returns true. Everything runs in this process, so
+    the parser and the resolved configs stay warm between saves; editing,
+    adding or removing a .java-format.json drops the resolved configs.
+    Changed files are formatted whole, see IncrementalDocument for why.
+    """
+    watcher = PollingWatcher(directory, interval, debounce, names=(ConfigResolver.CONFIG_FILE_NAME,))
+    print(f"Watching {directory} for changes to .java files")
+
+    def on_change(paths):
+        if any(os.path.basename(path) == ConfigResolver.CONFIG_FILE_NAME for path in paths):
+            config_resolver.clear()
+            print("Config changed, reloading it for the next changes")
+        java_paths = [path for path in paths if path.endswith(".java") and os.path.isfile(path)]
+        if java_paths:
+            results, summary = run_files(java_paths, config_path, budget)
+            print_summary(results, summary)
+
+    watcher.run(on_change, should_stop)
+
+def work_queue(db_path, config_path=None, budget=None, worker=None, lease_seconds=60.0):
+    """
+    Format files leased from the WorkQueue at db_path in place until it is
+    drained, storing every result in it. Returns this worker's results and
+    their summary.
+    """
+    queue = WorkQueue(db_path, lease_seconds)
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    results = run_worker(queue, worker, lambda path: run_file(path, config_path, budget))
+    return results, summarize(results)
+
+STATUSES = ("formatted", "unchanged", "changed", "failed", "skipped")
+
+def summarize(results):
+    summary = {"files": len(results), **dict.fromkeys(STATUSES, 0), "budget_exceeded": {}, "diagnostics": 0}
+    for result in results:
+        summary[result["status"]] += 1
+        summary["diagnostics"] += len(result.get("diagnostics", ()))
+        if result["status"] == "skipped":
+            limit = result["limit"]
+            summary["budget_exceeded"][limit] = summary["budget_exceeded"].get(limit, 0) + 1
+    return summary
+
+def print_summary(results, summary):
+    counts = ", ".join(f"{summary[status]} {status}" for status in STATUSES if summary[status])
+    diagnostics = f" ({summary['diagnostics']} naming diagnostics)" if summary.get("diagnostics") else ""
+    print(f"{summary['files']} files: {counts or 'nothing done'}{diagnostics}")
+    for result in results:
+        if result["status"] not in ("formatted", "unchanged"):
+            print(f"  {result['status']}: {result['path']} ({result.get('reason', 'not saved')})")
+    utilization = summary.get("utilization")
+    if utilization:
+        print(f"{len(utilization['workers'])} workers, {utilization['chunks']} chunks "
+              f"in {utilization['wall_seconds']:.2f}s:")
+        for worker in utilization["workers"]:
+            print(f"  worker {worker['worker']}: {worker['files']} files, "
+                  f"busy {worker['busy_seconds']:.2f}s ({worker['utilization']:.0%})")
+
+def changed_paths(results):
+    """Files that formatting changed (format runs) or would change (--check runs)."""
+    return [result["path"] for result in results if result["status"] == "changed" or result.get("changed")]
+
+def write_report(report_path, results, summary, shard=None, plan=None):
+    # plan is the Sharding.plan_key of the files the shards were split from
+    with open(report_path, "w", encoding="utf-8") as report:
+        json.dump({"shard": shard, "plan": plan, "results": results, "summary": summary}, report, indent=2)
+
+def merge_reports(report_paths):
+    """
+    Combine the reports of the shards of one run into results and a summary
+    over all of them, with a warning for every shard missing or repeated and
+    for files more than one shard handled (the shards did not see the same
+    files or sizes, e.g. ran one after the other in a checkout they were
+    formatting). Only the first result of such a file is kept.
+    """
+    results = {}
+    shards = []
+    plans = set()
+    for report_path in report_paths:
+        with open(report_path, encoding="utf-8") as report:
+            report = json.load(report)
+        for result in report["results"]:
+            if result["path"] in results:
+                print(f"Warning: {result['path']} is in several reports")
+                continue
+            results[result["path"]] = result
+        if report.get("shard"):
+            shards.append(tuple(report["shard"]))
+        if report.get("plan"):
+            plans.add(report["plan"])
+
+    if len(plans) > 1:
+        print("Warning: the shards were split from different files or sizes, some files may be in no report")
+    counts = {count for _, count in shards}
+    for count in counts:
+        indexes = sorted(index for index, shard_count in shards if shard_count == count)
+        missing = sorted(set(range(1, count + 1)) - set(indexes))
+        repeated = sorted({index for index in indexes if indexes.count(index) > 1})
+        if missing:
+            print(f"Warning: no report for shard(s) {', '.join(f'{index}/{count}' for index in missing)}")
+        if repeated:
+            print(f"Warning: several reports for shard(s) {', '.join(f'{index}/{count}' for index in repeated)}")
+    if len(counts) > 1:
+        print(f"Warning: reports come from runs split {' and '.join(map(str, sorted(counts)))} ways")
+
+    results = sorted(results.values(), key=lambda result: result["path"])
+    return results, summarize(results)
+
+def print_report(results, summary):
+    """print_summary, then the changed files and the diagnostics of every file."""
+    print_summary(results, summary)
+    changed = changed_paths(results)
+    if changed:
+        print(f"{len(changed)} changed:")
+        for path in changed:
+            print(f"  {path}")
+    for result in results:
+        for diagnostic in result.get("diagnostics", ()):
+            print(f"{result['path']}: {diagnostic}")
+
+def _optional_limit(convert):
+    # "none" lifts a limit
+    return lambda value: None if value.lower() == "none" else convert(value)
 
 if __name__ == "__main__":
-    main("test2.java")
+    parser = argparse.ArgumentParser(description="Format Java files in place")
+    parser.add_argument("files", nargs="*", default=["test2.java"], help="Java files to format")
+    parser.add_argument("--config", default=None, help="Config file path (default: nearest .java-format.json)")
+    parser.add_argument("--max-seconds", type=_optional_limit(float), default=FormatBudget.DEFAULT_SECONDS,
+                        help="Wall time budget per file, or 'none'")
+    parser.add_argument("--max-depth", type=_optional_limit(int), default=FormatBudget.DEFAULT_DEPTH,
+                        help="Parse tree depth budget per file, or 'none'")
+    parser.add_argument("--max-tokens", type=_optional_limit(int), default=FormatBudget.DEFAULT_TOKENS,
+                        help="Token budget per file, or 'none'")
+    parser.add_argument("--check", action="store_true",
+                        help="Only report files that formatting would change, exit 1 if there are any")
+    parser.add_argument("--git-base", default=None, metavar="BASE",
+                        help="Instead of the given files, take the .java files changed since BASE in this git working tree")
+    parser.add_argument("--changed-lines", action="store_true",
+                        help="With --git-base, only format the members and statements that cover changed lines")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of files formatted in parallel")
+    parser.add_argument("--split-jobs", type=int, default=1, metavar="N",
+                        help="Format each file's class split by member over N processes, for very large files")
+    parser.add_argument("--cost-cache", default=None, metavar="PATH",
+                        help="JSON file of token counts from earlier runs, to start the costliest files first")
+    parser.add_argument("--watch", default=None, metavar="DIR",
+                        help="Instead of the given files, keep formatting the .java files under DIR as they change")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Seconds between two scans in --watch mode")
+    parser.add_argument("--debounce", type=float, default=0.3,
+                        help="Seconds a file must stay unchanged before --watch formats it")
+    parser.add_argument("--shard", default=None, metavar="I/N",
+                        help="Only handle shard I of N. Files are split by size, the same way on every machine "
+                             "that sees the same files (run each shard on its own checkout)")
+    parser.add_argument("--report", default=None, metavar="PATH", help="Write the results and summary as JSON")
+    parser.add_argument("--merge-reports", nargs="+", default=None, metavar="REPORT",
+                        help="Combine the --report files of the shards of a run and print them")
+    parser.add_argument("--enqueue", default=None, metavar="DB",
+                        help="Add the files (or --git-base's) to the SQLite work queue DB instead of formatting them")
+    parser.add_argument("--worker", default=None, metavar="DB",
+                        help="Format files from the work queue DB until it is drained; run as many as wanted")
+    parser.add_argument("--queue-report", default=None, metavar="DB", help="Print the results stored in the work queue DB")
+    parser.add_argument("--lease-seconds", type=float, default=60.0,
+                        help="Seconds before a queued file whose worker stopped renewing it goes to another worker")
+    args = parser.parse_args()
+
+    if args.queue_report is not None:
+        queue = WorkQueue(args.queue_report)
+        results = queue.results()
+        summary = summarize(results)
+        print_report(results, summary)
+        print(", ".join(f"{count} {status}" for status, count in queue.counts().items()) + " in the queue")
+        if args.report is not None:
+            write_report(args.report, results, summary)
+        sys.exit(0)
+
+    if args.merge_reports is not None:
+        results, summary = merge_reports(args.merge_reports)
+        print_report(results, summary)
+        if args.report is not None:
+            write_report(args.report, results, summary)
+        sys.exit(1 if summary["changed"] or summary["failed"] or summary["skipped"] else 0)
+
+    try:
+        shard = parse_shard(args.shard) if args.shard is not None else None
+    except ShardError as e:
+        parser.error(str(e))
+
+    if args.changed_lines and (args.git_base is None or args.check):
+        parser.error("--changed-lines needs --git-base and cannot be combined with --check")
+    if args.split_jobs > 1 and (args.jobs > 1 or args.check or args.changed_lines):
+        parser.error("--split-jobs cannot be combined with --jobs, --check or --changed-lines")
+
+    budget = FormatBudget(args.max_seconds, args.max_depth, args.max_tokens)
+    if args.worker is not None:
+        results, summary = work_queue(args.worker, args.config, budget, lease_seconds=args.lease_seconds)
+        print_summary(results, summary)
+        sys.exit(1 if summary["failed"] or summary["skipped"] else 0)
+
+    if args.watch is not None:
+        try:
+            watch(args.watch, args.config, budget, args.poll_interval, args.debounce)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    try:
+        plan = None
+        if args.changed_lines:
+            results, summary = run_changed(args.git_base, ".", args.config, budget, args.jobs, lines_only=True,
+                                           shard=shard)
+        else:
+            files = args.files if args.git_base is None else changed_files(args.git_base)
+            if args.enqueue is not None:
+                print(f"Queued {WorkQueue(args.enqueue).add(files)} of {len(files)} files")
+                sys.exit(0)
+            if shard is not None:
+                plan = plan_key(files)
+                files = shard_files(files, *shard)
+            cost_cache = CostCache(args.cost_cache) if args.cost_cache is not None else None
+            if args.check:
+                results, summary = check_files(files, args.config, budget, args.jobs, cost_cache)
+            else:
+                results, summary = run_files(files, args.config, budget, args.jobs, cost_cache, args.split_jobs)
+            if cost_cache is not None:
+                cost_cache.save()
+    except GitError as e:
+        parser.error(f"git: {str(e)}")
+
+    print_summary(results, summary)
+    if args.report is not None:
+        write_report(args.report, results, summary, shard, plan)
+    if args.check:
+        sys.exit(1 if summary["changed"] or summary["failed"] or summary["skipped"] else 0)